@@ -0,0 +1,4 @@
+"""
+Offline benchmarks. Each module runs with `python -m computer_use_demo.bench.<name>` and
+needs neither an API key nor a real screen.
+"""
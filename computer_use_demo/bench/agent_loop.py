@@ -0,0 +1,196 @@
+"""
+End-to-end benchmark of `sampling_loop` against the mock Messages API and fake display.
+
+    python -m computer_use_demo.bench.agent_loop --sessions 10 --json results.json
+
+Reports loop throughput, p50/p95 latency per traced phase and peak RSS, so regressions in
+the hot paths show up without an API key or a screen.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Any
+
+from .. import loop
+from ..insights import InsightStore
+from ..tracing import TRACE_FILE, tracer
+from .fake_display import FakeDisplay
+from .mock_api import MockMessagesAPI
+from .stats import format_table, peak_rss_mb, percentile
+
+NOTE_TEXT = "alpha\nbeta\ngamma\n"
+
+
+def default_script(workdir: Path) -> list[tuple[str, dict[str, Any]]]:
+    """A representative mix of screen, shell and editor actions."""
+    note = str(workdir / "notes.txt")
+    return [
+        ("computer", {"action": "screenshot"}),
+        ("computer", {"action": "mouse_move", "coordinate": [640, 400]}),
+        ("computer", {"action": "left_click"}),
+        ("computer", {"action": "type", "text": "hello world"}),
+        ("computer", {"action": "key", "text": "cmd+a"}),
+        ("computer", {"action": "screenshot"}),
+        ("bash", {"command": "echo benchmark && ls"}),
+        ("str_replace_editor", {"command": "view", "path": note}),
+        ("str_replace_editor", {"command": "str_replace", "path": note, "old_str": "beta", "new_str": "delta"}),
+        ("str_replace_editor", {"command": "undo_edit", "path": note}),
+        ("computer", {"action": "cursor_position"}),
+        ("computer", {"action": "left_click_drag", "coordinate": [100, 100]}),
+        ("computer", {"action": "screenshot"}),
+        ("zoom", {"region": [100, 100, 400, 260]}),
+    ]
+
+
+async def run_session(
+    display: FakeDisplay,
+    workdir: Path,
+    only_n_most_recent_images: int | None,
+    settle: float | None = None,
+) -> dict[str, float]:
+    """Run the scripted session once; returns the screenshot prefetch counters."""
+    (workdir / "notes.txt").write_text(NOTE_TEXT)
+    messages: list = [{"role": "user", "content": "Run the benchmark procedure."}]
+    tools = loop.create_tool_collection(display)
+    computer = tools.tool_map["computer"]
+    if settle is not None:
+        computer._screenshot_delay = settle
+    async with tools:
+        await loop.sampling_loop(
+            model="mock",
+            provider=loop.APIProvider.ANTHROPIC,
+            system_prompt_suffix="",
+            messages=messages,
+            output_callback=lambda block: None,
+            tool_output_callback=lambda result, tool_use_id: None,
+            api_response_callback=lambda response: None,
+            api_key="bench",
+            only_n_most_recent_images=only_n_most_recent_images,
+            tool_collection=tools,
+        )
+    return computer.prefetch_stats
+
+
+async def run_benchmark(
+    sessions: int = 5,
+    api_latency: float = 0.0,
+    only_n_most_recent_images: int | None = 10,
+    width: int = 2560,
+    height: int = 1600,
+    settle: float | None = None,
+) -> dict[str, Any]:
+    with tempfile.TemporaryDirectory(prefix="computer-use-bench-") as tmp:
+        workdir = Path(tmp)
+        # keep insights, screenshots and traces of the run out of the working tree
+        previous_cwd = os.getcwd()
+        os.chdir(workdir)
+        loop.insight_store = InsightStore(workdir / "insights.md")
+        tracer.configure(workdir / "trace")
+        display = FakeDisplay(width, height)
+        api = MockMessagesAPI(default_script(workdir), latency=api_latency)
+        os.environ["ANTHROPIC_BASE_URL"] = api.start()
+        session_seconds = []
+        prefetch: dict[str, float] = defaultdict(float)
+        try:
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                started = time.perf_counter()
+                for _ in range(sessions):
+                    session_started = time.perf_counter()
+                    stats = await run_session(display, workdir, only_n_most_recent_images, settle)
+                    for key, value in stats.items():
+                        prefetch[key] += value
+                    session_seconds.append(time.perf_counter() - session_started)
+                elapsed = time.perf_counter() - started
+        finally:
+            api.stop()
+            tracer.flush()
+            os.chdir(previous_cwd)
+
+        durations: dict[str, list[float]] = defaultdict(list)
+        with open(workdir / "trace" / TRACE_FILE) as f:
+            for line in f:
+                record = json.loads(line)
+                durations[record["name"]].append(record["ms"])
+        tracer.configure(None)
+
+    return {
+        "sessions": sessions,
+        "turns": api.requests,
+        "seconds": elapsed,
+        "turns_per_second": api.requests / elapsed,
+        "request_mb": api.request_bytes / 1e6,
+        "session_p50_ms": percentile(session_seconds, 50) * 1000,
+        "peak_rss_mb": peak_rss_mb(),
+        "screenshot_prefetch": dict(prefetch),
+        "phases": {
+            name: {
+                "count": len(values),
+                "p50_ms": percentile(values, 50),
+                "p95_ms": percentile(values, 95),
+            }
+            for name, values in sorted(durations.items())
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--sessions", type=int, default=5)
+    parser.add_argument("--api-latency-ms", type=float, default=0.0)
+    parser.add_argument("--only-n-most-recent-images", type=int, default=10)
+    parser.add_argument("--width", type=int, default=2560)
+    parser.add_argument("--height", type=int, default=1600)
+    parser.add_argument(
+        "--settle-ms",
+        type=float,
+        default=None,
+        help="settle time before prefetching a screenshot (default: ComputerTool's)",
+    )
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    results = asyncio.run(
+        run_benchmark(
+            sessions=args.sessions,
+            api_latency=args.api_latency_ms / 1000,
+            only_n_most_recent_images=args.only_n_most_recent_images,
+            width=args.width,
+            height=args.height,
+            settle=None if args.settle_ms is None else args.settle_ms / 1000,
+        )
+    )
+    print(
+        f"{results['turns']} turns in {results['seconds']:.2f}s: "
+        f"{results['turns_per_second']:.1f} turns/s, "
+        f"{results['request_mb']:.1f} MB sent, "
+        f"peak RSS {results['peak_rss_mb']:.0f} MiB"
+    )
+    prefetch = results["screenshot_prefetch"]
+    served = prefetch.get("hits", 0) + prefetch.get("misses", 0)
+    print(
+        f"screenshot prefetch: {prefetch.get('started', 0):.0f} started, "
+        f"{prefetch.get('hits', 0):.0f}/{served:.0f} served from prefetch, "
+        f"{prefetch.get('seconds_saved', 0) * 1000:.0f} ms saved"
+    )
+    print(
+        format_table(
+            [
+                [name, phase["count"], f"{phase['p50_ms']:.2f}", f"{phase['p95_ms']:.2f}"]
+                for name, phase in results["phases"].items()
+            ],
+            header=["phase", "count", "p50 ms", "p95 ms"],
+        )
+    )
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
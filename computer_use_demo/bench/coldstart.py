@@ -0,0 +1,118 @@
+"""
+Cold start benchmark: import time of `main.py` and time to the first window.
+
+    python -m computer_use_demo.bench.coldstart --runs 5 --max-import-ms 300
+
+Every run is a fresh interpreter. The import profile comes from `python -X importtime`
+and lists the slowest modules `main` imports directly; the window is timed from process
+start until Tk has drawn `ChatInterface`, and is skipped without a display. With
+`--max-import-ms` / `--max-window-ms` the exit status is 1 when the median is over the
+limit, so CI can catch a heavy import creeping back onto the startup path.
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from .stats import format_table, percentile
+
+REPO_ROOT = Path(__file__).resolve().parents[2]
+
+WINDOW_SCRIPT = """
+import os, time, tkinter as tk
+import main
+root = tk.Tk()
+main.ChatInterface(root)
+root.update()
+print(time.time(), flush=True)
+os._exit(0)  # don't wait for the agent thread
+"""
+
+
+def _run(args: list[str], cwd: str) -> subprocess.CompletedProcess:
+    env = {**os.environ, "PYTHONPATH": str(REPO_ROOT)}
+    return subprocess.run(
+        [sys.executable, *args], cwd=cwd, env=env, capture_output=True, text=True
+    )
+
+
+def import_profile(module: str, cwd: str) -> tuple[float, list[tuple[str, float]]]:
+    """Total import time of `module` and that of each module it imports directly, in ms."""
+    result = _run(["-X", "importtime", "-c", f"import {module}"], cwd)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    total = 0.0
+    direct = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth == 0 and name.strip() == module:
+            total = int(cumulative) / 1000
+        elif depth == 1:
+            direct.append((name.strip(), int(cumulative) / 1000))
+    return total, direct
+
+
+def time_to_first_window(cwd: str) -> float | None:
+    """Milliseconds from process start to the drawn window, or None without a display."""
+    started = time.time()
+    result = _run(["-c", WINDOW_SCRIPT], cwd)
+    if result.returncode != 0:
+        if "TclError" in result.stderr:
+            return None
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    return (float(result.stdout.split()[-1]) - started) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--module", default="main", help="module whose import is profiled")
+    parser.add_argument("--top", type=int, default=10, help="slowest direct imports to list")
+    parser.add_argument("--max-import-ms", type=float, help="fail if the median import is slower")
+    parser.add_argument("--max-window-ms", type=float, help="fail if the median window is slower")
+    args = parser.parse_args()
+
+    # sessions and transcripts written by the window runs stay out of the working tree
+    with tempfile.TemporaryDirectory(prefix="computer-use-coldstart-") as cwd:
+        totals = []
+        slowest: dict[str, list[float]] = {}
+        for _ in range(args.runs):
+            total, direct = import_profile(args.module, cwd)
+            totals.append(total)
+            for name, ms in direct:
+                slowest.setdefault(name, []).append(ms)
+        windows = [time_to_first_window(cwd) for _ in range(args.runs)]
+
+    rows = sorted(
+        ([name, f"{percentile(ms, 50):.1f}"] for name, ms in slowest.items()),
+        key=lambda row: -float(row[1]),
+    )[: args.top]
+    print(format_table(rows, header=[f"imported by {args.module}", "p50 ms"]))
+    import_ms = percentile(totals, 50)
+    print(f"\nimport {args.module}: p50 {import_ms:.1f} ms, p95 {percentile(totals, 95):.1f} ms")
+    window_ms = None
+    if None in windows:
+        print("first window: skipped, no display")
+    else:
+        window_ms = percentile(windows, 50)
+        print(f"first window: p50 {window_ms:.1f} ms, p95 {percentile(windows, 95):.1f} ms")
+
+    failures = []
+    if args.max_import_ms is not None and import_ms > args.max_import_ms:
+        failures.append(f"import took {import_ms:.1f} ms, over {args.max_import_ms:.0f} ms")
+    if args.max_window_ms is not None and window_ms is not None and window_ms > args.max_window_ms:
+        failures.append(f"first window took {window_ms:.1f} ms, over {args.max_window_ms:.0f} ms")
+    for failure in failures:
+        print(f"FAIL: {failure}", file=sys.stderr)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
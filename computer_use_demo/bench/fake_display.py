@@ -0,0 +1,98 @@
+"""A fake screen and input backend standing in for pyautogui in benchmarks."""
+
+import random
+import threading
+
+from PIL import Image, ImageDraw
+
+
+class FakeDisplay:
+    """
+    Implements the subset of the pyautogui API used by `ComputerTool`. Screenshots are a
+    synthetic desktop with windows and text, with a cursor marker redrawn on every frame
+    so consecutive screenshots differ and PNG encoding does realistic work.
+    """
+
+    def __init__(self, width: int = 2560, height: int = 1600, seed: int = 0):
+        self.width = width
+        self.height = height
+        self._lock = threading.Lock()
+        self._position = (width // 2, height // 2)
+        self.events: list[tuple] = []
+        self._frame = self._draw_desktop(random.Random(seed))
+
+    def size(self):
+        return self.width, self.height
+
+    def position(self):
+        return self._position
+
+    def screenshot(self, region=None):
+        with self._lock:
+            frame = self._frame.copy()
+            x, y = self._position
+        draw = ImageDraw.Draw(frame)
+        draw.polygon([(x, y), (x, y + 24), (x + 16, y + 18)], fill="black")
+        if region:
+            left, top, width, height = region
+            frame = frame.crop((left, top, left + width, top + height))
+        return frame
+
+    def moveTo(self, x, y, *args, **kwargs):
+        with self._lock:
+            self._position = (int(x), int(y))
+        self.events.append(("moveTo", x, y))
+
+    def mouseDown(self, *args, **kwargs):
+        self.events.append(("mouseDown",))
+
+    def mouseUp(self, *args, **kwargs):
+        self.events.append(("mouseUp",))
+
+    def click(self, *args, **kwargs):
+        self.events.append(("click", kwargs.get("button", "left")))
+        self._mark_activity()
+
+    def doubleClick(self, *args, **kwargs):
+        self.events.append(("doubleClick",))
+        self._mark_activity()
+
+    def hotkey(self, *keys, **kwargs):
+        self.events.append(("hotkey", *keys))
+        self._mark_activity()
+
+    def press(self, key, *args, **kwargs):
+        self.events.append(("press", key))
+
+    def write(self, text, *args, **kwargs):
+        self.events.append(("write", text))
+        self._mark_activity()
+
+    def _mark_activity(self):
+        """Change a small part of the screen, as a real UI would after input."""
+        with self._lock:
+            x, y = self._position
+            draw = ImageDraw.Draw(self._frame)
+            draw.rectangle(
+                [x - 40, y - 12, x + 40, y + 12],
+                fill=(len(self.events) * 37 % 256, 120, 200),
+            )
+
+    def _draw_desktop(self, rng: random.Random) -> Image.Image:
+        image = Image.new("RGB", (self.width, self.height), (236, 236, 240))
+        draw = ImageDraw.Draw(image)
+        draw.rectangle([0, 0, self.width, 28], fill=(250, 250, 250))
+        for _ in range(6):
+            left = rng.randrange(0, self.width - 600)
+            top = rng.randrange(40, self.height - 400)
+            right = left + rng.randrange(400, 1200)
+            bottom = top + rng.randrange(300, 900)
+            draw.rectangle([left, top, right, bottom], fill="white", outline=(180, 180, 190))
+            draw.rectangle([left, top, right, top + 30], fill=(245, 245, 247))
+            for line_top in range(top + 44, bottom - 16, 22):
+                words = " ".join(
+                    "".join(rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(rng.randrange(2, 9)))
+                    for _ in range(rng.randrange(4, 14))
+                )
+                draw.text((left + 12, line_top), words, fill=(40, 40, 40))
+        return image
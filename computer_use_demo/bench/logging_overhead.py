@@ -0,0 +1,103 @@
+"""
+Logging overhead benchmark: what a log line costs the code that writes it.
+
+    python -m computer_use_demo.bench.logging_overhead --calls 2000 --sink-delay-ms 0.2
+
+Logs `--calls` tool calls the way the loop does, each with a tool input of
+`--input-chars` characters, to a sink that takes `--sink-delay-ms` per write (a
+terminal or pipe that is slow to drain), and reports the time each call spends in the
+caller: with `print` of the whole input, as the loop used to, and with the queued
+structured logger in text and JSON, with and without sampling.
+"""
+
+import argparse
+import io
+import time
+
+from ..logs import configure_logging, get_logger, stop_logging
+from .stats import format_table, percentile
+
+
+class SlowSink(io.StringIO):
+    """A stream that takes `delay` seconds per write and keeps only a byte count."""
+
+    def __init__(self, delay: float):
+        super().__init__()
+        self.delay = delay
+        self.written = 0
+
+    def write(self, text: str) -> int:
+        time.sleep(self.delay)
+        self.written += len(text)
+        return len(text)
+
+
+def run_print(calls: int, tool_input: dict, sink: SlowSink) -> list[float]:
+    times = []
+    for _ in range(calls):
+        started = time.perf_counter()
+        print("Executing tool: computer", file=sink)
+        print(f"Tool input: {tool_input}", file=sink)
+        times.append((time.perf_counter() - started) * 1000)
+    return times
+
+
+def run_logger(calls: int, tool_input: dict, sink: SlowSink, **settings) -> list[float]:
+    configure_logging(stream=sink, **settings)
+    logger = get_logger("computer_use_demo.bench")
+    times = []
+    for _ in range(calls):
+        started = time.perf_counter()
+        logger.info("Executing tool", tool="computer", input=tool_input)
+        times.append((time.perf_counter() - started) * 1000)
+    stop_logging()  # waits for the listener to write everything out
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--calls", type=int, default=2000)
+    parser.add_argument("--input-chars", type=int, default=20000, help="size of the text typed")
+    parser.add_argument("--sink-delay-ms", type=float, default=0.2, help="time the sink takes per write")
+    parser.add_argument("--sample", type=int, default=10, help="keep one record in this many")
+    args = parser.parse_args()
+
+    tool_input = {"action": "type", "text": "x" * args.input_chars}
+    modes = {
+        "print": lambda sink: run_print(args.calls, tool_input, sink),
+        "logger (text)": lambda sink: run_logger(args.calls, tool_input, sink, json_lines=False, sample={}),
+        "logger (json)": lambda sink: run_logger(args.calls, tool_input, sink, json_lines=True, sample={}),
+        f"logger (json, 1 in {args.sample})": lambda sink: run_logger(
+            args.calls,
+            tool_input,
+            sink,
+            json_lines=True,
+            sample={"Executing tool": args.sample},
+        ),
+    }
+    rows = []
+    for name, run in modes.items():
+        sink = SlowSink(args.sink_delay_ms / 1000)
+        started = time.perf_counter()
+        times = run(sink)
+        elapsed = time.perf_counter() - started
+        rows.append(
+            [
+                name,
+                f"{percentile(times, 50) * 1000:.1f}",
+                f"{percentile(times, 99) * 1000:.1f}",
+                f"{sum(times):.0f}",
+                f"{elapsed * 1000:.0f}",
+                f"{sink.written / 1e6:.1f}",
+            ]
+        )
+    print(
+        format_table(
+            rows,
+            header=["mode", "caller p50 us", "caller p99 us", "caller total ms", "until written ms", "MB written"],
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
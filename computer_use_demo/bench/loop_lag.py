@@ -0,0 +1,120 @@
+"""
+Event loop lag benchmark: how long concurrent sessions hold up each other's loop.
+
+    python -m computer_use_demo.bench.loop_lag --sessions 8 --threshold-ms 20
+
+Runs `--sessions` scripted sessions at once on one event loop, against the mock Messages
+API and a fake display each, while a probe measures how late a 10 ms timer fires. A
+`LoopWatchdog` records every stall over `--threshold-ms` with the code that was running;
+the report groups them by the innermost frame of this package.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import os
+import tempfile
+import time
+from collections import Counter
+from pathlib import Path
+
+from .. import loop
+from ..executors import LoopWatchdog
+from ..insights import InsightStore
+from .agent_loop import default_script, run_session
+from .fake_display import FakeDisplay
+from .mock_api import MockMessagesAPI
+from .stats import format_table, percentile
+
+PROBE_INTERVAL = 0.01  # seconds
+
+
+async def probe_lag(lags: list[float], stop: asyncio.Event):
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(PROBE_INTERVAL)
+        lags.append((time.perf_counter() - started - PROBE_INTERVAL) * 1000)
+
+
+def blocking_site(stack: str) -> str:
+    """The innermost frame of the stack that is in this package, as `file:line`."""
+    sites = [line.strip() for line in stack.splitlines() if line.strip().startswith("File ")]
+    ours = [site for site in sites if "computer_use_demo" in site and "executors.py" not in site]
+    site = (ours or sites or ["(unknown)"])[-1]
+    return site.replace('File "', "").replace('", line ', ":").split(",")[0]
+
+
+async def run_benchmark(sessions: int, threshold_ms: float, api_latency: float, width: int, height: int):
+    with tempfile.TemporaryDirectory(prefix="computer-use-lag-") as tmp:
+        workdir = Path(tmp)
+        previous_cwd = os.getcwd()
+        os.chdir(workdir)
+        loop.insight_store = InsightStore(workdir / "insights.md")
+        api = MockMessagesAPI(default_script(workdir), latency=api_latency)
+        os.environ["ANTHROPIC_BASE_URL"] = api.start()
+        watchdog = LoopWatchdog(threshold_ms, report=lambda ms, stack: None)
+        lags: list[float] = []
+        stop = asyncio.Event()
+        displays = [FakeDisplay(width, height, seed=i) for i in range(sessions)]
+        try:
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                watchdog.start()
+                probe = asyncio.create_task(probe_lag(lags, stop))
+                started = time.perf_counter()
+                await asyncio.gather(*(run_session(display, workdir, 10) for display in displays))
+                elapsed = time.perf_counter() - started
+                stop.set()
+                await probe
+        finally:
+            watchdog.stop()
+            api.stop()
+            os.chdir(previous_cwd)
+    return {
+        "sessions": sessions,
+        "seconds": elapsed,
+        "turns": api.requests,
+        "lags": lags,
+        "stalls": watchdog.stalls,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--sessions", type=int, default=8)
+    parser.add_argument("--threshold-ms", type=float, default=20.0, help="stalls longer than this are recorded")
+    parser.add_argument("--api-latency-ms", type=float, default=50.0)
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=800)
+    parser.add_argument("--top", type=int, default=10, help="blocking sites to list")
+    args = parser.parse_args()
+
+    results = asyncio.run(
+        run_benchmark(
+            args.sessions, args.threshold_ms, args.api_latency_ms / 1000, args.width, args.height
+        )
+    )
+    lags = results["lags"]
+    stalls = results["stalls"]
+    print(
+        f"{results['sessions']} sessions, {results['turns']} turns in {results['seconds']:.2f}s; "
+        f"timer lag p50 {percentile(lags, 50):.1f} ms, p95 {percentile(lags, 95):.1f} ms, "
+        f"max {max(lags, default=0):.1f} ms; {len(stalls)} stalls over {args.threshold_ms:.0f} ms"
+    )
+    if stalls:
+        by_site: dict[str, list[float]] = {}
+        for ms, stack in stalls:
+            by_site.setdefault(blocking_site(stack), []).append(ms)
+        counts = Counter({site: len(values) for site, values in by_site.items()})
+        print(
+            format_table(
+                [
+                    [site, count, f"{max(by_site[site]):.0f}"]
+                    for site, count in counts.most_common(args.top)
+                ],
+                header=["blocking site", "stalls", "max ms"],
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
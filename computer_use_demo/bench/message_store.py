@@ -0,0 +1,82 @@
+"""
+Message store benchmark: memory of screenshot histories held in RAM or on disk.
+
+    python -m computer_use_demo.bench.message_store --sessions 4 --turns 10 50 100
+
+Builds `--sessions` synthetic histories of screenshot turns in one process, with every
+image either a base64 `str` (what the loop keeps without a blob store) or a `BlobRef` to
+a file in a `BlobStore`, and reports the memory the histories hold once built, measured
+with `tracemalloc`, and the per-call time to serialize the next request from each.
+"""
+
+import argparse
+import base64
+import os
+import tempfile
+import time
+import tracemalloc
+
+from ..blobs import BlobStore
+from ..loop import PayloadBuilder
+from .serialize import PARAMS, add_turn
+from .stats import format_table, percentile
+
+
+def build_sessions(sessions: int, turns: int, screenshot_bytes: int, store: BlobStore | None):
+    """The histories and their size in MB; every screenshot is distinct, as real ones are."""
+    tracemalloc.start()
+    histories = []
+    for _ in range(sessions):
+        messages: list = [{"role": "user", "content": "Run the benchmark procedure."}]
+        for i in range(turns):
+            data = os.urandom(screenshot_bytes)
+            add_turn(messages, i, store.ref(data) if store else base64.b64encode(data).decode())
+        histories.append(messages)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return histories, current / 1e6
+
+
+def time_builds(histories: list, repeat: int) -> float:
+    """Median milliseconds of a cached build after a new turn, as the loop does per call."""
+    times = []
+    for messages in histories:
+        builder = PayloadBuilder()
+        builder.build(messages=messages, **PARAMS)
+        screenshot = messages[-1]["content"][0]["content"][0]["source"]["data"]
+        for i in range(repeat):
+            add_turn(messages, len(messages) + i, screenshot)
+            started = time.perf_counter()
+            builder.build(messages=messages, **PARAMS)
+            times.append((time.perf_counter() - started) * 1000)
+    return percentile(times, 50)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--sessions", type=int, default=4)
+    parser.add_argument("--turns", type=int, nargs="+", default=[10, 50, 100])
+    parser.add_argument("--screenshot-kb", type=int, default=300, help="base64 size of each screenshot")
+    parser.add_argument("--repeat", type=int, default=5, help="calls timed per session")
+    args = parser.parse_args()
+
+    screenshot_bytes = args.screenshot_kb * 768
+    rows = []
+    with tempfile.TemporaryDirectory(prefix="computer-use-blobs-") as tmp:
+        for turns in args.turns:
+            for name, store in (("str", None), ("BlobRef", BlobStore(tmp))):
+                histories, mb = build_sessions(args.sessions, turns, screenshot_bytes, store)
+                build_ms = time_builds(histories, args.repeat)
+                rows.append(
+                    [str(turns), name, f"{mb:.1f}", f"{mb / args.sessions:.2f}", f"{build_ms:.2f}"]
+                )
+                del histories
+    print(
+        format_table(
+            rows, header=["turns", "images as", "held MB", "MB per session", "build p50 ms"]
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""A local mock of the Messages API that replays a scripted sequence of tool uses."""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any
+
+
+class MockMessagesAPI:
+    """
+    Serves `POST /v1/messages`. The n-th assistant turn of a conversation answers with
+    the n-th `(tool_name, tool_input)` of the script; once the script is exhausted the
+    mock replies with a final text turn.
+    """
+
+    def __init__(
+        self,
+        script: list[tuple[str, dict[str, Any]]],
+        latency: float = 0.0,  # seconds added to every response
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ):
+        self.script = script
+        self.latency = latency
+        self.requests = 0
+        self.request_bytes = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread: threading.Thread | None = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> str:
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name="mock-messages-api", daemon=True
+        )
+        self._thread.start()
+        return self.base_url
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def respond(self, request: dict[str, Any], n_bytes: int) -> dict[str, Any]:
+        turn = sum(1 for message in request["messages"] if message["role"] == "assistant")
+        if turn < len(self.script):
+            name, tool_input = self.script[turn]
+            content = [
+                {"type": "text", "text": f"Step {turn + 1}: using {name}."},
+                {"type": "tool_use", "id": f"toolu_{turn:04d}", "name": name, "input": tool_input},
+            ]
+            stop_reason = "tool_use"
+        else:
+            content = [{"type": "text", "text": "The task is complete."}]
+            stop_reason = "end_turn"
+        return {
+            "id": f"msg_bench_{turn:04d}",
+            "type": "message",
+            "role": "assistant",
+            "model": request.get("model", "mock"),
+            "content": content,
+            "stop_reason": stop_reason,
+            "stop_sequence": None,
+            "usage": {"input_tokens": n_bytes // 4, "output_tokens": 40},
+        }
+
+    def _make_handler(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                length = int(self.headers.get("content-length", 0))
+                body = self.rfile.read(length)
+                with api._lock:
+                    api.requests += 1
+                    api.request_bytes += length
+                if not self.path.startswith("/v1/messages"):
+                    self._send(404, {"type": "error", "error": {"type": "not_found_error", "message": self.path}})
+                    return
+                if api.latency:
+                    time.sleep(api.latency)
+                self._send(200, api.respond(json.loads(body), length))
+
+            def _send(self, status: int, payload: dict[str, Any]):
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("content-type", "application/json")
+                self.send_header("content-length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
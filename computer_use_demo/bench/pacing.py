@@ -0,0 +1,291 @@
+"""
+Input pacing calibration: the shortest reliable delay after each kind of input.
+
+    python -m computer_use_demo.bench.pacing --trials 5 --save pacing.json
+
+Opens a small Tk window and drives it through pyautogui the way `ComputerTool` does. For
+each field of `PacingProfile` it tries delays from the longest to the shortest, running
+the action and then, without waiting any longer, the input that depends on it (typing
+after a click, picking an item after a right click, ...), and checks what the window
+received. The shortest delay at which every trial passed, times `--margin`, goes into
+the profile; `--save` writes it for the `COMPUTER_USE_PACING` environment variable.
+Finally a mix of actions is timed with pyautogui's global pause and with the profile.
+
+Needs a display, and the window must keep the focus while it runs.
+"""
+
+import argparse
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import fields, replace
+
+from ..tools.pacing import PROFILES, PacedBackend, PacingProfile
+from .stats import format_table, percentile
+
+CANDIDATES = [0.1, 0.05, 0.02, 0.01, 0.005, 0.0]  # seconds, tried longest first
+SETTLE = 0.3  # seconds the window gets to handle the input before it is checked
+TEXT = "The quick brown fox 0123"
+
+
+class CalibrationWindow:
+    """The window receiving the input. Tk runs on the main thread; `ui` is for the driver."""
+
+    def __init__(self):
+        import tkinter as tk
+
+        self.root = tk.Tk()
+        self.root.title("computer-use pacing calibration")
+        self.root.attributes("-topmost", True)
+        self.entry = tk.Entry(self.root, width=40)
+        self.other = tk.Entry(self.root, width=40)
+        self.button = tk.Button(self.root, text="Target", command=self._clicked)
+        self.canvas = tk.Canvas(self.root, width=400, height=160, background="white")
+        for widget in (self.entry, self.other, self.button, self.canvas):
+            widget.pack(padx=20, pady=8)
+        self.menu = tk.Menu(self.root, tearoff=0)
+        self.menu.add_command(label="Pick me", command=self._picked)
+        self.canvas.bind("<ButtonPress-1>", lambda e: self.presses.append((e.x_root, e.y_root)))
+        self.canvas.bind("<B1-Motion>", lambda e: self.motions.append((e.x_root, e.y_root)))
+        # entry 0 is posted under the pointer, so a click right there picks it
+        self.canvas.bind("<Button-3>", lambda e: self.menu.tk_popup(e.x_root, e.y_root, 0))
+        self.clicks = 0
+        self.picks = 0
+        self.presses: list[tuple[int, int]] = []
+        self.motions: list[tuple[int, int]] = []
+        self._calls: queue.SimpleQueue = queue.SimpleQueue()
+        self.root.after(5, self._serve)
+
+    def ui(self, fn):
+        """Run `fn` on the Tk thread and return its result."""
+        future: Future = Future()
+        self._calls.put((fn, future))
+        return future.result(timeout=5)
+
+    def center(self, widget, dx: int = 0) -> tuple[int, int]:
+        return self.ui(
+            lambda: (
+                widget.winfo_rootx() + widget.winfo_width() // 2 + dx,
+                widget.winfo_rooty() + widget.winfo_height() // 2,
+            )
+        )
+
+    def focus(self, widget, text: str = ""):
+        def set_up():
+            self.root.focus_force()
+            for entry in (self.entry, self.other):
+                entry.delete(0, "end")
+            widget.insert(0, text)
+            widget.icursor("end")
+            widget.focus_set()
+
+        self.ui(set_up)
+
+    def reset(self):
+        def clear():
+            self.menu.unpost()
+            self.clicks = self.picks = 0
+            self.presses.clear()
+            self.motions.clear()
+
+        self.ui(clear)
+
+    def _clicked(self):
+        self.clicks += 1
+
+    def _picked(self):
+        self.picks += 1
+
+    def _serve(self):
+        while True:
+            try:
+                fn, future = self._calls.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                future.set_result(fn())
+            except Exception as e:
+                future.set_exception(e)
+        self.root.after(5, self._serve)
+
+
+def _near(point, target, tolerance: int = 2) -> bool:
+    return abs(point[0] - target[0]) <= tolerance and abs(point[1] - target[1]) <= tolerance
+
+
+def trial(window: CalibrationWindow, pyautogui, profile: PacingProfile, field: str) -> bool:
+    """One attempt of the input `field` paces; True if the window got all of it."""
+    backend = PacedBackend(pyautogui, profile)
+    window.reset()
+    if field == "type_interval":
+        window.focus(window.entry)
+        time.sleep(SETTLE)
+        backend.write(TEXT)
+        time.sleep(SETTLE)
+        return window.ui(window.entry.get) == TEXT
+    if field == "key":
+        # select what was typed, then replace it
+        window.focus(window.entry, "calibrate")
+        time.sleep(SETTLE)
+        backend.hotkey("shift", "home")
+        backend.press("x")
+        time.sleep(SETTLE)
+        return window.ui(window.entry.get) == "x"
+    if field == "click":
+        # the click moves the focus, the key press must land in the clicked entry
+        window.focus(window.other)
+        pyautogui.moveTo(*window.center(window.entry))
+        time.sleep(SETTLE)
+        backend.click()
+        backend.press("x")
+        time.sleep(SETTLE)
+        return window.ui(window.entry.get) == "x"
+    if field == "move":
+        pyautogui.moveTo(*window.center(window.other))
+        time.sleep(SETTLE)
+        backend.moveTo(*window.center(window.button))
+        backend.click()
+        time.sleep(SETTLE)
+        return window.clicks == 1
+    if field == "menu":
+        pyautogui.moveTo(*window.center(window.canvas))
+        time.sleep(SETTLE)
+        backend.click(button="right")
+        backend.click()
+        time.sleep(SETTLE)
+        return window.picks == 1
+    if field == "drag_hold":
+        start, end = window.center(window.canvas, -100), window.center(window.canvas, 100)
+        pyautogui.moveTo(*start)
+        time.sleep(SETTLE)
+        backend.mouseDown()
+        backend.moveTo(*end)
+        backend.mouseUp()
+        time.sleep(SETTLE)
+        return (
+            bool(window.presses)
+            and _near(window.presses[-1], start)
+            and any(_near(point, end) for point in window.motions)
+        )
+    raise ValueError(f"no trial for {field}")
+
+
+def calibrate(window: CalibrationWindow, pyautogui, trials: int, margin: float):
+    """The calibrated profile, and per field the shortest reliable delay and the pass rates."""
+    calibrated = {}
+    report = []
+    for field in fields(PacingProfile):
+        shortest = None
+        passes = []
+        for delay in CANDIDATES:
+            # only the field being measured is shortened; everything else stays safe
+            profile = replace(PROFILES["pyautogui"], **{field.name: delay})
+            passed = sum(trial(window, pyautogui, profile, field.name) for _ in range(trials))
+            passes.append(f"{passed}/{trials}")
+            if passed < trials:
+                break
+            shortest = delay
+        if shortest is None:
+            # unreliable even at the longest delay; keep what pyautogui would wait
+            calibrated[field.name] = getattr(PROFILES["pyautogui"], field.name)
+        else:
+            calibrated[field.name] = round(shortest * margin, 3)
+        report.append((field.name, shortest, calibrated[field.name], passes))
+    return PacingProfile(**calibrated), report
+
+
+def time_actions(window: CalibrationWindow, backend, typing_interval: float, rounds: int):
+    """Milliseconds per action of the mix `ComputerTool` sends, on `backend`."""
+    times: dict[str, list[float]] = {}
+
+    def timed(name, fn, *args, **kwargs):
+        started = time.perf_counter()
+        fn(*args, **kwargs)
+        times.setdefault(name, []).append((time.perf_counter() - started) * 1000)
+
+    for _ in range(rounds):
+        window.reset()
+        window.focus(window.entry)
+        timed("mouse_move", backend.moveTo, *window.center(window.entry))
+        timed("left_click", backend.click, button="left")
+        timed("type (10 chars)", backend.write, TEXT[:10], interval=typing_interval)
+        timed("key", backend.hotkey, "shift", "home")
+        start, end = window.center(window.canvas, -100), window.center(window.canvas, 100)
+        backend.moveTo(*start)
+
+        def drag():
+            backend.mouseDown()
+            backend.moveTo(*end)
+            backend.mouseUp()
+
+        timed("left_click_drag", drag)
+        backend.press("esc")
+    return {name: percentile(values, 50) for name, values in times.items()}
+
+
+def drive(window: CalibrationWindow, args, results: dict):
+    try:
+        import pyautogui
+
+        profile, report = calibrate(window, pyautogui, args.trials, args.margin)
+        legacy = time_actions(window, pyautogui, 0.012, args.rounds)
+        paced = time_actions(window, PacedBackend(pyautogui, profile), profile.type_interval, args.rounds)
+        results.update(profile=profile, report=report, legacy=legacy, paced=paced)
+    except BaseException as e:
+        results["error"] = e
+    finally:
+        window.ui(window.root.quit)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--trials", type=int, default=5, help="attempts per delay; all must pass")
+    parser.add_argument("--margin", type=float, default=2.0, help="factor applied to the shortest reliable delay")
+    parser.add_argument("--rounds", type=int, default=5, help="rounds of the timed action mix")
+    parser.add_argument("--save", help="write the calibrated profile to this JSON file")
+    args = parser.parse_args()
+
+    try:
+        window = CalibrationWindow()
+    except Exception as e:  # tkinter.TclError without a display
+        sys.exit(f"pacing calibration needs a display: {e}")
+    results: dict = {}
+    threading.Thread(target=drive, args=(window, args, results), daemon=True).start()
+    window.root.mainloop()
+    window.root.destroy()
+    if "error" in results:
+        raise results["error"]
+
+    print(
+        format_table(
+            [
+                [
+                    name,
+                    "unreliable" if shortest is None else f"{shortest * 1000:.0f}",
+                    f"{value * 1000:.0f}",
+                    " ".join(passes),
+                ]
+                for name, shortest, value, passes in results["report"]
+            ],
+            header=["delay", "shortest reliable ms", "profile ms", "passes from 100 ms down"],
+        )
+    )
+    print()
+    print(
+        format_table(
+            [
+                [name, f"{ms:.1f}", f"{results['paced'][name]:.1f}"]
+                for name, ms in results["legacy"].items()
+            ],
+            header=["action", "pyautogui pause p50 ms", "calibrated p50 ms"],
+        )
+    )
+    if args.save:
+        results["profile"].save(args.save)
+        print(f"\nSaved to {args.save}; use it with COMPUTER_USE_PACING={args.save}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Render-time benchmark for the chat log.
+
+    python -m computer_use_demo.bench.render --messages 2000
+
+Times markdown-to-segment conversion against the previous markdown + BeautifulSoup
+pipeline (when those packages are installed) and, when a display is available, the cost
+of appending to a capped versus an uncapped Tk chat log as the session grows.
+"""
+
+import argparse
+import random
+import time
+
+from ..chat_log import ChatLog
+from ..markdown_render import render_markdown
+from .stats import format_table, percentile
+
+WORDS = "the screen shows a dialog with options for export settings and file names".split()
+
+
+def sample_messages(n: int, seed: int = 0) -> list[tuple[str, str]]:
+    """A mix of assistant markdown and long tool output, like a real session."""
+    rng = random.Random(seed)
+    messages = []
+    for i in range(n):
+        if i % 3 == 2:
+            lines = [" ".join(rng.choices(WORDS, k=12)) for _ in range(rng.randrange(20, 200))]
+            messages.append(("Tool", "> Tool Output: " + "\n".join(lines)))
+        else:
+            sentence = " ".join(rng.choices(WORDS, k=16))
+            messages.append(
+                (
+                    "Assistant",
+                    f"## Step {i}\n\nI'll **click** the `Export` button, then *wait*.\n\n"
+                    f"- {sentence}\n- {sentence}\n\n```\nopen -a Arc\n```\n{sentence}",
+                )
+            )
+    return messages
+
+
+def to_segments(message: str, sender: str):
+    segments = [(f"{sender}:\n", (sender,))]
+    if sender == "Assistant":
+        segments.extend(render_markdown(message))
+    else:
+        segments.append((f"{message}\n", ()))
+    segments.append(("\n\n", ()))
+    return segments
+
+
+def time_parsing(messages: list[tuple[str, str]]) -> list[list[str]]:
+    assistant = [message for sender, message in messages if sender == "Assistant"]
+    rows = []
+    started = time.perf_counter()
+    for message in assistant:
+        render_markdown(message)
+    rows.append(["render_markdown", f"{(time.perf_counter() - started) / len(assistant) * 1e6:.1f}"])
+    try:
+        import markdown
+        from bs4 import BeautifulSoup
+    except ImportError:
+        rows.append(["markdown + bs4", "not installed"])
+    else:
+        started = time.perf_counter()
+        for message in assistant:
+            BeautifulSoup(markdown.markdown(message), "html.parser")
+        rows.append(["markdown + bs4", f"{(time.perf_counter() - started) / len(assistant) * 1e6:.1f}"])
+    return rows
+
+
+def time_widget(messages: list[tuple[str, str]], max_chars: int | None) -> list[float]:
+    import tkinter as tk
+    from tkinter import scrolledtext
+
+    root = tk.Tk()
+    root.withdraw()
+    try:
+        text = scrolledtext.ScrolledText(root, state="disabled")
+        log = ChatLog(text, max_chars=max_chars or 1 << 62)
+        timings = []
+        for sender, message in messages:
+            started = time.perf_counter()
+            log.append(to_segments(message, sender))
+            root.update_idletasks()
+            timings.append((time.perf_counter() - started) * 1000)
+        return timings
+    finally:
+        root.destroy()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--messages", type=int, default=1000)
+    parser.add_argument("--max-chars", type=int, default=256 * 1024)
+    args = parser.parse_args()
+
+    messages = sample_messages(args.messages)
+    print(format_table(time_parsing(messages), header=["parser", "µs / message"]))
+
+    try:
+        rows = []
+        for label, cap in (("uncapped", None), (f"capped at {args.max_chars}", args.max_chars)):
+            timings = time_widget(messages, cap)
+            tail = timings[-len(timings) // 10 :]
+            rows.append(
+                [label, f"{percentile(timings, 50):.2f}", f"{percentile(tail, 50):.2f}", f"{percentile(timings, 95):.2f}"]
+            )
+        print()
+        print(format_table(rows, header=["chat log", "p50 ms", "last 10% p50 ms", "p95 ms"]))
+    except Exception as e:  # no display available
+        print(f"\nSkipping widget benchmark: {e}")
+
+
+if __name__ == "__main__":
+    main()
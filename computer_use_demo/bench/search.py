@@ -0,0 +1,141 @@
+"""
+Workspace search benchmark: the editor's trigram index against full scans.
+
+    python -m computer_use_demo.bench.search --files 100000 --searches 10
+
+Generates a synthetic source tree and runs the same queries through a full scan in
+Python (walk and read every file, as a `grep -rn` does), `rg` or `grep -rn` when
+installed, and `WorkspaceIndex`. The index is timed for the first search of a cold tree (with the
+background build that follows it), the re-stat of the tree, the lookup alone, a search
+with the re-stat in front of it as the editor does after `mark_changed`, a search whose
+re-stat is skipped because the last one is recent, and a search after some files were
+modified.
+"""
+
+import argparse
+import os
+import random
+import shutil
+import subprocess
+import tempfile
+import time
+from pathlib import Path
+
+from ..tools.edit import SEARCH_REFRESH_SECONDS
+from ..tools.search_index import WorkspaceIndex
+from .stats import format_table, percentile
+
+SYLLABLES = "ba ce di fo gu ka le mi no pu ra se ti vo zu en ar ol ix um".split()
+COMMON = "config request response handler session client server update cache timeout".split()
+# a rare identifier, a common word, a phrase, and a miss
+QUERIES = ["handler_4242", "timeout", "def update_session", "xyzzy_missing"]
+PLANTED = 5  # files that contain the rare identifier
+
+
+def make_tree(root: Path, files: int, lines: int, seed: int = 0):
+    """Files of made-up functions; identifiers mix a few common words with many rare ones."""
+    rng = random.Random(seed)
+    vocabulary = COMMON + [
+        "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))) for _ in range(5000)
+    ]
+    for i in range(files):
+        directory = root / f"pkg{i % 100:02d}" / f"mod{i % 37:02d}"
+        directory.mkdir(parents=True, exist_ok=True)
+        body = [
+            f"def {rng.choice(vocabulary)}_{rng.choice(vocabulary)}(x):  "
+            f"# {rng.choice(vocabulary)} {rng.randrange(10000)}"
+            for _ in range(lines)
+        ]
+        if i % max(1, files // PLANTED) == 0:
+            body.append("def handler_4242(): pass")
+        (directory / f"file{i}.py").write_text("\n".join(body) + "\n")
+
+
+def full_scan(root: Path, query: str) -> int:
+    needle = query.lower()
+    matches = 0
+    for directory, _, names in os.walk(root):
+        for name in names:
+            with open(os.path.join(directory, name), encoding="utf-8", errors="ignore") as f:
+                matches += sum(needle in line.lower() for line in f)
+    return matches
+
+
+def external_scan(root: Path, query: str) -> int | None:
+    if shutil.which("rg"):
+        command = ["rg", "-n", "-i", "-F", "--no-messages", query, str(root)]
+    elif shutil.which("grep"):
+        command = ["grep", "-rn", "-i", "-F", query, str(root)]
+    else:
+        return None
+    result = subprocess.run(command, capture_output=True, text=True)
+    return result.stdout.count("\n")
+
+
+def timed(fn, *args) -> tuple[float, object]:
+    started = time.perf_counter()
+    result = fn(*args)
+    return (time.perf_counter() - started) * 1000, result
+
+
+def run_benchmark(root: Path, searches: int, touched: int) -> list[list[str]]:
+    scan = [timed(full_scan, root, query)[0] for query in QUERIES * searches]
+    external = [timed(external_scan, root, query) for query in QUERIES * searches]
+    index = WorkspaceIndex(root)
+    # the first search runs while the tree is still being indexed in the background
+    first, _ = timed(lambda: (index.refresh(), index.search(QUERIES[0])))
+    build, _ = timed(index.wait_until_indexed)
+    refresh = [timed(index.refresh)[0] for _ in range(searches)]
+    search = [timed(index.search, query)[0] for query in QUERIES * searches]
+    walked = [
+        timed(lambda: (index.refresh(), index.search(query)))[0] for query in QUERIES * searches
+    ]
+    index.refresh()
+    skipped = [
+        timed(lambda: (index.refresh(SEARCH_REFRESH_SECONDS), index.search(query)))[0]
+        for query in QUERIES * searches
+    ]
+    # an agent edits a few files between searches
+    for path in sorted(root.rglob("*.py"))[:touched]:
+        path.write_text(path.read_text() + "def handler_4242(): pass\n")
+    after_edit, _ = timed(lambda: (index.refresh(), index.search("handler_4242")))
+    index.close()
+
+    def row(name, build, times):
+        return [name, build, f"{percentile(times, 50):.1f}", f"{percentile(times, 95):.1f}"]
+
+    rows = [row("full scan (python)", "-", scan)]
+    if external[0][1] is not None:
+        name = "rg" if shutil.which("rg") else "grep -rn"
+        rows.append(row(name, "-", [ms for ms, _ in external]))
+    rows.append(row("index: first search, cold", f"{first + build:.1f}", [first]))
+    rows.append(row("index: refresh (stat only)", "", refresh))
+    rows.append(row("index: search (lookup only)", "", search))
+    rows.append(row("index: refresh + search", "", walked))
+    rows.append(row("index: search, recent refresh skipped", "", skipped))
+    if touched:
+        rows.append(row(f"index: {touched} files edited, refresh + search", "", [after_edit]))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--files", type=int, default=10000)
+    parser.add_argument("--lines", type=int, default=40, help="lines per generated file")
+    parser.add_argument("--searches", type=int, default=3, help="rounds of the query set")
+    parser.add_argument("--touched", type=int, default=10, help="files edited before the last search")
+    parser.add_argument("--root", help="search this tree instead of generating one")
+    args = parser.parse_args()
+
+    if args.root:
+        rows = run_benchmark(Path(args.root), args.searches, 0)
+    else:
+        with tempfile.TemporaryDirectory(prefix="computer-use-search-") as tmp:
+            root = Path(tmp)
+            make_tree(root, args.files, args.lines)
+            rows = run_benchmark(root, args.searches, args.touched)
+    print(format_table(rows, header=["search", "build ms", "p50 ms", "p95 ms"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Request serialization benchmark.
+
+    python -m computer_use_demo.bench.serialize --turns 10 25 50 100
+
+Builds a synthetic history of screenshot turns and times serializing the request body for
+the next call, both from scratch (what the SDK does on every call) and with the cached
+`PayloadBuilder` the sampling loop uses, which only encodes the newest turn.
+"""
+
+import argparse
+import base64
+import os
+import time
+
+from ..loop import PayloadBuilder, _maybe_filter_to_n_most_recent_images
+from .stats import format_table, percentile
+
+PARAMS = {"max_tokens": 4096, "model": "bench", "system": "You are a benchmark."}
+
+
+def add_turn(messages: list, i: int, screenshot: str):
+    tool_use_id = f"toolu_{i:04d}"
+    messages.append(
+        {
+            "role": "assistant",
+            "content": [
+                {"type": "text", "text": f"Taking screenshot {i} to check the result."},
+                {
+                    "type": "tool_use",
+                    "id": tool_use_id,
+                    "name": "computer",
+                    "input": {"action": "screenshot"},
+                },
+            ],
+        }
+    )
+    messages.append(
+        {
+            "role": "user",
+            "content": [
+                {
+                    "type": "tool_result",
+                    "tool_use_id": tool_use_id,
+                    "content": [
+                        {
+                            "type": "image",
+                            "source": {
+                                "type": "base64",
+                                "media_type": "image/png",
+                                "data": screenshot,
+                            },
+                        }
+                    ],
+                    "is_error": False,
+                }
+            ],
+        }
+    )
+
+
+def time_history(
+    turns: int, screenshot: str, only_n_most_recent_images: int | None, repeat: int
+) -> tuple[float, float, int]:
+    """Per-call milliseconds (full, cached) once the history has `turns` turns, and the body size."""
+    messages: list = [{"role": "user", "content": "Run the benchmark procedure."}]
+    builder = PayloadBuilder()
+    full, cached = [], []
+    size = 0
+    for i in range(turns + repeat):
+        add_turn(messages, i, screenshot)
+        if only_n_most_recent_images:
+            _maybe_filter_to_n_most_recent_images(messages, only_n_most_recent_images)
+        started = time.perf_counter()
+        body = builder.build(messages=messages, **PARAMS)
+        elapsed = time.perf_counter() - started
+        if i < turns:
+            continue
+        cached.append(elapsed * 1000)
+        started = time.perf_counter()
+        PayloadBuilder().build(messages=messages, **PARAMS)
+        full.append((time.perf_counter() - started) * 1000)
+        size = len(body)
+    return percentile(full, 50), percentile(cached, 50), size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--turns", type=int, nargs="+", default=[10, 25, 50, 100])
+    parser.add_argument("--screenshot-kb", type=int, default=300, help="base64 size of each screenshot")
+    parser.add_argument("--only-n-most-recent-images", type=int, default=None)
+    parser.add_argument("--repeat", type=int, default=10, help="calls timed per history length")
+    args = parser.parse_args()
+
+    screenshot = base64.b64encode(os.urandom(args.screenshot_kb * 768)).decode()
+    rows = []
+    for turns in args.turns:
+        full, cached, size = time_history(
+            turns, screenshot, args.only_n_most_recent_images, args.repeat
+        )
+        rows.append(
+            [
+                str(turns),
+                f"{size / 1e6:.1f}",
+                f"{full:.2f}",
+                f"{cached:.2f}",
+                f"{full / cached:.1f}x" if cached else "-",
+            ]
+        )
+    print(format_table(rows, header=["turns", "body MB", "full p50 ms", "cached p50 ms", "speedup"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""
+Load test of the agent server: many concurrent sessions against the mock Messages API.
+
+    python -m computer_use_demo.bench.server_load --sessions 32 --workers 8
+
+Starts `computer_use_demo.server` in this process on fake displays and drives it over
+HTTP like a client would: each simulated user creates a session (waiting for a free
+worker), sends a task, reads the event stream until the run ends and closes the session.
+Reports throughput, session latency, the wait for a worker and peak RSS.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import tempfile
+import time
+from pathlib import Path
+
+from .. import loop
+from ..insights import InsightStore
+from ..server import AgentServer, SessionManager, WorkerPool
+from .agent_loop import NOTE_TEXT, default_script
+from .fake_display import FakeDisplay
+from .mock_api import MockMessagesAPI
+from .stats import format_table, peak_rss_mb, percentile
+
+
+async def http(base_url: str, method: str, path: str, body: dict | None = None):
+    """One request to the server; returns (status, JSON response)."""
+    host, port = base_url.removeprefix("http://").split(":")
+    reader, writer = await asyncio.open_connection(host, int(port))
+    data = json.dumps(body).encode() if body is not None else b""
+    writer.write(
+        f"{method} {path} HTTP/1.1\r\nHost: {host}\r\nContent-Length: {len(data)}\r\n\r\n".encode()
+        + data
+    )
+    response = await reader.read()
+    writer.close()
+    head, _, payload = response.partition(b"\r\n\r\n")
+    return int(head.split()[1]), json.loads(payload)
+
+
+async def read_events(base_url: str, session_id: str) -> dict[str, int]:
+    """Follow a session's event stream until its run ends; returns event counts by type."""
+    host, port = base_url.removeprefix("http://").split(":")
+    reader, writer = await asyncio.open_connection(host, int(port))
+    writer.write(f"GET /sessions/{session_id}/events HTTP/1.1\r\nHost: {host}\r\n\r\n".encode())
+    counts: dict[str, int] = {}
+    try:
+        while line := await reader.readline():
+            if not line.startswith(b"data: "):
+                continue
+            kind = json.loads(line[len(b"data: ") :])["type"]
+            counts[kind] = counts.get(kind, 0) + 1
+            if kind in ("run_finished", "run_failed", "run_cancelled"):
+                break
+    finally:
+        writer.close()
+    return counts
+
+
+async def simulate_user(base_url: str) -> dict:
+    started = time.perf_counter()
+    status, session = await http(base_url, "POST", "/sessions")
+    if status != 201:
+        return {"ok": False, "error": session["error"]}
+    acquired = time.perf_counter()
+    await http(base_url, "POST", f"/sessions/{session['id']}/messages", {"text": "Run the benchmark procedure."})
+    counts = await read_events(base_url, session["id"])
+    await http(base_url, "DELETE", f"/sessions/{session['id']}")
+    return {
+        "ok": "run_finished" in counts,
+        "error": None if "run_finished" in counts else "run did not finish",
+        "wait": acquired - started,
+        "seconds": time.perf_counter() - started,
+        "events": sum(counts.values()),
+    }
+
+
+async def run_benchmark(sessions: int, workers: int, api_latency: float, journal: bool) -> dict:
+    with tempfile.TemporaryDirectory(prefix="computer-use-server-") as tmp:
+        workdir = Path(tmp)
+        (workdir / "notes.txt").write_text(NOTE_TEXT)
+        previous_cwd = os.getcwd()
+        os.chdir(workdir)
+        loop.insight_store = InsightStore(workdir / "insights.md")
+        api = MockMessagesAPI(default_script(workdir), latency=api_latency)
+        os.environ["ANTHROPIC_BASE_URL"] = api.start()
+        manager = SessionManager(
+            WorkerPool(workers, lambda: FakeDisplay(1280, 800)),
+            {
+                "provider": loop.APIProvider.ANTHROPIC,
+                "model": "mock",
+                "api_key": "bench",
+                "only_n_most_recent_images": 10,
+            },
+            journal_dir=workdir / "sessions" if journal else None,
+            acquire_timeout=None,
+        )
+        server = AgentServer(manager, port=0)
+        try:
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                base_url = await server.start()
+                started = time.perf_counter()
+                results = await asyncio.gather(*(simulate_user(base_url) for _ in range(sessions)))
+                elapsed = time.perf_counter() - started
+        finally:
+            await server.stop()
+            api.stop()
+            os.chdir(previous_cwd)
+
+    finished = [result for result in results if result["ok"]]
+    return {
+        "sessions": sessions,
+        "workers": workers,
+        "failed": len(results) - len(finished),
+        "errors": sorted({result["error"] for result in results if not result["ok"]}),
+        "seconds": elapsed,
+        "turns": api.requests,
+        "turns_per_second": api.requests / elapsed,
+        "events": sum(result["events"] for result in finished),
+        "session_seconds": [result["seconds"] for result in finished],
+        "wait_seconds": [result["wait"] for result in finished],
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--sessions", type=int, default=16, help="simulated users, all started at once")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--api-latency-ms", type=float, default=50.0)
+    parser.add_argument("--no-journal", action="store_true")
+    args = parser.parse_args()
+
+    results = asyncio.run(
+        run_benchmark(args.sessions, args.workers, args.api_latency_ms / 1000, not args.no_journal)
+    )
+    print(
+        f"{results['sessions']} sessions on {results['workers']} workers in "
+        f"{results['seconds']:.2f}s: {results['turns']} turns, "
+        f"{results['turns_per_second']:.1f} turns/s, {results['events']} events streamed, "
+        f"{results['failed']} failed, peak RSS {results['peak_rss_mb']:.0f} MiB"
+    )
+    for error in results["errors"]:
+        print(f"  {error}")
+    rows = [
+        [name, f"{percentile(values, 50) * 1000:.0f}", f"{percentile(values, 95) * 1000:.0f}"]
+        for name, values in (
+            ("session", results["session_seconds"]),
+            ("wait for a worker", results["wait_seconds"]),
+        )
+        if values
+    ]
+    print(format_table(rows, header=["", "p50 ms", "p95 ms"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Per-message tool startup benchmark.
+
+    python -m computer_use_demo.bench.tool_startup --messages 20
+
+Compares handling a user message with a fresh `ToolCollection` (what `sampling_loop` does
+when it isn't given one) against a collection that was started and warmed up once for
+the session. Each message runs a shell command and takes a screenshot, the usual first
+two steps of a turn. Uses the fake display unless `--real-display` is given.
+"""
+
+import argparse
+import asyncio
+import time
+
+from ..loop import create_tool_collection
+from ..tools import ToolCollection
+from .fake_display import FakeDisplay
+from .stats import format_table, percentile
+
+
+async def first_steps(tools: ToolCollection):
+    await tools.run(name="bash", tool_input={"command": "pwd"})
+    await tools.run(name="computer", tool_input={"action": "screenshot"})
+
+
+async def per_message_fresh(backend, messages: int) -> list[float]:
+    timings = []
+    for _ in range(messages):
+        started = time.perf_counter()
+        tools = create_tool_collection(backend)
+        await first_steps(tools)
+        timings.append((time.perf_counter() - started) * 1000)
+        await tools.shutdown()
+    return timings
+
+
+async def per_message_persistent(backend, messages: int) -> tuple[float, list[float]]:
+    started = time.perf_counter()
+    tools = create_tool_collection(backend)
+    await tools.start()
+    startup = (time.perf_counter() - started) * 1000
+    timings = []
+    try:
+        for _ in range(messages):
+            started = time.perf_counter()
+            await first_steps(tools)
+            timings.append((time.perf_counter() - started) * 1000)
+    finally:
+        await tools.shutdown()
+    return startup, timings
+
+
+async def run_benchmark(messages: int, real_display: bool) -> list[list[str]]:
+    backend = None if real_display else FakeDisplay()
+    fresh = await per_message_fresh(backend, messages)
+    startup, persistent = await per_message_persistent(backend, messages)
+    return [
+        ["fresh per message", "-", f"{percentile(fresh, 50):.1f}", f"{percentile(fresh, 95):.1f}"],
+        [
+            "persistent",
+            f"{startup:.1f}",
+            f"{percentile(persistent, 50):.1f}",
+            f"{percentile(persistent, 95):.1f}",
+        ],
+        [
+            "saved per message",
+            "",
+            f"{percentile(fresh, 50) - percentile(persistent, 50):.1f}",
+            "",
+        ],
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--messages", type=int, default=20)
+    parser.add_argument("--real-display", action="store_true", help="use pyautogui and the real screen")
+    args = parser.parse_args()
+
+    rows = asyncio.run(run_benchmark(args.messages, args.real_display))
+    print(format_table(rows, header=["tools", "startup ms", "p50 ms", "p95 ms"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Content-addressed storage for large binary payloads such as screenshots.
+
+A `BlobRef` stands in for the base64 data of an image in the conversation history, so
+the history holds a digest instead of a megabyte string per screenshot. The data is
+mapped from disk only while a request body is being serialized.
+"""
+
+import base64
+import hashlib
+import mmap
+import os
+from pathlib import Path
+
+
+class BlobStore:
+    """Stores each payload once, in a file named by the SHA-256 of its content."""
+
+    def __init__(self, root: str | os.PathLike):
+        self.root = Path(root)
+
+    def path(self, digest: str) -> Path:
+        return self.root / digest[:2] / digest
+
+    def put(self, data: bytes) -> str:
+        """Store `data` if it isn't stored yet and return its digest."""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.path(digest)
+        if not path.exists():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_name(f"{digest}.{os.getpid()}.tmp")
+            tmp_path.write_bytes(data)
+            os.replace(tmp_path, path)
+        return digest
+
+    def get(self, digest: str) -> bytes:
+        return self.path(digest).read_bytes()
+
+    def ref(self, data: bytes) -> "BlobRef":
+        """Store `data` and return a handle to it."""
+        return BlobRef(self, self.put(data), len(data))
+
+    def b64encode(self, digest: str) -> bytes:
+        """The base64 encoding of a blob, read through a memory map."""
+        with open(self.path(digest), "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return b""
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                return base64.b64encode(data)
+
+    def __contains__(self, digest: str):
+        return self.path(digest).exists()
+
+
+class BlobRef:
+    """A handle to a stored payload, used in place of its base64 string."""
+
+    __slots__ = ("store", "digest", "size")
+
+    def __init__(self, store: BlobStore, digest: str, size: int):
+        self.store = store
+        self.digest = digest
+        self.size = size
+
+    def read(self) -> bytes:
+        return self.store.get(self.digest)
+
+    def b64encode(self) -> bytes:
+        return self.store.b64encode(self.digest)
+
+    def __len__(self) -> int:
+        """Length of the base64 string it stands for."""
+        return (self.size + 2) // 3 * 4
+
+    def __repr__(self) -> str:
+        return f"BlobRef({self.digest[:12]}, {self.size} bytes)"
@@ -0,0 +1,53 @@
+"""
+A size-capped chat log on top of a Tk Text widget.
+
+Only the most recent `max_chars` characters are kept in the widget. Older text is moved
+out to an overflow transcript file, so long sessions with large tool outputs don't slow
+the widget down.
+"""
+
+import os
+from collections.abc import Iterable
+from pathlib import Path
+
+from .markdown_render import Segment
+
+DEFAULT_MAX_CHARS = 256 * 1024
+TRIM_TO_FRACTION = 0.75  # trim well below the cap so trimming happens rarely
+
+
+class ChatLog:
+    def __init__(
+        self,
+        text_widget,
+        max_chars: int = DEFAULT_MAX_CHARS,
+        overflow_path: str | os.PathLike | None = None,
+    ):
+        self.text = text_widget
+        self.max_chars = max_chars
+        self.overflow_path = Path(overflow_path) if overflow_path else None
+        self.chars = 0
+        self.trimmed_chars = 0
+
+    def append(self, segments: Iterable[Segment]):
+        """Insert a batch of segments at the end, trim if needed, and scroll down."""
+        self.text.config(state="normal")
+        for text, tags in segments:
+            self.text.insert("end", text, tags)
+            self.chars += len(text)
+        if self.chars > self.max_chars:
+            self._trim(self.chars - int(self.max_chars * TRIM_TO_FRACTION))
+        self.text.config(state="disabled")
+        self.text.yview("end")
+
+    def _trim(self, n_chars: int):
+        # cut on a line boundary so the first visible message isn't split mid-line
+        end = self.text.index(f"1.0 + {n_chars} chars lineend + 1 chars")
+        removed = self.text.get("1.0", end)
+        self.text.delete("1.0", end)
+        self.chars -= len(removed)
+        self.trimmed_chars += len(removed)
+        if self.overflow_path:
+            self.overflow_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.overflow_path, "a", encoding="utf-8") as f:
+                f.write(removed)
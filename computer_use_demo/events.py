@@ -0,0 +1,70 @@
+"""
+Typed events emitted by the sampling loop, see `stream_sampling_loop`.
+"""
+
+from dataclasses import dataclass, field
+from typing import Any
+
+from anthropic.types.beta import BetaContentBlock
+
+from .tools import ToolResult
+
+
+@dataclass(kw_only=True, frozen=True)
+class AgentEvent:
+    """Base class of all events."""
+
+    # droppable events may be discarded when the consumer falls too far behind
+    droppable: bool = field(default=False, init=False, repr=False)
+
+
+@dataclass(kw_only=True, frozen=True)
+class TextEvent(AgentEvent):
+    """
+    Text the assistant wrote in its latest response, one event per whole text block.
+    Responses aren't streamed (the loop posts a pre-serialized body and parses the
+    complete message once), so there are no per-token deltas; a block's text arrives
+    when the response does.
+    """
+
+    text: str
+    block: BetaContentBlock
+
+
+@dataclass(kw_only=True, frozen=True)
+class ToolStartEvent(AgentEvent):
+    """The assistant asked for a tool, which is about to run."""
+
+    tool_use_id: str
+    name: str
+    input: dict[str, Any]
+    block: BetaContentBlock
+
+
+@dataclass(kw_only=True, frozen=True)
+class ToolResultEvent(AgentEvent):
+    """A tool finished running."""
+
+    tool_use_id: str
+    name: str
+    result: ToolResult
+
+
+@dataclass(kw_only=True, frozen=True)
+class UsageEvent(AgentEvent):
+    """Token usage reported for one API call."""
+
+    input_tokens: int
+    output_tokens: int
+    cache_creation_input_tokens: int | None = None
+    cache_read_input_tokens: int | None = None
+
+
+@dataclass(kw_only=True, frozen=True)
+class TimingEvent(AgentEvent):
+    """Wall time of one phase of a turn, e.g. `api` or `tool`."""
+
+    droppable: bool = field(default=True, init=False, repr=False)
+    phase: str
+    seconds: float
+    name: str | None = None
@@ -0,0 +1,164 @@
+"""
+Thread pools for blocking calls, and a watchdog that reports a blocked event loop.
+
+Tools and the sampling loop run their blocking work through `run_blocking` on one of a
+few bounded pools, rather than on the event loop or on `asyncio.to_thread`'s default
+executor, which everything in the process shares:
+
+- `io`: file reads and writes, directory walks
+- `input`: mouse and keyboard calls, which sleep for pacing and typing intervals
+- `capture`: screenshot capture and encoding, which are CPU-bound
+
+so a burst of screenshot encodes can't hold up another session's file writes, and
+typing doesn't take threads away from either. Sizes can be changed with `configure`
+before the first call.
+
+With the `COMPUTER_USE_LOOP_WATCHDOG_MS` environment variable set, every sampling loop
+starts a `LoopWatchdog` on its event loop, which logs the stack of any callback that
+blocks the loop for longer than that many milliseconds.
+"""
+
+import asyncio
+import contextvars
+import functools
+import os
+import sys
+import threading
+import time
+import traceback
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Literal
+
+from .logs import get_logger
+
+WATCHDOG_ENV = "COMPUTER_USE_LOOP_WATCHDOG_MS"
+
+logger = get_logger(__name__)
+
+Pool = Literal["io", "input", "capture"]
+
+POOL_SIZES: dict[str, int] = {
+    "io": 8,
+    "input": 8,
+    "capture": min(8, os.cpu_count() or 1),
+}
+
+_pools: dict[str, ThreadPoolExecutor] = {}
+_pools_lock = threading.Lock()
+
+
+def configure(**sizes: int):
+    """Set the number of threads of pools that haven't been started yet."""
+    for name, size in sizes.items():
+        if name not in POOL_SIZES:
+            raise ValueError(f"Unknown pool {name}; expected one of {', '.join(POOL_SIZES)}")
+        if name in _pools:
+            raise RuntimeError(f"The {name} pool is already running")
+        POOL_SIZES[name] = size
+
+
+def executor(pool: Pool) -> ThreadPoolExecutor:
+    with _pools_lock:
+        if pool not in _pools:
+            _pools[pool] = ThreadPoolExecutor(
+                max_workers=POOL_SIZES[pool], thread_name_prefix=f"computer-use-{pool}"
+            )
+        return _pools[pool]
+
+
+async def run_blocking(pool: Pool, fn: Callable[..., Any], /, *args, **kwargs) -> Any:
+    """Run `fn(*args, **kwargs)` on `pool` and wait for it, like `asyncio.to_thread`."""
+    # copied like to_thread does, so spans opened by `fn` nest under the caller's
+    context = contextvars.copy_context()
+    call = functools.partial(context.run, fn, *args, **kwargs)
+    return await asyncio.get_running_loop().run_in_executor(executor(pool), call)
+
+
+def shutdown(wait: bool = True):
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.shutdown(wait=wait)
+
+
+class LoopWatchdog:
+    """
+    Reports when the event loop goes longer than `threshold_ms` without running a
+    heartbeat callback. A thread checks the heartbeat; when it is late, the loop
+    thread's stack is captured then and there, so the report names the blocking code
+    rather than the callback that happened to run next.
+    """
+
+    def __init__(
+        self,
+        threshold_ms: float,
+        report: Callable[[float, str], None] | None = None,
+    ):
+        self.threshold = threshold_ms / 1000
+        self.report = report or _log_stall
+        self.stalls: list[tuple[float, str]] = []  # (ms, stack) of each stall
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._loop_thread: int | None = None
+        self._last_beat = time.monotonic()
+        self._stack: str | None = None
+        self._stopped = threading.Event()
+
+    def start(self):
+        """Start watching the running loop; call from a coroutine or callback on it."""
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._loop.call_soon(self._beat)
+        threading.Thread(target=self._watch, name="loop-watchdog", daemon=True).start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def _beat(self):
+        now = time.monotonic()
+        if self._stack is not None:
+            stalled_ms = (now - self._last_beat) * 1000
+            self.stalls.append((stalled_ms, self._stack))
+            self.report(stalled_ms, self._stack)
+            self._stack = None
+        self._last_beat = now
+        if not self._stopped.is_set() and not self._loop.is_closed():
+            self._loop.call_later(self.threshold / 4, self._beat)
+
+    def _watch(self):
+        while not self._stopped.wait(self.threshold / 4):
+            if self._loop.is_closed():
+                return
+            late = time.monotonic() - self._last_beat > self.threshold + self.threshold / 4
+            if late and self._stack is None:
+                frame = sys._current_frames().get(self._loop_thread)
+                self._stack = "".join(traceback.format_stack(frame)) if frame else "(unknown)"
+
+
+def _log_stall(stalled_ms: float, stack: str):
+    logger.warning("Event loop blocked", ms=round(stalled_ms), stack=stack)
+
+
+_watchdogs: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, LoopWatchdog]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def watch_event_loop(threshold_ms: float | None = None) -> LoopWatchdog | None:
+    """
+    Start a watchdog on the running loop, once per loop, with `threshold_ms` or else the
+    value of `COMPUTER_USE_LOOP_WATCHDOG_MS`; does nothing if neither is set.
+    """
+    loop = asyncio.get_running_loop()
+    if loop in _watchdogs:
+        return _watchdogs[loop]
+    if threshold_ms is None:
+        value = os.getenv(WATCHDOG_ENV)
+        if not value:
+            return None
+        threshold_ms = float(value)
+    watchdog = _watchdogs[loop] = LoopWatchdog(threshold_ms)
+    watchdog.start()
+    return watchdog
@@ -0,0 +1,234 @@
+"""
+Headless batch runner: runs a file of tasks in parallel, one agent per virtual display.
+
+    python -m computer_use_demo.headless tasks.txt --workers 4 --xvfb --json results.json
+
+The tasks file has one task per line (blank lines and lines starting with `#` are
+skipped). Each worker is a separate process that owns one X display (`:N`, numbered from
+`--display-base`) and its own `ToolCollection`, since pyautogui binds to the display of
+the process that imports it. With `--xvfb` each worker starts its own Xvfb server.
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import multiprocessing.util
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Any
+
+from .logs import configure_logging, stop_logging
+from .loop import (
+    PROVIDER_TO_DEFAULT_MODEL_NAME,
+    APIProvider,
+    create_tool_collection,
+    sampling_loop,
+)
+from .replay import TraceStore, run_with_replay
+from .tracing import tracer
+
+XVFB_STARTUP_TIMEOUT = 10.0  # seconds
+
+# per-worker-process state, set up by _init_worker
+_worker: dict[str, Any] = {}
+
+
+def _start_xvfb(display_num: int, screen: str) -> subprocess.Popen:
+    process = subprocess.Popen(
+        ["Xvfb", f":{display_num}", "-screen", "0", screen, "-nolisten", "tcp"],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    socket = Path(f"/tmp/.X11-unix/X{display_num}")
+    deadline = time.monotonic() + XVFB_STARTUP_TIMEOUT
+    while not socket.exists():
+        if process.poll() is not None or time.monotonic() > deadline:
+            process.kill()
+            raise RuntimeError(f"Xvfb failed to start on display :{display_num}")
+        time.sleep(0.05)
+    return process
+
+
+def _init_worker(display_numbers, options: dict[str, Any]):
+    # spawned workers don't inherit the parent's handlers, nor run atexit
+    configure_logging()
+    multiprocessing.util.Finalize(None, stop_logging, exitpriority=0)
+    multiprocessing.util.Finalize(None, tracer.flush, exitpriority=0)
+    display_num = display_numbers.get()
+    if options["xvfb"]:
+        xvfb = _start_xvfb(display_num, options["screen"])
+        # atexit doesn't run in pool workers; multiprocessing finalizers do
+        multiprocessing.util.Finalize(None, xvfb.terminate, exitpriority=10)
+    if display_num is not None and sys.platform.startswith("linux"):
+        os.environ["DISPLAY"] = f":{display_num}"
+
+    backend = None
+    if options["fake_display"]:
+        from .bench.fake_display import FakeDisplay
+
+        backend = FakeDisplay()
+    _worker["display_num"] = display_num
+    _worker["loop"] = asyncio.new_event_loop()
+    # the bash session is bound to this loop, so every task of the worker reuses it
+    _worker["tools"] = create_tool_collection(backend, display_num=display_num)
+    _worker["loop"].run_until_complete(_worker["tools"].start())
+    multiprocessing.util.Finalize(
+        None,
+        lambda: _worker["loop"].run_until_complete(_worker["tools"].shutdown()),
+        exitpriority=20,
+    )
+
+
+def _run_task(task: str, options: dict[str, Any]) -> dict[str, Any]:
+    messages: list = [{"role": "user", "content": task}]
+    final_text: list[str] = []
+    replayed = False
+
+    def output_callback(content_block):
+        if content_block.type == "text":
+            final_text.append(content_block.text)
+
+    sampling_kwargs = dict(
+        model=options["model"],
+        provider=options["provider"],
+        system_prompt_suffix="",
+        output_callback=output_callback,
+        tool_output_callback=lambda result, tool_use_id: None,
+        api_response_callback=lambda response: None,
+        api_key=options["api_key"],
+        only_n_most_recent_images=options["only_n_most_recent_images"],
+    )
+    started = time.perf_counter()
+    error = None
+    try:
+        if options["traces"]:
+            messages, replayed = _worker["loop"].run_until_complete(
+                run_with_replay(
+                    task,
+                    tool_collection=_worker["tools"],
+                    store=TraceStore(options["traces"]),
+                    **sampling_kwargs,
+                )
+            )
+            if replayed:
+                final_text.extend(
+                    block["text"] for block in messages[-1]["content"] if block["type"] == "text"
+                )
+        else:
+            _worker["loop"].run_until_complete(
+                sampling_loop(
+                    messages=messages, tool_collection=_worker["tools"], **sampling_kwargs
+                )
+            )
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    return {
+        "task": task,
+        "display": _worker["display_num"],
+        "ok": error is None,
+        "error": error,
+        "seconds": time.perf_counter() - started,
+        "turns": sum(1 for message in messages if message["role"] == "assistant"),
+        "replayed": replayed,
+        "result": final_text[-1] if final_text else None,
+    }
+
+
+def run_tasks(tasks: list[str], workers: int, display_base: int | None, options: dict[str, Any]):
+    """Run `tasks` on `workers` processes and yield each result as it completes."""
+    context = multiprocessing.get_context("spawn")
+    display_numbers = context.Manager().Queue()
+    for i in range(workers):
+        display_numbers.put(None if display_base is None else display_base + i)
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=context,
+        initializer=_init_worker,
+        initargs=(display_numbers, options),
+    ) as pool:
+        futures = [pool.submit(_run_task, task, options) for task in tasks]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def read_tasks(path: str) -> list[str]:
+    lines = Path(path).read_text().splitlines()
+    return [line.strip() for line in lines if line.strip() and not line.lstrip().startswith("#")]
+
+
+def main():
+    from .bench.stats import percentile
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("tasks", help="file with one task per line")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument(
+        "--display-base",
+        type=int,
+        default=None,
+        help="first X display number; worker i uses :(base + i). Defaults to the current display.",
+    )
+    parser.add_argument("--xvfb", action="store_true", help="start an Xvfb server per worker")
+    parser.add_argument("--screen", default="1280x800x24", help="Xvfb screen geometry")
+    parser.add_argument("--fake-display", action="store_true", help="use the benchmark fake display")
+    parser.add_argument("--provider", type=APIProvider, default=APIProvider.ANTHROPIC)
+    parser.add_argument("--model", default=None)
+    parser.add_argument("--only-n-most-recent-images", type=int, default=10)
+    parser.add_argument(
+        "--traces",
+        help="directory of recorded traces; tasks seen before are replayed without the model",
+    )
+    parser.add_argument("--json", help="write per-task results to this file")
+    args = parser.parse_args()
+
+    if args.xvfb and args.display_base is None:
+        args.display_base = 1
+    if args.workers > 1 and args.display_base is None and not args.fake_display:
+        parser.error("parallel workers need their own displays; pass --display-base or --xvfb")
+    configure_logging()
+
+    options = {
+        "provider": args.provider,
+        "model": args.model or PROVIDER_TO_DEFAULT_MODEL_NAME[args.provider],
+        "api_key": os.getenv("ANTHROPIC_API_KEY", ""),
+        "only_n_most_recent_images": args.only_n_most_recent_images,
+        "xvfb": args.xvfb,
+        "screen": args.screen,
+        "fake_display": args.fake_display,
+        "traces": args.traces,
+    }
+    tasks = read_tasks(args.tasks)
+
+    started = time.perf_counter()
+    results = []
+    for result in run_tasks(tasks, args.workers, args.display_base, options):
+        results.append(result)
+        status = "ok" if result["ok"] else f"FAILED ({result['error']})"
+        print(
+            f"[{len(results)}/{len(tasks)}] :{result['display']} {result['seconds']:.1f}s "
+            f"{result['turns']} turns{' (replayed)' if result['replayed'] else ''} {status} "
+            f"- {result['task'][:60]}",
+            flush=True,
+        )
+    elapsed = time.perf_counter() - started
+
+    latencies = [result["seconds"] for result in results]
+    failed = sum(1 for result in results if not result["ok"])
+    print(
+        f"\n{len(results)} tasks on {args.workers} workers in {elapsed:.1f}s: "
+        f"{len(results) / elapsed * 60:.1f} tasks/min, "
+        f"p50 {percentile(latencies, 50):.1f}s, p95 {percentile(latencies, 95):.1f}s, "
+        f"{failed} failed"
+    )
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
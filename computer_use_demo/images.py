@@ -0,0 +1,226 @@
+"""
+Tiered retention of screenshots in the conversation history.
+
+Instead of dropping every image beyond the most recent N, older screenshots are
+re-encoded in steps, e.g. full size -> half size JPEG -> thumbnail -> removed, so the
+model keeps some visual context of earlier steps while the request stays small. The
+smaller versions are encoded on the capture pool as soon as a screenshot first appears,
+and cached, so moving an image down a tier costs nothing on the event loop. They are
+kept in memory, a fraction of the original's size, and dropped with the image's entry;
+images held as `BlobRef`s don't leave derived files in the blob store.
+
+Images move down the tiers in chunks of `chunk` screenshots, like the baseline's
+`min_removal_threshold`: between moves the history only grows at the end, so the prompt
+prefix, and with it the prompt cache, stays valid.
+"""
+
+import base64
+import io
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+
+from anthropic.types.beta import BetaMessageParam
+from PIL import Image
+
+from .blobs import BlobRef
+from .executors import executor
+
+
+@dataclass(frozen=True)
+class ImageTier:
+    keep: int  # number of images held at this tier, after the ones in earlier tiers
+    scale: float  # fraction of the original width and height
+    quality: int  # JPEG quality
+
+
+@dataclass(frozen=True)
+class ImageRetentionPolicy:
+    full: int = 3  # most recent images kept as they are
+    tiers: tuple[ImageTier, ...] = (
+        ImageTier(keep=5, scale=0.5, quality=70),
+        ImageTier(keep=10, scale=0.25, quality=50),
+    )
+    # upper bound on the base64 image data in one request; the oldest images are
+    # degraded further or removed to stay under it
+    max_bytes: int = 3 * 1024 * 1024
+    # images move down a tier only once this many new ones have arrived, so each tier
+    # holds up to `chunk - 1` more than its `keep`
+    chunk: int = 5
+
+
+@dataclass
+class _Entry:
+    original: str | BlobRef  # base64 data of the full-size image
+    tier: int = 0  # 0 is the original, i is policy.tiers[i - 1]
+    versions: dict[int, Future] = field(default_factory=dict)  # tier -> base64 str
+
+
+class ImageRetention:
+    """Applies an `ImageRetentionPolicy` to the images of one conversation."""
+
+    def __init__(self, policy: ImageRetentionPolicy = ImageRetentionPolicy()):
+        self.policy = policy
+        self.removed_tier = len(policy.tiers) + 1
+        # id(base64 data) of every version in the history -> its entry
+        self._entries: dict[int, _Entry] = {}
+        # images seen so far, including removed ones, which are no longer in the history
+        self.added = 0
+        self.reencoded = 0
+
+    def apply(self, messages: list[BetaMessageParam]) -> int:
+        """Degrade or remove older images in place; returns the image bytes kept."""
+        images = _tool_result_images(messages)
+        entries = [self._entry(block) for _, block in images]
+
+        # tier each image by its age, newest first, as far as its versions are ready;
+        # the newest `slack` images don't count, so ages only shift every `chunk` images
+        targets = []
+        limit = self.policy.full
+        bounds = [limit]
+        for tier in self.policy.tiers:
+            limit += tier.keep
+            bounds.append(limit)
+        slack = self.added % max(1, self.policy.chunk)
+        for age, entry in enumerate(reversed(entries)):
+            age = max(0, age - slack)
+            wanted = next((i for i, bound in enumerate(bounds) if age < bound), self.removed_tier)
+            targets.append(self._ready_tier(entry, wanted))
+        targets.reverse()
+
+        # then push the oldest images further down until the budget is met; once over
+        # it, go a quarter below, so the next few screenshots fit without another change
+        sizes = [self._size(entry, tier) for entry, tier in zip(entries, targets)]
+        total = sum(sizes)
+        budget = self.policy.max_bytes
+        if total > budget:
+            budget -= budget // 4
+        for i, entry in enumerate(entries):
+            while total > budget and targets[i] < self.removed_tier:
+                # the next smaller version, passing over failed encodes; one still being
+                # encoded keeps the image where it is until the next call, rather than
+                # removing it, and the newer images are degraded meanwhile
+                lower = targets[i] + 1
+                while lower < self.removed_tier and _failed(entry.versions[lower]):
+                    lower += 1
+                if lower < self.removed_tier and not _ready(entry.versions[lower]):
+                    break
+                targets[i] = lower
+                total -= sizes[i]
+                sizes[i] = self._size(entry, lower)
+                total += sizes[i]
+
+        changed: dict[int, dict] = {}
+        for (tool_result, _), entry, tier in zip(images, entries, targets):
+            if tier != entry.tier:
+                entry.tier = tier
+                changed.setdefault(id(tool_result), tool_result)
+        for tool_result in changed.values():
+            new_content = []
+            for block in tool_result["content"]:
+                if _is_base64_image(block):
+                    entry = self._entries[id(block["source"]["data"])]
+                    if entry.tier == self.removed_tier:
+                        continue
+                    if entry.tier > 0:
+                        block = self._block(entry)
+                new_content.append(block)
+            # replaced rather than edited, so cached serializations see the change
+            tool_result["content"] = new_content
+
+        self._entries = {}
+        for entry in entries:
+            if entry.tier == self.removed_tier:
+                for future in entry.versions.values():
+                    future.cancel()
+                continue
+            data = entry.original if entry.tier == 0 else entry.versions[entry.tier].result()
+            self._entries[id(data)] = entry
+            self._entries[id(entry.original)] = entry
+        return total
+
+    def close(self):
+        for entry in {id(entry): entry for entry in self._entries.values()}.values():
+            for future in entry.versions.values():
+                future.cancel()
+        self._entries = {}
+
+    def _entry(self, block) -> _Entry:
+        data = block["source"]["data"]
+        entry = self._entries.get(id(data))
+        if entry is None:
+            entry = _Entry(original=data)
+            self.added += 1
+            pool = executor("capture")
+            for i, tier in enumerate(self.policy.tiers, start=1):
+                entry.versions[i] = pool.submit(self._encode, data, tier)
+            self._entries[id(data)] = entry
+        return entry
+
+    def _ready_tier(self, entry: _Entry, wanted: int) -> int:
+        """The lowest tier down to `wanted` whose version is already encoded."""
+        if wanted == self.removed_tier:
+            return wanted
+        for tier in range(wanted, entry.tier, -1):
+            if _ready(entry.versions[tier]):
+                return tier
+        return entry.tier
+
+    def _size(self, entry: _Entry, tier: int) -> int:
+        if tier == self.removed_tier:
+            return 0
+        if tier == 0:
+            return len(entry.original)
+        return len(entry.versions[tier].result())
+
+    def _block(self, entry: _Entry) -> dict:
+        return {
+            "type": "image",
+            "source": {
+                "type": "base64",
+                "media_type": "image/jpeg",
+                "data": entry.versions[entry.tier].result(),
+            },
+        }
+
+    def _encode(self, data: str | BlobRef, tier: ImageTier) -> str:
+        raw = data.read() if isinstance(data, BlobRef) else base64.b64decode(data)
+        image = Image.open(io.BytesIO(raw))
+        size = (max(1, round(image.width * tier.scale)), max(1, round(image.height * tier.scale)))
+        image = image.convert("RGB").resize(size, Image.Resampling.LANCZOS)
+        buffer = io.BytesIO()
+        image.save(buffer, format="JPEG", quality=tier.quality, optimize=True)
+        self.reencoded += 1
+        return base64.b64encode(buffer.getvalue()).decode()
+
+
+def _ready(future: Future) -> bool:
+    return future.done() and not future.cancelled() and future.exception() is None
+
+
+def _failed(future: Future) -> bool:
+    return future.done() and (future.cancelled() or future.exception() is not None)
+
+
+def _is_base64_image(block) -> bool:
+    return (
+        isinstance(block, dict)
+        and block.get("type") == "image"
+        and block.get("source", {}).get("type") == "base64"
+    )
+
+
+def _tool_result_images(messages: list[BetaMessageParam]) -> list[tuple[dict, dict]]:
+    """(tool_result, image block) for every image, oldest first."""
+    images = []
+    for message in messages:
+        if not isinstance(message["content"], list):
+            continue
+        for item in message["content"]:
+            if not (isinstance(item, dict) and item.get("type") == "tool_result"):
+                continue
+            if not isinstance(item.get("content"), list):
+                continue
+            for block in item["content"]:
+                if _is_base64_image(block):
+                    images.append((item, block))
+    return images
@@ -0,0 +1,164 @@
+"""
+Deduplicated, size-bounded store for the insights injected into the system prompt.
+"""
+
+import os
+import re
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+INSIGHTS_FILE = "insights.md"
+MAX_INSIGHTS_CHARS = 4000  # cap on the learned insights kept on disk
+DEFAULT_TOP_N = 8  # learned insights injected into a single system prompt
+
+# a curated block such as <UIHELP>...</UIHELP> ends with a closing tag on its own line
+_BLOCK_END = re.compile(r"^</[A-Za-z_][\w-]*>[ \t]*$", re.MULTILINE)
+_WORD = re.compile(r"[a-z0-9]{3,}")
+
+
+def _normalize(text: str) -> str:
+    return " ".join(text.lower().split())
+
+
+@dataclass
+class Insight:
+    """A learned insight together with its in-memory usage statistics."""
+
+    text: str
+    count: int = 1
+    last_seen: float = 0.0
+
+
+class InsightStore:
+    """
+    Keeps the curated preamble of the insights file verbatim and the learned insights
+    below it deduplicated, with hit counts and recency tracked in memory only. The file
+    is rewritten only when the set of insights changes, never for a repeat.
+
+    Safe to share between threads, as the sampling loops of concurrent sessions do.
+    """
+
+    def __init__(
+        self,
+        path: str | os.PathLike = INSIGHTS_FILE,
+        max_chars: int = MAX_INSIGHTS_CHARS,
+        top_n: int = DEFAULT_TOP_N,
+    ):
+        self.path = Path(path)
+        self.max_chars = max_chars
+        self.top_n = top_n
+        self.preamble = ""
+        self._insights: dict[str, Insight] = {}
+        self._mtime: float | None = None
+        self._dirty = False
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._insights)
+
+    def __iter__(self):
+        return iter(self._insights.values())
+
+    def load(self):
+        """(Re)load the file if it changed on disk since the last load or save."""
+        with self._lock:
+            try:
+                mtime = self.path.stat().st_mtime
+            except FileNotFoundError:
+                return
+            if mtime == self._mtime:
+                return
+
+            text = self.path.read_text()
+            block_ends = list(_BLOCK_END.finditer(text))
+            split_at = block_ends[-1].end() if block_ends else 0
+            self.preamble = text[:split_at].strip()
+
+            previous = self._insights
+            self._insights = {}
+            n_lines = 0
+            for line in text[split_at:].splitlines():
+                line = line.strip()
+                if not line:
+                    continue
+                n_lines += 1
+                key = _normalize(line)
+                if key in self._insights:
+                    self._insights[key].count += 1
+                else:
+                    # keep in-memory statistics for insights we already knew about
+                    self._insights[key] = previous.get(key) or Insight(text=line)
+            self._mtime = mtime
+            # duplicates or an over-budget file get compacted on the next save
+            if self._enforce_budget() or n_lines != len(self._insights):
+                self._dirty = True
+
+    def add(self, text: str) -> bool:
+        """Record an insight; returns True if it was new."""
+        with self._lock:
+            text = " ".join(text.split())
+            if not text:
+                return False
+            key = _normalize(text)
+            now = time.time()
+            insight = self._insights.get(key)
+            if insight is not None:
+                insight.count += 1
+                insight.last_seen = now
+                return False
+            self._insights[key] = Insight(text=text, last_seen=now)
+            self._enforce_budget()
+            self._dirty = True
+            return True
+
+    def save(self):
+        """Persist the preamble and learned insights if anything changed."""
+        with self._lock:
+            if not self._dirty:
+                return
+            body = "\n".join(insight.text for insight in self._insights.values())
+            content = "\n".join(part for part in (self.preamble, body) if part) + "\n"
+            tmp_path = self.path.with_name(self.path.name + ".tmp")
+            tmp_path.write_text(content)
+            os.replace(tmp_path, self.path)
+            self._mtime = self.path.stat().st_mtime
+            self._dirty = False
+
+    def render(self, query: str | None = None, top_n: int | None = None) -> str:
+        """
+        Return the preamble plus the top-N most relevant insights. Selected insights are
+        emitted in file order so the prompt stays byte-identical while the selection does.
+        """
+        with self._lock:
+            top_n = self.top_n if top_n is None else top_n
+            query_words = set(_WORD.findall(query.lower())) if query else set()
+            ranked = sorted(
+                self._insights.items(),
+                key=lambda item: self._score(item[1], query_words),
+                reverse=True,
+            )
+            selected = {key for key, _ in ranked[:top_n]}
+            lines = [
+                insight.text for key, insight in self._insights.items() if key in selected
+            ]
+            return "\n".join(part for part in (self.preamble, *lines) if part)
+
+    def _score(self, insight: Insight, query_words: set[str]) -> tuple[int, int, float]:
+        overlap = len(query_words & set(_WORD.findall(insight.text.lower())))
+        return overlap, insight.count, insight.last_seen
+
+    def _enforce_budget(self) -> bool:
+        """Evict the least used, least recent insights until under `max_chars`."""
+        total = sum(len(insight.text) + 1 for insight in self._insights.values())
+        if total <= self.max_chars:
+            return False
+        for key, insight in sorted(
+            self._insights.items(), key=lambda item: (item[1].count, item[1].last_seen)
+        ):
+            if total <= self.max_chars:
+                break
+            total -= len(insight.text) + 1
+            del self._insights[key]
+        return True
@@ -0,0 +1,248 @@
+"""
+Append-only session journal used to recover a conversation after a crash or restart.
+
+Each line of the journal is a JSON record `{"i": <index>, "t": <time>, "message": ...}`
+holding one message of the conversation. Image payloads are replaced by references into
+a content-addressed `BlobStore`, so the journal itself stays small and fast to parse.
+A later record for the same index replaces the earlier one.
+"""
+
+import base64
+import json
+import os
+import queue
+import threading
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+
+from .blobs import BlobRef, BlobStore
+
+if TYPE_CHECKING:
+    # importing anthropic takes over a second; the UI creates a journal before the
+    # window is shown, so the types are only imported for type checkers
+    from anthropic.types.beta import BetaMessageParam
+
+SESSIONS_DIR = "sessions"
+
+_CLOSE = object()
+
+
+class SessionJournal:
+    """
+    Journals the messages of a conversation as they complete. Snapshots are taken on the
+    caller's thread; blob hashing, encoding and file writes happen on a writer thread.
+    """
+
+    def __init__(
+        self,
+        path: str | os.PathLike,
+        blob_store: BlobStore | None = None,
+        start_index: int = 0,
+    ):
+        self.path = Path(path)
+        self.blob_store = blob_store or BlobStore(self.path.parent / "blobs")
+        self._written = start_index
+        self._last_signature: tuple | None = None
+        self._queue: queue.Queue = queue.Queue()
+        self._thread: threading.Thread | None = None
+        self._error: BaseException | None = None
+
+    @classmethod
+    def new(cls, sessions_dir: str | os.PathLike = SESSIONS_DIR) -> "SessionJournal":
+        """Start a journal for a new session in `sessions_dir`."""
+        name = time.strftime("%Y%m%d-%H%M%S") + f"-{os.getpid()}.jsonl"
+        return cls(Path(sessions_dir) / name)
+
+    @classmethod
+    def resume(
+        cls,
+        path: str | os.PathLike,
+        only_n_most_recent_images: int | None = None,
+    ) -> "tuple[SessionJournal, list[BetaMessageParam]]":
+        """Load the messages journaled at `path` and keep appending to the same file."""
+        journal = cls(path)
+        messages = load_messages(path, journal.blob_store, only_n_most_recent_images)
+        journal._written = len(messages)
+        if messages:
+            journal._last_signature = _signature(messages[-1])
+        return journal, messages
+
+    def sync(self, messages: "list[BetaMessageParam]"):
+        """
+        Journal every message not written yet. Call this only when all of `messages` are
+        complete, e.g. right before an API call or after the final turn, except for a
+        trailing turn of tool results still being filled in: the results it holds must be
+        final, and it is journaled again as it grows. On resume, the tool uses it doesn't
+        answer yet are closed as interrupted.
+        """
+        if self._error:
+            error, self._error = self._error, None
+            raise error
+        start = self._written
+        # a message already written may have been extended since (e.g. a follow-up
+        # user message merged into a trailing user turn); journal it again
+        if start and start <= len(messages):
+            if _signature(messages[start - 1]) != self._last_signature:
+                start -= 1
+        for index in range(start, len(messages)):
+            self._submit(index, messages[index])
+        if len(messages) > start:
+            self._written = len(messages)
+            self._last_signature = _signature(messages[-1])
+
+    def flush(self):
+        """Block until everything submitted so far is on disk."""
+        if self._thread:
+            self._queue.join()
+
+    def close(self):
+        if self._thread:
+            self._queue.put(_CLOSE)
+            self._thread.join()
+            self._thread = None
+
+    def _submit(self, index: int, message: "BetaMessageParam"):
+        if self._thread is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._thread = threading.Thread(
+                target=self._writer, name="session-journal", daemon=True
+            )
+            self._thread.start()
+        self._queue.put((index, time.time(), _snapshot(message)))
+
+    def _writer(self):
+        with open(self.path, "a", encoding="utf-8") as f:
+            while True:
+                item = self._queue.get()
+                try:
+                    if item is _CLOSE:
+                        return
+                    index, timestamp, message = item
+                    record = {
+                        "i": index,
+                        "t": round(timestamp, 3),
+                        "message": self._externalize_images(message),
+                    }
+                    f.write(json.dumps(record, separators=(",", ":")) + "\n")
+                    if self._queue.empty():
+                        f.flush()
+                except BaseException as e:
+                    self._error = e
+                finally:
+                    self._queue.task_done()
+
+    def _externalize_images(self, value: Any) -> Any:
+        """Replace base64 image sources with references into the blob store."""
+        if isinstance(value, list):
+            return [self._externalize_images(item) for item in value]
+        if not isinstance(value, dict):
+            return value
+        source = value.get("source")
+        if (
+            value.get("type") == "image"
+            and isinstance(source, dict)
+            and source.get("type") == "base64"
+        ):
+            data = source["data"]
+            if isinstance(data, BlobRef) and data.store.root == self.blob_store.root:
+                digest = data.digest  # already stored by the loop
+            elif isinstance(data, BlobRef):
+                digest = self.blob_store.put(data.read())
+            else:
+                digest = self.blob_store.put(base64.b64decode(data))
+            return {
+                **value,
+                "source": {
+                    "type": "blob",
+                    "media_type": source.get("media_type"),
+                    "sha256": digest,
+                },
+            }
+        return {key: self._externalize_images(item) for key, item in value.items()}
+
+
+def load_messages(
+    path: str | os.PathLike,
+    blob_store: BlobStore | None = None,
+    only_n_most_recent_images: int | None = None,
+) -> "list[BetaMessageParam]":
+    """
+    Rebuild the messages of a journal. Images come back as `BlobRef`s into the blob
+    store, so none is read until a request is serialized; the ones past
+    `only_n_most_recent_images` are dropped, as `sampling_loop` would drop them anyway.
+    """
+    path = Path(path)
+    blob_store = blob_store or BlobStore(path.parent / "blobs")
+    by_index: dict[int, Any] = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # a torn final line from a crash mid-write
+                break
+            by_index[record["i"]] = record["message"]
+    messages = [by_index[i] for i in range(len(by_index)) if i in by_index]
+
+    image_blocks = [
+        (container, position)
+        for message in messages
+        for container, position in _iter_image_blocks(message["content"])
+    ]
+    n_to_keep = only_n_most_recent_images or len(image_blocks)
+    n_to_drop = max(0, len(image_blocks) - n_to_keep)
+    for container, position in image_blocks[:n_to_drop]:
+        container[position] = None
+    for container, position in image_blocks[n_to_drop:]:
+        block = container[position]
+        source = block["source"]
+        digest = source["sha256"]
+        size = blob_store.path(digest).stat().st_size
+        block["source"] = {
+            "type": "base64",
+            "media_type": source["media_type"],
+            "data": BlobRef(blob_store, digest, size),
+        }
+    for message in messages:
+        _drop_removed(message["content"])
+    return messages
+
+
+def _iter_image_blocks(value: Any):
+    if isinstance(value, list):
+        for position, item in enumerate(value):
+            if isinstance(item, dict) and item.get("type") == "image":
+                if item.get("source", {}).get("type") == "blob":
+                    yield value, position
+            else:
+                yield from _iter_image_blocks(item)
+    elif isinstance(value, dict):
+        for item in value.values():
+            yield from _iter_image_blocks(item)
+
+
+def _drop_removed(value: Any):
+    if isinstance(value, list):
+        value[:] = [item for item in value if item is not None]
+        for item in value:
+            _drop_removed(item)
+    elif isinstance(value, dict):
+        for item in value.values():
+            _drop_removed(item)
+
+
+def _snapshot(message: Any) -> Any:
+    """Detach a message from later in-place edits; strings are shared, not copied."""
+    if hasattr(message, "model_dump"):
+        return message.model_dump(mode="json", exclude_unset=True)
+    if isinstance(message, list):
+        return [_snapshot(item) for item in message]
+    if isinstance(message, dict):
+        return {key: _snapshot(item) for key, item in message.items()}
+    return message
+
+
+def _signature(message: "BetaMessageParam") -> tuple:
+    content = message["content"]
+    return (message["role"], id(content), len(content))
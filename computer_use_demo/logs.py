@@ -0,0 +1,217 @@
+"""
+Structured logging for the agent, handed off to a background thread.
+
+Modules log through `get_logger(__name__)`, whose keyword arguments become fields of the
+record rather than being formatted into the message:
+
+    logger.info("Executing tool", tool=name, input=tool_input)
+
+`configure_logging` (called by the entry points) installs a handler that only puts
+records on a bounded queue; formatting and writing happen on a listener thread, so a
+slow terminal or a flood of records doesn't hold up the event loop. When the queue is
+full, records are dropped and counted instead of blocking. Long field values are
+truncated in the middle, keeping both ends, and high-volume messages can be sampled.
+
+Settings come from the arguments or from the environment:
+
+- `COMPUTER_USE_LOG_LEVEL`: `DEBUG`, `INFO` (default), `WARNING`, ...
+- `COMPUTER_USE_LOG_FORMAT`: `text` (default) or `json`, one object per line
+- `COMPUTER_USE_LOG_SAMPLE`: e.g. `Performing action=10,Executing tool=5` keeps one
+  record in 10 (resp. 5) with that message; kept records carry a `sample_rate` field
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import time
+from typing import Any, TextIO
+
+LEVEL_ENV = "COMPUTER_USE_LOG_LEVEL"
+FORMAT_ENV = "COMPUTER_USE_LOG_FORMAT"
+SAMPLE_ENV = "COMPUTER_USE_LOG_SAMPLE"
+
+MAX_FIELD_CHARS = 2000  # per string in a record's fields
+MAX_TRACEBACK_CHARS = 8000
+QUEUE_SIZE = 10000  # records waiting to be written before new ones are dropped
+
+ROOT_LOGGER = "computer_use_demo"
+
+
+class StructuredLogger(logging.LoggerAdapter):
+    """A logger whose keyword arguments, other than logging's own, are structured fields."""
+
+    _LOGGING_KWARGS = frozenset({"exc_info", "stack_info", "stacklevel", "extra"})
+
+    def process(self, msg, kwargs):
+        fields = {key: kwargs.pop(key) for key in list(kwargs) if key not in self._LOGGING_KWARGS}
+        kwargs["extra"] = {**(kwargs.get("extra") or {}), "fields": fields}
+        return msg, kwargs
+
+
+def get_logger(name: str) -> StructuredLogger:
+    return StructuredLogger(logging.getLogger(name), {})
+
+
+def truncate(value: Any, limit: int = MAX_FIELD_CHARS) -> Any:
+    """`value` with every string over `limit` characters cut in the middle."""
+    if isinstance(value, str):
+        if len(value) <= limit:
+            return value
+        half = limit // 2
+        return f"{value[:half]}...[{len(value) - 2 * half} chars]...{value[-half:]}"
+    if isinstance(value, dict):
+        return {key: truncate(item, limit) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [truncate(item, limit) for item in value]
+    if isinstance(value, (int, float, bool)) or value is None:
+        return value
+    return truncate(str(value), limit)
+
+
+class StructuredFormatter(logging.Formatter):
+    """Formats a record and its fields as text, or as one JSON object per line."""
+
+    def __init__(self, json_lines: bool = False, max_field_chars: int = MAX_FIELD_CHARS):
+        super().__init__()
+        self.json_lines = json_lines
+        self.max_field_chars = max_field_chars
+
+    def format(self, record: logging.LogRecord) -> str:
+        fields = truncate(getattr(record, "fields", None) or {}, self.max_field_chars)
+        if getattr(record, "sample_rate", None):
+            fields["sample_rate"] = record.sample_rate
+        error = (
+            truncate(self.formatException(record.exc_info), MAX_TRACEBACK_CHARS)
+            if record.exc_info
+            else None
+        )
+        if self.json_lines:
+            data = {
+                "ts": round(record.created, 6),
+                "level": record.levelname,
+                "logger": record.name,
+                "message": record.getMessage(),
+                **fields,
+            }
+            if error:
+                data["exc"] = error
+            return json.dumps(data, ensure_ascii=False, default=str)
+        timestamp = time.strftime("%H:%M:%S", time.localtime(record.created))
+        text = f"{timestamp} {record.levelname} {record.name}: {record.getMessage()}"
+        if fields:
+            text += " " + " ".join(
+                f"{key}={json.dumps(value, ensure_ascii=False, default=str)}"
+                for key, value in fields.items()
+            )
+        return f"{text}\n{error}" if error else text
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps one record in `rates[message]` for the messages listed; others all pass."""
+
+    def __init__(self, rates: dict[str, int]):
+        super().__init__()
+        self.rates = rates
+        self.seen: dict[str, int] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        rate = self.rates.get(record.msg)
+        if not rate or rate <= 1:
+            return True
+        seen = self.seen[record.msg] = self.seen.get(record.msg, 0) + 1
+        record.sample_rate = rate
+        return seen % rate == 1
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """Queues records as they are; they are formatted on the listener thread."""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # QueueHandler formats here, on the caller's thread; the listener runs in this
+        # process, so the record can be handed over unformatted
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class _QueueListener(logging.handlers.QueueListener):
+    def enqueue_sentinel(self):
+        # wait for room, so the records still queued are written before exiting
+        self.queue.put(self._sentinel)
+
+
+_listener: _QueueListener | None = None
+_handler: _QueueHandler | None = None
+
+
+def configure_logging(
+    level: str | int | None = None,
+    json_lines: bool | None = None,
+    sample: dict[str, int] | None = None,
+    stream: TextIO | None = None,
+    max_field_chars: int = MAX_FIELD_CHARS,
+) -> _QueueHandler:
+    """
+    Send the records of this package to `stream` (stderr by default) through a queue and
+    a listener thread. Calling it again replaces the previous configuration.
+    """
+    global _listener, _handler
+    level = level or os.getenv(LEVEL_ENV, "INFO").upper()
+    if json_lines is None:
+        json_lines = os.getenv(FORMAT_ENV, "text").lower() == "json"
+    if sample is None:
+        sample = _parse_sample(os.getenv(SAMPLE_ENV, ""))
+
+    output = logging.StreamHandler(stream or sys.stderr)
+    output.setFormatter(StructuredFormatter(json_lines, max_field_chars))
+    handler = _QueueHandler(queue.Queue(QUEUE_SIZE))
+    if sample:
+        handler.addFilter(SamplingFilter(sample))
+
+    logger = logging.getLogger(ROOT_LOGGER)
+    if _handler:
+        logger.removeHandler(_handler)
+    stop_logging()
+    _handler = handler
+    logger.addHandler(handler)
+    logger.setLevel(level)
+    logger.propagate = False
+
+    _listener = _QueueListener(handler.queue, output)
+    _listener.start()
+    return handler
+
+
+def stop_logging():
+    """Write out the records still queued and stop the listener thread."""
+    global _listener
+    if _listener:
+        _listener.stop()
+        _listener = None
+        if _handler.dropped:
+            print(f"logging: dropped {_handler.dropped} records", file=sys.stderr)
+            _handler.dropped = 0
+
+
+atexit.register(stop_logging)
+
+
+def _parse_sample(value: str) -> dict[str, int]:
+    rates = {}
+    for item in value.split(","):
+        message, _, rate = item.rpartition("=")
+        if message.strip() and rate.strip().isdigit():
+            rates[message.strip()] = int(rate)
+    return rates
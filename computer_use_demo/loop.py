@@ -2,17 +2,28 @@
 Agentic sampling loop that calls the Anthropic API and local implenmentation of anthropic-defined computer use tools.
 """
 
+import asyncio
+import base64
+import inspect
+import json
 import platform
-import os  # Add this import statement
+import random
+import re
 import time
 from pathlib import Path
-from collections.abc import Callable
-from datetime import datetime
+from collections.abc import AsyncIterator, Awaitable, Callable
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
 from enum import StrEnum
 from typing import Any, cast
-import traceback
 
-from anthropic import Anthropic, AnthropicBedrock, AnthropicVertex, APIResponse
+from anthropic import (
+    AsyncAnthropic,
+    APIConnectionError,
+    APIStatusError,
+)
+from anthropic._constants import RAW_RESPONSE_HEADER
 from anthropic.types import (
     ToolResultBlockParam,
 )
@@ -26,10 +37,38 @@ from anthropic.types.beta import (
     BetaToolResultBlockParam,
 )
 
-from .tools import BashTool, ComputerTool, EditTool, ToolCollection, ToolResult
+from .blobs import BlobRef, BlobStore
+from .events import (
+    AgentEvent,
+    TextEvent,
+    TimingEvent,
+    ToolResultEvent,
+    ToolStartEvent,
+    UsageEvent,
+)
+from .executors import run_blocking, watch_event_loop
+from .images import ImageRetention
+from .insights import INSIGHTS_FILE, InsightStore
+from .journal import SessionJournal
+from .logs import get_logger
+from .ratelimit import RateLimitScheduler, scheduler
+from .tracing import tracer
+from .tools import (
+    BashTool,
+    ComputerTool,
+    EditTool,
+    PacingProfile,
+    SearchTool,
+    ToolCollection,
+    ToolResult,
+    WaitTool,
+    ZoomTool,
+)
 
 BETA_FLAG = "computer-use-2024-10-22"
 
+logger = get_logger(__name__)
+
 
 class APIProvider(StrEnum):
     ANTHROPIC = "anthropic"
@@ -49,14 +88,18 @@ PROVIDER_TO_DEFAULT_MODEL_NAME: dict[APIProvider, str] = {
 # We encourage modifying this system prompt to ensure the model has context for the
 # environment it is running in, and to provide any additional information that may be
 # helpful for the task at hand.
-SYSTEM_PROMPT = f"""<SYSTEM_CAPABILITY>
-* You are utilizing a MacOS computer using {platform.machine()} architecture with internet access.
+# Formatted on first use rather than at import, so the date is the one the task runs on.
+_SYSTEM_PROMPT_TEMPLATE = """<SYSTEM_CAPABILITY>
+* You are utilizing a MacOS computer using {machine} architecture with internet access.
 * You can use the bash tool to execute commands in the terminal.
 * To open applications, you can use the `open` command in the bash tool. For example, `open -a Arc` to open the Arc browser.
 * When using your bash tool with commands that are expected to output very large quantities of text, redirect the output into a temporary file and use `str_replace_editor` or `grep -n -B <lines before> -A <lines after> <query> <filename>` to inspect the output.
 * When viewing a page, it can be helpful to zoom out so that you can see everything on the page. Alternatively, ensure you scroll down to see everything before deciding something isn't available.
+* To read small text or check details in a screenshot, use the zoom tool on that region instead of zooming the page and taking another screenshot.
+* While a page loads, an app starts or a command runs, use wait_for_screen_change instead of taking screenshots repeatedly.
+* To find code or text in files, use the search tool on the directory rather than running `grep -rn` or `find` in bash.
 * When using your computer function calls, they may take a while to run and send back to you. Where possible and feasible, try to chain multiple of these calls into one function call request.
-* The current date is {datetime.today().strftime('%A, %B %-d, %Y')}.
+* The current date is {date}.
 * To search for applications, you can use Raycast via Command+Space.
 </SYSTEM_CAPABILITY>
 
@@ -68,6 +111,61 @@ SYSTEM_PROMPT = f"""<SYSTEM_CAPABILITY>
 </IMPORTANT>"""
 
 
+def system_prompt() -> str:
+    return _SYSTEM_PROMPT_TEMPLATE.format(
+        machine=platform.machine(),
+        date=datetime.today().strftime("%A, %B %-d, %Y"),
+    )
+
+
+def __getattr__(name: str):
+    # SYSTEM_PROMPT used to be a module constant
+    if name == "SYSTEM_PROMPT":
+        return system_prompt()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+# 529 is returned when the API is overloaded
+RETRYABLE_STATUS_CODES = frozenset({408, 409, 429, 500, 502, 503, 504, 529})
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """Exponential backoff with full jitter for a single API call."""
+
+    max_attempts: int = 6
+    base_delay: float = 1.0  # seconds
+    max_delay: float = 60.0  # seconds
+
+    def backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+
+
+DEFAULT_RETRY_POLICY = RetryPolicy()
+
+# sending a pre-serialized body needs `content=`, which older SDKs don't accept
+_POST_ACCEPTS_CONTENT = "content" in inspect.signature(AsyncAnthropic.post).parameters
+
+# input tokens assumed for the first call of a loop, before usage has been reported
+INITIAL_INPUT_TOKENS_ESTIMATE = 4000
+
+
+def create_tool_collection(
+    backend=None, display_num: int | None = None, pacing: PacingProfile | None = None
+) -> ToolCollection:
+    """The tools the agent is given, sharing one `ComputerTool` on `backend`."""
+    computer = ComputerTool(backend, display_num=display_num, pacing=pacing)
+    editor = EditTool()
+    return ToolCollection(
+        computer,
+        ZoomTool(computer),
+        WaitTool(computer),
+        BashTool(),
+        editor,
+        SearchTool(editor),
+    )
+
+
 async def sampling_loop(
     *,
     model: str,
@@ -76,114 +174,633 @@ async def sampling_loop(
     messages: list[BetaMessageParam],
     output_callback: Callable[[BetaContentBlock], None],
     tool_output_callback: Callable[[ToolResult, str], None],
-    api_response_callback: Callable[[APIResponse[BetaMessage]], None],
+    api_response_callback: Callable[[Any], None],
     api_key: str,
     only_n_most_recent_images: int | None = None,
     max_tokens: int = 4096,
+    retry_policy: RetryPolicy = DEFAULT_RETRY_POLICY,
+    journal: SessionJournal | None = None,
+    tool_collection: ToolCollection | None = None,
+    rate_limiter: RateLimitScheduler = scheduler,
+    image_retention: ImageRetention | None = None,
+    blob_store: BlobStore | None = None,
 ):
     """
     Agentic sampling loop for the assistant/tool interaction of computer use.
+
+    `messages` is extended in place one completed turn at a time, so if this raises,
+    calling it again with the same list resumes after the last completed turn without
+    re-running any tool. If a `journal` is given, every completed message is appended
+    to it so the session can be resumed after a crash. With `image_retention`, older
+    screenshots are re-encoded at lower resolution in steps instead of being dropped
+    past `only_n_most_recent_images`. With a `blob_store`, screenshots are kept on disk
+    and `messages` only holds `BlobRef` handles to them.
+
+    `api_response_callback` gets the raw response of every call: an `AsyncAPIResponse`,
+    or on older SDKs such as 0.37 a `LegacyAPIResponse`, whose `parse()` is synchronous.
     """
-    tool_collection = ToolCollection(
-        ComputerTool(),
-        BashTool(),
-        EditTool(),
+
+    async def emit(event: AgentEvent):
+        if isinstance(event, (TextEvent, ToolStartEvent)):
+            output_callback(event.block)
+        elif isinstance(event, ToolResultEvent):
+            tool_output_callback(event.result, event.tool_use_id)
+
+    return await _run_sampling_loop(
+        model=model,
+        provider=provider,
+        system_prompt_suffix=system_prompt_suffix,
+        messages=messages,
+        emit=emit,
+        api_response_callback=api_response_callback,
+        api_key=api_key,
+        only_n_most_recent_images=only_n_most_recent_images,
+        max_tokens=max_tokens,
+        retry_policy=retry_policy,
+        journal=journal,
+        tool_collection=tool_collection,
+        rate_limiter=rate_limiter,
+        image_retention=image_retention,
+        blob_store=blob_store,
     )
-    
-    # Read insights from the file
-    if os.path.exists(INSIGHTS_FILE):
-        with open(INSIGHTS_FILE, "r") as f:
-            insights = f.read()
-    else:
-        insights = ""
+
+
+class _StreamEnd:
+    def __init__(self, error: BaseException | None = None):
+        self.error = error
+
+
+async def stream_sampling_loop(
+    *,
+    max_pending_events: int = 256,
+    **kwargs,
+) -> AsyncIterator[AgentEvent]:
+    """
+    Run the sampling loop and yield its events as they happen. Takes the same keyword
+    arguments as `sampling_loop`, minus the callbacks.
+
+    Text comes as one `TextEvent` per text block of a response, not as token deltas;
+    see `TextEvent`.
+
+    Events are handed over through a queue of `max_pending_events`. When a slow
+    consumer lets it fill up, droppable events (timings) are discarded and counted in
+    `dropped_events`; other events make the loop wait at the next step boundary, never
+    in the middle of a tool call. Closing the generator early cancels the loop.
+    """
+    queue: asyncio.Queue = asyncio.Queue(maxsize=max_pending_events)
+    stats = {"dropped_events": 0}
+
+    async def emit(event: AgentEvent):
+        if event.droppable and queue.full():
+            stats["dropped_events"] += 1
+            return
+        await queue.put(event)
+
+    async def produce():
+        try:
+            await _run_sampling_loop(emit=emit, **kwargs)
+        except asyncio.CancelledError:
+            raise
+        except BaseException as e:
+            await queue.put(_StreamEnd(e))
+            raise
+        await queue.put(_StreamEnd())
+
+    producer = asyncio.create_task(produce())
+    try:
+        while True:
+            event = await queue.get()
+            if isinstance(event, _StreamEnd):
+                if event.error is not None:
+                    raise event.error
+                return
+            yield event
+    finally:
+        if not producer.done():
+            producer.cancel()
+        # retrieve the producer's outcome so it isn't reported as never retrieved
+        await asyncio.gather(producer, return_exceptions=True)
+        if stats["dropped_events"]:
+            logger.warning("Dropped stream events", dropped=stats["dropped_events"])
+
+
+async def _run_sampling_loop(*, tool_collection: ToolCollection | None = None, **kwargs):
+    if tool_collection is not None:
+        # the caller's collection outlives this call, e.g. for the whole chat session
+        return await _run_turns(tool_collection=tool_collection, **kwargs)
+    tool_collection = create_tool_collection()
+    try:
+        return await _run_turns(tool_collection=tool_collection, **kwargs)
+    finally:
+        await tool_collection.shutdown()
+
+
+async def _run_turns(
+    *,
+    model: str,
+    provider: APIProvider,
+    system_prompt_suffix: str,
+    messages: list[BetaMessageParam],
+    emit: Callable[[AgentEvent], Awaitable[None]],
+    api_key: str,
+    api_response_callback: Callable[[Any], None] | None = None,
+    only_n_most_recent_images: int | None = None,
+    max_tokens: int = 4096,
+    retry_policy: RetryPolicy = DEFAULT_RETRY_POLICY,
+    journal: SessionJournal | None = None,
+    tool_collection: ToolCollection,
+    rate_limiter: RateLimitScheduler = scheduler,
+    image_retention: ImageRetention | None = None,
+    blob_store: BlobStore | None = None,
+):
+    # reports callbacks that block the event loop, if COMPUTER_USE_LOOP_WATCHDOG_MS is set
+    watch_event_loop()
+
+    # Inject only the most relevant insights so the system prompt stays small and stable
+    with tracer.span("insights.load"):
+        insights = await run_blocking("io", _load_insights, _latest_user_text(messages))
 
     system = (
-        f"{SYSTEM_PROMPT}\n<PREPROMPT_INSIGHTS>\n{insights}\n</PREPROMPT_INSIGHTS>"
+        f"{system_prompt()}\n<PREPROMPT_INSIGHTS>\n{insights}\n</PREPROMPT_INSIGHTS>"
         f"{' ' + system_prompt_suffix if system_prompt_suffix else ''}"
     )
 
     action_count = 0  # Counter to track actions
 
     # Delete old screenshots at the start of the loop
-    delete_old_screenshots()
+    with tracer.span("screenshots.cleanup"):
+        await run_blocking("io", delete_old_screenshots)
+
+    # Retries are handled per call below, so the SDK's own retries are disabled
+    # building a client loads the CA bundle, which takes a while
+    client = await run_blocking("io", _create_client, provider, api_key)
+
+    _close_interrupted_tool_uses(messages)
+    input_tokens_estimate = INITIAL_INPUT_TOKENS_ESTIMATE
+    # Bedrock and Vertex rewrite the request body in the SDK, so only the first-party
+    # API gets the cached serialization
+    payload_builder = (
+        PayloadBuilder()
+        if provider == APIProvider.ANTHROPIC and _POST_ACCEPTS_CONTENT
+        else None
+    )
 
     while True:
-        if only_n_most_recent_images:
-            _maybe_filter_to_n_most_recent_images(messages, only_n_most_recent_images)
+        with tracer.span("loop.turn", messages=len(messages)):
+            if journal:
+                # everything in messages is complete at this point
+                with tracer.span("journal.sync"):
+                    journal.sync(messages)
+
+            if image_retention:
+                # tiered re-encoding replaces the all-or-nothing filter below
+                with tracer.span("images.retain") as span:
+                    span.set(bytes=image_retention.apply(messages))
+            elif only_n_most_recent_images:
+                with tracer.span("images.filter"):
+                    _maybe_filter_to_n_most_recent_images(messages, only_n_most_recent_images)
+
+            try:
+                # Call the API
+                api_started = time.perf_counter()
+                raw_response = await _create_with_retry(
+                    client,
+                    retry_policy,
+                    rate_limiter,
+                    provider,
+                    input_tokens_estimate,
+                    payload_builder,
+                    max_tokens=max_tokens,
+                    messages=messages,
+                    model=model,
+                    system=system,
+                    tools=tool_collection.to_params(),
+                    betas=[BETA_FLAG],
+                )
+
+                if api_response_callback:
+                    api_response_callback(raw_response)
+
+                # parsed once here; every consumer works from the typed events below
+                response = await _parse_response(raw_response)
+                # the next request is this one plus a turn, so this is a fair estimate
+                input_tokens_estimate = (
+                    response.usage.input_tokens
+                    + (response.usage.cache_creation_input_tokens or 0)
+                    + (response.usage.cache_read_input_tokens or 0)
+                    + response.usage.output_tokens
+                )
+                await emit(TimingEvent(phase="api", seconds=time.perf_counter() - api_started))
+                await emit(
+                    UsageEvent(
+                        input_tokens=response.usage.input_tokens,
+                        output_tokens=response.usage.output_tokens,
+                        cache_creation_input_tokens=response.usage.cache_creation_input_tokens,
+                        cache_read_input_tokens=response.usage.cache_read_input_tokens,
+                    )
+                )
+
+                assistant_message: BetaMessageParam = {
+                    "role": "assistant",
+                    "content": cast(list[BetaContentBlockParam], response.content),
+                }
+                # Commit the turn before running tools, and record each result as soon as
+                # it exists, so an interruption never causes a tool to be replayed
+                messages.append(assistant_message)
+                tool_result_content: list[BetaToolResultBlockParam] = []
+                if any(block.type == "tool_use" for block in response.content):
+                    messages.append({"role": "user", "content": tool_result_content})
+                if journal:
+                    # a crash while the tools run must not lose the turn that ran them
+                    with tracer.span("journal.sync"):
+                        journal.sync(messages)
+
+                for content_block in cast(list[BetaContentBlock], response.content):
+                    if content_block.type == "text":
+                        await emit(TextEvent(text=content_block.text, block=content_block))
+                    if content_block.type == "tool_use":
+                        await emit(
+                            ToolStartEvent(
+                                tool_use_id=content_block.id,
+                                name=content_block.name,
+                                input=cast(dict[str, Any], content_block.input),
+                                block=content_block,
+                            )
+                        )
+                        tool_started = time.perf_counter()
+                        try:
+                            logger.info(
+                                "Executing tool",
+                                tool=content_block.name,
+                                input=content_block.input,
+                            )
+                            result = await tool_collection.run(
+                                name=content_block.name,
+                                tool_input=cast(dict[str, Any], content_block.input),
+                            )
+                        except Exception as e:
+                            error_message = f"Error in tool execution: {str(e)}"
+                            logger.exception("Tool failed", tool=content_block.name)
+                            result = ToolResult(error=error_message)
+
+                        tool_result = make_api_tool_result(result, content_block.id)
+                        if blob_store and result.base64_image:
+                            # the history keeps a handle; the data is read back from
+                            # disk only while a request body is serialized
+                            with tracer.span("images.store"):
+                                await run_blocking("io", _store_images, tool_result, blob_store)
+                        tool_result_content.append(tool_result)
+                        if journal:
+                            with tracer.span("journal.sync"):
+                                journal.sync(messages)
+                        await emit(
+                            TimingEvent(
+                                phase="tool",
+                                seconds=time.perf_counter() - tool_started,
+                                name=content_block.name,
+                            )
+                        )
+                        await emit(
+                            ToolResultEvent(
+                                tool_use_id=content_block.id,
+                                name=content_block.name,
+                                result=result,
+                            )
+                        )
+
+                        # Generate an insight every few actions
+                        action_count += 1
+                        if action_count % 5 == 0:  # Adjust the frequency as needed
+                            insight = generate_insight(result, [_latest_user_text(messages)])
+                            with tracer.span("insights.save"):
+                                await run_blocking("io", _save_insight, insight)
+
+                if not tool_result_content:
+                    # If there are no tool results, we're done with this iteration
+                    if journal:
+                        journal.sync(messages)
+                    return messages
 
-        if provider == APIProvider.ANTHROPIC:
-            client = Anthropic(api_key=api_key)
-        elif provider == APIProvider.VERTEX:
-            client = AnthropicVertex()
-        elif provider == APIProvider.BEDROCK:
-            client = AnthropicBedrock()
+            except Exception:
+                logger.exception("API call failed")
+                raise
 
+
+async def _create_with_retry(
+    client,
+    retry_policy: RetryPolicy,
+    rate_limiter: RateLimitScheduler,
+    provider: APIProvider,
+    input_tokens_estimate: int,
+    payload_builder: "PayloadBuilder | None",
+    **kwargs,
+):
+    """Create a message, pacing it within rate limits and retrying transient failures."""
+    model = kwargs["model"]
+    if payload_builder is None:
+        kwargs["messages"] = await run_blocking("io", _resolve_blobs, kwargs["messages"])
+
+        def create():
+            return client.beta.messages.with_raw_response.create(**kwargs)
+
+    else:
+        betas = kwargs.pop("betas", [])
+        with tracer.span("api.serialize") as span:
+            # reads and encodes the images kept on disk, so it stays off the event loop
+            body = await run_blocking("io", payload_builder.build, **kwargs)
+            span.set(bytes=len(body))
+        headers = {"Content-Type": "application/json", RAW_RESPONSE_HEADER: "true"}
+        if betas:
+            headers["anthropic-beta"] = ",".join(betas)
+
+        # the same request `with_raw_response.create` makes, with the body pre-encoded
+        def create():
+            return client.post(
+                "/v1/messages?beta=true",
+                cast_to=BetaMessage,
+                content=body,
+                options={"headers": headers},
+            )
+    for attempt in range(retry_policy.max_attempts):
+        reservation = await rate_limiter.acquire(
+            provider, model, input_tokens_estimate, kwargs["max_tokens"]
+        )
         try:
-            # Call the API
-            raw_response = client.beta.messages.with_raw_response.create(
-                max_tokens=max_tokens,
-                messages=messages,
-                model=model,
-                system=system,
-                tools=tool_collection.to_params(),
-                betas=["computer-use-2024-10-22"],
+            with tracer.span("api.call", attempt=attempt + 1) as span:
+                raw_response = await create()
+                span.set(bytes=len(raw_response.http_response.content))
+            # cached by the response, so the caller's parse() doesn't repeat it
+            response = await _parse_response(raw_response)
+            rate_limiter.observe(
+                provider,
+                model,
+                raw_response.headers,
+                reservation=reservation,
+                usage=response.usage,
+            )
+            return raw_response
+        except (APIConnectionError, APIStatusError) as e:
+            retry_after = (
+                _parse_retry_after(e.response.headers)
+                if isinstance(e, APIStatusError)
+                else None
             )
+            if isinstance(e, APIStatusError):
+                rate_limiter.observe(
+                    provider,
+                    model,
+                    e.response.headers,
+                    retry_after if e.status_code == 429 else None,
+                    reservation=reservation,
+                )
+                if e.status_code not in RETRYABLE_STATUS_CODES:
+                    raise
+            rate_limiter.release(reservation)
+            if attempt + 1 >= retry_policy.max_attempts:
+                raise
+            delay = retry_policy.backoff(attempt)
+            if retry_after is not None:
+                # the server knows best; add a little jitter so sessions don't align
+                delay = min(retry_after, retry_policy.max_delay) + delay / 10
+            logger.warning(
+                "Retrying API call",
+                error=type(e).__name__,
+                delay=round(delay, 1),
+                attempt=attempt + 2,
+                max_attempts=retry_policy.max_attempts,
+            )
+            await asyncio.sleep(delay)
+        finally:
+            # on cancellation and unexpected errors; does nothing once released
+            rate_limiter.release(reservation)
+    raise AssertionError("unreachable")
 
-            api_response_callback(cast(APIResponse[BetaMessage], raw_response))
-
-            response = raw_response.parse()
-
-            assistant_message: BetaMessageParam = {
-                "role": "assistant",
-                "content": cast(list[BetaContentBlockParam], response.content),
-            }
-
-            tool_result_content: list[BetaToolResultBlockParam] = []
-            for content_block in cast(list[BetaContentBlock], response.content):
-                output_callback(content_block)
-                if content_block.type == "tool_use":
-                    try:
-                        print(f"Executing tool: {content_block.name}")
-                        print(f"Tool input: {content_block.input}")
-                        result = await tool_collection.run(
-                            name=content_block.name,
-                            tool_input=cast(dict[str, Any], content_block.input),
-                        )
-                    except Exception as e:
-                        error_message = f"Error in tool execution: {str(e)}"
-                        print(f"Encountered error: {error_message}")
-                        print(f"Error type: {type(e)}")
-                        print(f"Error traceback: {traceback.format_exc()}")
-                        result = ToolResult(error=error_message)
-
-                    tool_result = _make_api_tool_result(result, content_block.id)
-                    tool_result_content.append(tool_result)
-                    tool_output_callback(result, content_block.id)
-
-                    # Generate an insight every few actions
-                    action_count += 1
-                    if action_count % 5 == 0:  # Adjust the frequency as needed
-                        recent_inputs = [msg["content"] for msg in messages[-5:] if msg["role"] == "user"]
-                        insight = generate_insight(result, recent_inputs)
-                        append_insight_to_file(insight)
-
-            messages.append(assistant_message)
-
-            if tool_result_content:
-                tool_results_message: BetaMessageParam = {
-                    "role": "user",
-                    "content": tool_result_content,
-                }
-                messages.append(tool_results_message)
+
+class PayloadBuilder:
+    """
+    Serializes request bodies, reusing the JSON of messages that haven't changed since
+    the previous call. Only the messages added or edited since then are encoded, which
+    keeps the cost of a call flat as the history (and its screenshots) grows.
+    """
+
+    def __init__(self):
+        # id(message) -> (message, signature, json, blob refs in it); holding the
+        # message keeps its id from being reused by a new object. Images stored as
+        # `BlobRef`s are cached as placeholders and spliced in per request.
+        self._cache: dict[int, tuple[Any, tuple, bytes, dict[str, BlobRef]]] = {}
+        # digest -> base64 of the images in the last request; only those are kept, so
+        # this holds no more images than the history retains
+        self._encoded: dict[str, bytes] = {}
+        self.encoded_messages = 0
+        self.reused_messages = 0
+
+    def build(self, *, messages: list[BetaMessageParam], **params) -> bytes:
+        cache = {}
+        encoded: dict[str, bytes] = {}
+        parts = []
+
+        def encode(ref: BlobRef) -> bytes:
+            data = self._encoded.get(ref.digest)
+            if data is None:
+                data = ref.b64encode()
+            encoded[ref.digest] = data
+            return data
+
+        for message in messages:
+            signature = _payload_signature(message)
+            entry = self._cache.get(id(message))
+            if entry is None or entry[0] is not message or entry[1] != signature:
+                refs: dict[str, BlobRef] = {}
+                entry = (message, signature, _dumps(message, refs), refs)
+                self.encoded_messages += 1
             else:
-                # If there are no tool results, we're done with this iteration
-                return messages
+                self.reused_messages += 1
+            cache[id(message)] = entry
+            parts.append(_splice_blobs(entry[2], entry[3], encode) if entry[3] else entry[2])
+        self._cache = cache
+        self._encoded = encoded
+        head = _dumps(params)
+        return b"".join((head[:-1], b',"messages":[', b",".join(parts), b"]}"))
+
+
+async def _parse_response(raw_response) -> BetaMessage:
+    """The message of a raw response; `parse()` is only a coroutine on newer SDKs."""
+    response = raw_response.parse()
+    if inspect.isawaitable(response):
+        response = await response
+    return response
+
+
+def _create_client(provider: APIProvider, api_key: str):
+    # the Bedrock and Vertex clients pull in their cloud SDKs, so they are only imported
+    # when selected
+    if provider == APIProvider.VERTEX:
+        from anthropic import AsyncAnthropicVertex
+
+        return AsyncAnthropicVertex(max_retries=0)
+    if provider == APIProvider.BEDROCK:
+        from anthropic import AsyncAnthropicBedrock
+
+        return AsyncAnthropicBedrock(max_retries=0)
+    return AsyncAnthropic(api_key=api_key, max_retries=0)
+
+
+def _payload_signature(message: BetaMessageParam) -> tuple:
+    """
+    Changes whenever a message is edited the way the loop edits messages: content
+    blocks appended, or a tool result's content list replaced (e.g. images removed).
+    """
+    content = message["content"]
+    if isinstance(content, str):
+        return (message["role"], id(content))
+    return (
+        message["role"],
+        id(content),
+        len(content),
+        tuple(
+            id(block.get("content")) if isinstance(block, dict) else id(block)
+            for block in content
+        ),
+    )
+
+
+def _json_default(value: Any) -> Any:
+    if hasattr(value, "model_dump"):
+        # the same dump the SDK uses for models in a request body
+        return value.model_dump(
+            mode="json",
+            exclude_unset=True,
+            by_alias=True,
+            exclude=getattr(value, "__api_exclude__", None),
+        )
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
 
-        except Exception as e:
-            print(f"Error in API call: {str(e)}")
-            print(f"Error type: {type(e)}")
-            print(f"Error traceback: {traceback.format_exc()}")
-            raise
+
+def _dumps(value: Any, refs: dict[str, BlobRef] | None = None) -> bytes:
+    """
+    Encode a request body. `BlobRef`s are written out in full, or, given `refs`, as
+    placeholders for `_splice_blobs` and collected into `refs`.
+    """
+
+    def default(value: Any) -> Any:
+        if isinstance(value, BlobRef):
+            if refs is None:
+                return value.b64encode().decode()
+            refs[value.digest] = value
+            return f"\0blob:{value.digest}\0"
+        return _json_default(value)
+
+    return json.dumps(value, default=default, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+# a placeholder as JSON encodes it (NUL is always escaped)
+_BLOB_PLACEHOLDER = re.compile(rb"\\u0000blob:([0-9a-f]{64})\\u0000")
+
+
+def _splice_blobs(
+    data: bytes,
+    refs: dict[str, BlobRef],
+    encode: Callable[[BlobRef], bytes] = BlobRef.b64encode,
+) -> bytes:
+    def splice(match: re.Match) -> bytes:
+        # text that merely looks like a placeholder is left alone
+        ref = refs.get(match[1].decode())
+        return encode(ref) if ref else match[0]
+
+    return _BLOB_PLACEHOLDER.sub(splice, data)
+
+
+def _resolve_blobs(value: Any) -> Any:
+    """A copy of `value` with `BlobRef`s replaced by their data, for the SDK to encode."""
+    if isinstance(value, BlobRef):
+        return value.b64encode().decode()
+    if isinstance(value, list):
+        return [_resolve_blobs(item) for item in value]
+    if isinstance(value, dict):
+        return {key: _resolve_blobs(item) for key, item in value.items()}
+    return value
+
+
+def _store_images(tool_result: BetaToolResultBlockParam, blob_store: BlobStore):
+    """Move the base64 images of a tool result into `blob_store`, leaving `BlobRef`s."""
+    for block in tool_result["content"]:
+        if isinstance(block, dict) and block.get("type") == "image":
+            source = block["source"]
+            if source.get("type") == "base64" and isinstance(source["data"], str):
+                source["data"] = blob_store.ref(base64.b64decode(source["data"]))
+
+
+def _parse_retry_after(headers) -> float | None:
+    """Read the delay requested by the server, in seconds, if any."""
+    retry_after_ms = headers.get("retry-after-ms")
+    if retry_after_ms:
+        try:
+            return float(retry_after_ms) / 1000
+        except ValueError:
+            pass
+    retry_after = headers.get("retry-after")
+    if not retry_after:
+        return None
+    try:
+        return float(retry_after)
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(retry_after)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+def _close_interrupted_tool_uses(messages: list[BetaMessageParam]):
+    """
+    If the last turn was interrupted while its tools were running, answer the tool uses
+    that never reported back with an error instead of running them again. The answers go
+    before any text a user has added to the turn since, as the API expects tool results
+    first.
+    """
+    if messages and messages[-1]["role"] == "assistant":
+        messages.append({"role": "user", "content": []})
+    if len(messages) < 2 or messages[-2]["role"] != "assistant":
+        return
+    assistant_content, results = messages[-2]["content"], messages[-1]["content"]
+    if not isinstance(assistant_content, list):
+        return
+    if isinstance(results, str):
+        results = [{"type": "text", "text": results}]
+    answered = {
+        block.get("tool_use_id") for block in results if isinstance(block, dict)
+    }
+    missing = []
+    for block in assistant_content:
+        block_type, block_id = (
+            (block.get("type"), block.get("id"))
+            if isinstance(block, dict)
+            else (block.type, getattr(block, "id", None))
+        )
+        if block_type == "tool_use" and block_id not in answered:
+            missing.append(
+                make_api_tool_result(
+                    ToolResult(
+                        error="Tool execution was interrupted and its outcome is unknown. Check the current state before retrying."
+                    ),
+                    block_id,
+                )
+            )
+    if missing:
+        first_other = next(
+            (
+                i
+                for i, block in enumerate(results)
+                if not (isinstance(block, dict) and block.get("type") == "tool_result")
+            ),
+            len(results),
+        )
+        results[first_other:first_other] = missing
+        messages[-1]["content"] = results
+    if not messages[-1]["content"]:
+        # the interrupted turn asked for no tools, so there is nothing to answer
+        messages.pop()
 
 
 def _maybe_filter_to_n_most_recent_images(
@@ -224,6 +841,8 @@ def _maybe_filter_to_n_most_recent_images(
     images_to_remove -= images_to_remove % min_removal_threshold
 
     for tool_result in tool_result_blocks:
+        if images_to_remove <= 0:
+            break
         if isinstance(tool_result.get("content"), list):
             new_content = []
             for content in tool_result.get("content", []):
@@ -232,10 +851,13 @@ def _maybe_filter_to_n_most_recent_images(
                         images_to_remove -= 1
                         continue
                 new_content.append(content)
-            tool_result["content"] = new_content
+            # results that kept all their content are left untouched, so their cached
+            # serialization stays valid
+            if len(new_content) != len(tool_result["content"]):
+                tool_result["content"] = new_content
 
 
-def _make_api_tool_result(
+def make_api_tool_result(
     result: ToolResult, tool_use_id: str
 ) -> BetaToolResultBlockParam:
     """Convert an agent ToolResult to an API ToolResultBlockParam."""
@@ -277,7 +899,35 @@ def _maybe_prepend_system_tool_result(result: ToolResult, result_text: str):
     return result_text
 
 
-INSIGHTS_FILE = "insights.md"
+insight_store = InsightStore(INSIGHTS_FILE)
+
+
+def _latest_user_text(messages: list[BetaMessageParam]) -> str:
+    """Return the text of the most recent user message that isn't only tool results."""
+    for message in reversed(messages):
+        if message["role"] != "user":
+            continue
+        content = message["content"]
+        if isinstance(content, str):
+            return content
+        texts = [
+            block["text"]
+            for block in content
+            if isinstance(block, dict) and block.get("type") == "text"
+        ]
+        if texts:
+            return "\n".join(texts)
+    return ""
+
+
+def _load_insights(query: str | None) -> str:
+    insight_store.load()
+    return insight_store.render(query=query)
+
+
+def _save_insight(insight: str):
+    insight_store.add(insight)
+    insight_store.save()
 
 
 def generate_insight(result: ToolResult, inputs: list[str]) -> str:
@@ -286,18 +936,13 @@ def generate_insight(result: ToolResult, inputs: list[str]) -> str:
         return f"Error encountered: {result.error}. Check the command syntax or permissions."
     elif result.output:
         # Example of deriving a specific insight from the output
-        if "email" in inputs[-1].lower():
+        if inputs and "email" in inputs[-1].lower():
             return "Successfully sent an email. Ensure the subject line is correctly placed."
         return "Command executed successfully. Review the output for further improvements."
     else:
         return "No significant outcome. Consider revising the approach or inputs."
 
 
-def append_insight_to_file(insight: str):
-    with open(INSIGHTS_FILE, "a") as f:
-        f.write(insight + "\n")
-
-
 SCREENSHOTS_DIR = "screenshots"
 SCREENSHOT_EXPIRY_SECONDS = 4 * 60 * 60  # 4 hours
 
@@ -309,5 +954,5 @@ def delete_old_screenshots():
         for screenshot in screenshots_path.iterdir():
             if screenshot.is_file() and (now - screenshot.stat().st_mtime) > SCREENSHOT_EXPIRY_SECONDS:
                 screenshot.unlink()
-                print(f"Deleted old screenshot: {screenshot.name}")
+                logger.debug("Deleted old screenshot", file=screenshot.name)
 
@@ -0,0 +1,87 @@
+"""
+A small streaming markdown renderer producing `(text, tags)` segments for a Tk Text widget.
+
+It covers what the assistant actually writes (paragraphs, headings, lists, fenced and
+inline code, bold and italic) without building an HTML document, and it can be fed
+partial text as it arrives.
+"""
+
+import re
+
+Segment = tuple[str, tuple[str, ...]]
+
+_INLINE = re.compile(
+    r"`(?P<code>[^`\n]+)`"
+    r"|\*\*(?P<bold>[^*\n]+)\*\*|__(?P<bold_alt>[^_\n]+)__"
+    r"|\*(?P<italic>[^*\n]+)\*|(?<!\w)_(?P<italic_alt>[^_\n]+)_(?!\w)"
+)
+_HEADING = re.compile(r"#{1,6}\s+(.*)")
+_LIST_ITEM = re.compile(r"(\s*)(?:[-*+]|(\d+)[.)])\s+(.*)")
+
+_GROUP_TAGS = {
+    "code": "code",
+    "bold": "bold",
+    "bold_alt": "bold",
+    "italic": "italic",
+    "italic_alt": "italic",
+}
+
+
+class MarkdownRenderer:
+    """Converts markdown to segments one complete line at a time."""
+
+    def __init__(self):
+        self._pending = ""
+        self._in_code_block = False
+
+    def feed(self, text: str) -> list[Segment]:
+        """Render every line completed by `text`; a trailing partial line is held back."""
+        self._pending += text
+        *lines, self._pending = self._pending.split("\n")
+        return [segment for line in lines for segment in self._render_line(line)]
+
+    def close(self) -> list[Segment]:
+        """Render whatever is still pending and reset the renderer."""
+        segments = self._render_line(self._pending) if self._pending else []
+        self._pending = ""
+        self._in_code_block = False
+        return segments
+
+    def _render_line(self, line: str) -> list[Segment]:
+        stripped = line.strip()
+        if stripped.startswith("```"):
+            self._in_code_block = not self._in_code_block
+            return []
+        if self._in_code_block:
+            return [(line + "\n", ("code",))]
+        if heading := _HEADING.match(stripped):
+            return [(heading.group(1) + "\n", ("bold",))]
+        if item := _LIST_ITEM.match(line):
+            indent, number, text = item.groups()
+            bullet = f"{number}. " if number else "• "
+            return [
+                ("  " * (len(indent) // 2) + bullet, ()),
+                *render_inline(text),
+                ("\n", ()),
+            ]
+        return [*render_inline(line), ("\n", ())]
+
+
+def render_inline(text: str) -> list[Segment]:
+    """Split a single line into plain, code, bold and italic segments."""
+    segments: list[Segment] = []
+    position = 0
+    for match in _INLINE.finditer(text):
+        if match.start() > position:
+            segments.append((text[position : match.start()], ()))
+        group = match.lastgroup
+        segments.append((match.group(group), (_GROUP_TAGS[group],)))
+        position = match.end()
+    if position < len(text):
+        segments.append((text[position:], ()))
+    return segments
+
+
+def render_markdown(text: str) -> list[Segment]:
+    renderer = MarkdownRenderer()
+    return renderer.feed(text) + renderer.close()
@@ -0,0 +1,192 @@
+"""
+A rate-limit-aware scheduler shared by every sampling loop in the process.
+
+The API reports its limits in `anthropic-ratelimit-*` response headers. The scheduler
+tracks requests, input tokens and output tokens per minute for each (provider, model),
+treating each as a bucket that refills continuously at `limit / 60` per second. Each call
+reserves its estimated cost before it is sent; if a bucket would go negative, the call
+waits until the bucket has refilled instead of failing with a 429. Reservations are
+taken in arrival order, so callers are paced fairly.
+
+A reservation is held while its call is in flight. When the response arrives it is
+released: the server's `remaining` then replaces the bucket's level, less what the calls
+still in flight have reserved, or, without headers, the unused part of the reservation
+(e.g. the `max_tokens` a response didn't produce) is given back according to its usage.
+"""
+
+import asyncio
+import threading
+import time
+from dataclasses import dataclass, field
+
+from .tracing import tracer
+
+HEADER_PREFIX = "anthropic-ratelimit-"
+DIMENSIONS = ("requests", "input-tokens", "output-tokens")
+MAX_WAIT = 120.0  # seconds; never pace a single call longer than this
+
+
+@dataclass
+class _Bucket:
+    limit: float
+    remaining: float
+    updated: float  # time.monotonic() of the last update
+
+    def level(self, now: float) -> float:
+        refilled = self.remaining + (now - self.updated) * self.limit / 60
+        return min(self.limit, refilled)
+
+
+@dataclass
+class Reservation:
+    """The capacity one call took out of the buckets, held until it is observed."""
+
+    key: tuple[str, str]
+    costs: dict[str, float]
+    wait: float = 0.0  # seconds the call was paced
+    released: bool = False
+
+
+@dataclass
+class _ModelState:
+    buckets: dict[str, _Bucket] = field(default_factory=dict)
+    in_flight: dict[str, float] = field(default_factory=dict)  # reserved by pending calls
+    blocked_until: float = 0.0  # set from retry-after on a 429
+    calls: int = 0
+    waited_calls: int = 0
+    wait_seconds: float = 0.0
+    max_wait_seconds: float = 0.0
+
+
+class RateLimitScheduler:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._state: dict[tuple[str, str], _ModelState] = {}
+
+    async def acquire(
+        self, provider: str, model: str, input_tokens: int, output_tokens: int
+    ) -> Reservation:
+        """
+        Reserve capacity for one call, waiting if needed. Pass the reservation to
+        `observe` when the call completes, or fails, to release it.
+        """
+        costs = {"requests": 1, "input-tokens": input_tokens, "output-tokens": output_tokens}
+        with self._lock:
+            state = self._state.setdefault((provider, model), _ModelState())
+            now = time.monotonic()
+            wait = max(0.0, state.blocked_until - now)
+            for name, cost in costs.items():
+                state.in_flight[name] = state.in_flight.get(name, 0) + cost
+                bucket = state.buckets.get(name)
+                if bucket is None or bucket.limit <= 0:
+                    continue
+                # reserve even into debt, so the next caller queues behind this one
+                bucket.remaining = bucket.level(now) - cost
+                bucket.updated = now
+                if bucket.remaining < 0:
+                    wait = max(wait, -bucket.remaining * 60 / bucket.limit)
+            wait = min(wait, MAX_WAIT)
+            state.calls += 1
+            if wait > 0:
+                state.waited_calls += 1
+                state.wait_seconds += wait
+                state.max_wait_seconds = max(state.max_wait_seconds, wait)
+        if wait > 0:
+            with tracer.span("ratelimit.wait", model=model, seconds=round(wait, 3)):
+                await asyncio.sleep(wait)
+        return Reservation((provider, model), costs, wait)
+
+    def observe(
+        self,
+        provider: str,
+        model: str,
+        headers,
+        retry_after: float | None = None,
+        reservation: Reservation | None = None,
+        usage=None,
+    ):
+        """
+        Update the buckets from the rate limit headers of a response, releasing the
+        `reservation` of the call it answers. `usage` is the response's token usage, or
+        None if the call failed.
+        """
+        now = time.monotonic()
+        with self._lock:
+            state = self._state.setdefault((provider, model), _ModelState())
+            releasing = reservation is not None and not reservation.released
+            if releasing:
+                reservation.released = True
+                for name, cost in reservation.costs.items():
+                    state.in_flight[name] = max(0.0, state.in_flight.get(name, 0) - cost)
+            reported = set()
+            for name in DIMENSIONS:
+                limit = _header_float(headers, f"{HEADER_PREFIX}{name}-limit")
+                remaining = _header_float(headers, f"{HEADER_PREFIX}{name}-remaining")
+                if limit is None or remaining is None:
+                    continue
+                bucket = state.buckets.setdefault(name, _Bucket(limit, remaining, now))
+                # the server is authoritative, but can't count the calls still in flight
+                bucket.limit = limit
+                bucket.remaining = remaining - state.in_flight.get(name, 0)
+                bucket.updated = now
+                reported.add(name)
+            if releasing:
+                used = _used(usage)
+                for name, cost in reservation.costs.items():
+                    bucket = state.buckets.get(name)
+                    if name in reported or bucket is None:
+                        continue
+                    # no fresh numbers from the server; settle the estimate instead
+                    bucket.remaining = min(bucket.limit, bucket.level(now) + cost - used[name])
+                    bucket.updated = now
+            if retry_after is not None:
+                state.blocked_until = max(state.blocked_until, now + retry_after)
+
+    def release(self, reservation: Reservation):
+        """Release the reservation of a call that got no response, if still held."""
+        self.observe(*reservation.key, {}, reservation=reservation)
+
+    def metrics(self) -> dict[str, dict[str, float]]:
+        """Queue-wait metrics and current bucket levels per provider/model."""
+        now = time.monotonic()
+        with self._lock:
+            return {
+                f"{provider}/{model}": {
+                    "calls": state.calls,
+                    "waited_calls": state.waited_calls,
+                    "wait_seconds": state.wait_seconds,
+                    "max_wait_seconds": state.max_wait_seconds,
+                    **{
+                        f"{name}_available": round(bucket.level(now))
+                        for name, bucket in state.buckets.items()
+                    },
+                    **{f"{name}_limit": bucket.limit for name, bucket in state.buckets.items()},
+                }
+                for (provider, model), state in self._state.items()
+            }
+
+
+def _used(usage) -> dict[str, float]:
+    """What a call consumed per dimension, from its usage; a failed call only a request."""
+    if usage is None:
+        return {"requests": 1, "input-tokens": 0, "output-tokens": 0}
+    return {
+        "requests": 1,
+        # cache reads don't count towards the input token limit
+        "input-tokens": usage.input_tokens + (getattr(usage, "cache_creation_input_tokens", 0) or 0),
+        "output-tokens": usage.output_tokens,
+    }
+
+
+def _header_float(headers, name: str) -> float | None:
+    value = headers.get(name)
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+# shared by every sampling loop in the process unless one is passed explicitly
+scheduler = RateLimitScheduler()
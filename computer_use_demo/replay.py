@@ -0,0 +1,197 @@
+"""
+Record the tool calls of a task and replay them later without calling the model.
+
+A trace is the sequence of `ToolCollection.run` calls a completed task made, plus a
+fingerprint (`dhash`) of every screenshot the model saw. Those screenshots are the
+checkpoints: the model decided what to do next from them, so replaying is only safe while
+the screen looks the same. Replay re-executes the calls in order and compares each
+checkpoint; if the screen has diverged, the replayed steps become the start of the
+conversation and `sampling_loop` takes over from there.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+from typing import Any
+
+from anthropic.types.beta import BetaMessageParam
+
+from .executors import run_blocking
+from .logs import get_logger
+from .loop import make_api_tool_result, sampling_loop
+from .tools import ToolCollection, ToolResult
+from .tools.computer import dhash_base64
+from .tracing import tracer
+
+logger = get_logger(__name__)
+
+TRACES_DIR = "traces"
+MAX_HAMMING_DISTANCE = 24  # of the 256 bits of a fingerprint
+CHECKPOINT_RETRIES = 3  # screenshots retaken while the UI may still be settling
+CHECKPOINT_RETRY_DELAY = 0.5  # seconds
+# pause after each replayed action; without the model in the loop, actions would
+# otherwise land before the UI has reacted to the previous one
+ACTION_SETTLE_DELAY = 0.25  # seconds
+
+
+class TraceRecorder(ToolCollection):
+    """A ToolCollection that records every call it runs."""
+
+    def __init__(self, tool_collection: ToolCollection):
+        super().__init__(*tool_collection.tools)
+        self.steps: list[dict[str, Any]] = []
+
+    async def run(self, *, name: str, tool_input: dict[str, Any]) -> ToolResult:
+        result = await super().run(name=name, tool_input=tool_input)
+        self.steps.append(_step(name, tool_input, await _fingerprint(result)))
+        return result
+
+
+class TraceStore:
+    """Traces on disk, one JSON file per task."""
+
+    def __init__(self, root: str | os.PathLike = TRACES_DIR):
+        self.root = Path(root)
+
+    def path(self, task: str) -> Path:
+        key = " ".join(task.lower().split())
+        return self.root / f"{hashlib.sha256(key.encode()).hexdigest()[:16]}.json"
+
+    def load(self, task: str) -> dict[str, Any] | None:
+        try:
+            return json.loads(self.path(task).read_text())
+        except FileNotFoundError:
+            return None
+
+    def save(self, task: str, steps: list[dict[str, Any]], result: str | None):
+        path = self.path(task)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(".tmp")
+        trace = {"task": task, "recorded": time.time(), "steps": steps, "result": result}
+        tmp_path.write_text(json.dumps(trace, indent=1))
+        os.replace(tmp_path, path)
+
+
+async def replay(
+    trace: dict[str, Any],
+    tool_collection: ToolCollection,
+    messages: list[BetaMessageParam],
+) -> tuple[bool, list[dict[str, Any]]]:
+    """
+    Run the steps of `trace`, appending each as a tool_use/tool_result turn to
+    `messages`. Stops as soon as a checkpoint doesn't match the screen; returns whether
+    the whole trace ran, and the steps that ran with the fingerprints actually seen.
+    """
+    replayed = []
+    for i, step in enumerate(trace["steps"]):
+        tool_use_id = f"toolu_replay_{i:04d}"
+        with tracer.span("replay.step", tool=step["name"]):
+            result = await tool_collection.run(name=step["name"], tool_input=step["input"])
+            seen = await _fingerprint(result)
+            # only captures are retried; re-running an action would repeat it
+            for _ in range(CHECKPOINT_RETRIES if _is_capture(step) else 0):
+                if "fingerprint" not in step or _matches(seen, step["fingerprint"]):
+                    break
+                # the previous action may not have finished redrawing yet
+                await asyncio.sleep(CHECKPOINT_RETRY_DELAY)
+                result = await tool_collection.run(name=step["name"], tool_input=step["input"])
+                seen = await _fingerprint(result)
+            if step["name"] == "computer" and not _is_capture(step):
+                await asyncio.sleep(ACTION_SETTLE_DELAY)
+        replayed.append(_step(step["name"], step["input"], seen))
+        messages.append(
+            {
+                "role": "assistant",
+                "content": [
+                    {
+                        "type": "tool_use",
+                        "id": tool_use_id,
+                        "name": step["name"],
+                        "input": step["input"],
+                    }
+                ],
+            }
+        )
+        messages.append(
+            {"role": "user", "content": [make_api_tool_result(result, tool_use_id)]}
+        )
+        if "fingerprint" in step and not _matches(seen, step["fingerprint"]):
+            logger.info("Replay diverged", step=i + 1, steps=len(trace["steps"]))
+            return False, replayed
+    return True, replayed
+
+
+async def run_with_replay(
+    task: str,
+    *,
+    tool_collection: ToolCollection,
+    store: TraceStore,
+    **sampling_kwargs,
+) -> tuple[list[BetaMessageParam], bool]:
+    """
+    Run `task`, replaying its stored trace when there is one. Falls back to
+    `sampling_loop` (with the replayed steps as history) when the screen diverges, and
+    stores a new trace whenever the model was involved. Returns the messages and whether
+    the task was completed by replay alone.
+    """
+    messages: list[BetaMessageParam] = [{"role": "user", "content": task}]
+    recorder = TraceRecorder(tool_collection)
+    trace = store.load(task)
+    if trace is not None:
+        completed, recorder.steps = await replay(trace, tool_collection, messages)
+        if completed:
+            if trace.get("result"):
+                messages.append(
+                    {"role": "assistant", "content": [{"type": "text", "text": trace["result"]}]}
+                )
+            return messages, True
+
+    await sampling_loop(
+        messages=messages,
+        tool_collection=recorder,
+        **sampling_kwargs,
+    )
+    store.save(task, recorder.steps, _final_text(messages))
+    return messages, False
+
+
+async def _fingerprint(result: ToolResult) -> int | None:
+    """The dhash of the result's screenshot, if any; decoding it is left to a thread."""
+    if not result.base64_image:
+        return None
+    return await run_blocking("capture", dhash_base64, result.base64_image)
+
+
+def _step(name: str, tool_input: dict[str, Any], fingerprint: int | None) -> dict[str, Any]:
+    step: dict[str, Any] = {"name": name, "input": tool_input}
+    if fingerprint is not None:
+        step["fingerprint"] = f"{fingerprint:064x}"
+    return step
+
+
+def _is_capture(step: dict[str, Any]) -> bool:
+    if step["name"] in ("zoom", "wait_for_screen_change"):
+        return True
+    return step["input"].get("action") == "screenshot"
+
+
+def _matches(seen: int | None, fingerprint: str) -> bool:
+    if seen is None:
+        return False
+    distance = (seen ^ int(fingerprint, 16)).bit_count()
+    return distance <= MAX_HAMMING_DISTANCE
+
+
+def _final_text(messages: list[BetaMessageParam]) -> str | None:
+    message = messages[-1]
+    if message["role"] != "assistant" or isinstance(message["content"], str):
+        return None
+    texts = [
+        block.text if hasattr(block, "text") else block.get("text")
+        for block in message["content"]
+        if (block.type if hasattr(block, "type") else block.get("type")) == "text"
+    ]
+    return "\n".join(texts) or None
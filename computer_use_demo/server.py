@@ -0,0 +1,531 @@
+"""
+Local agent server: many concurrent sessions in one process, driven over HTTP.
+
+    python -m computer_use_demo.server --workers 8 --fake-display --port 8765
+
+Each session is given a worker from a bounded pool for its lifetime: a display slot and
+its own `ToolCollection`, started once and kept across runs. Runs go through
+`stream_sampling_loop` and their events are streamed to any number of clients as
+Server-Sent Events.
+
+    POST   /sessions                 create a session; waits for a free worker  -> 201
+    GET    /sessions                 list the sessions
+    GET    /sessions/{id}            one session's state
+    POST   /sessions/{id}/messages   {"text": ...} starts a run                 -> 202
+    GET    /sessions/{id}/events     event stream; resumes after `Last-Event-ID`
+    POST   /sessions/{id}/cancel     cancel the current run
+    DELETE /sessions/{id}            cancel, release the worker and forget the session
+
+Events are JSON objects with a `type` (`text`, `tool_start`, `tool_result`, `usage`,
+`timing`, and `run_started` / `run_finished` / `run_failed` / `run_cancelled`). Every
+session keeps its latest `EVENT_BACKLOG` events, so a client that connects late or
+reconnects doesn't miss the start of a run.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import re
+import uuid
+from collections import deque
+from dataclasses import dataclass, fields
+from pathlib import Path
+from typing import Any, Callable
+from urllib.parse import urlsplit
+
+from .events import AgentEvent
+from .executors import run_blocking
+from .images import ImageRetention
+from .journal import SessionJournal
+from .logs import configure_logging, get_logger
+from .loop import (
+    PROVIDER_TO_DEFAULT_MODEL_NAME,
+    APIProvider,
+    _close_interrupted_tool_uses,
+    create_tool_collection,
+    stream_sampling_loop,
+)
+from .tools import ToolCollection, ToolResult
+
+logger = get_logger(__name__)
+
+EVENT_BACKLOG = 1000  # events kept per session for late subscribers
+HEARTBEAT_SECONDS = 15.0
+MAX_BODY_BYTES = 1024 * 1024
+REASONS = {
+    200: "OK",
+    201: "Created",
+    202: "Accepted",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    409: "Conflict",
+    413: "Payload Too Large",
+    503: "Service Unavailable",
+}
+
+
+class HTTPError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+@dataclass
+class Worker:
+    """A display slot; at most one session uses it at a time."""
+
+    slot: int
+    display_num: int | None
+    backend: Any = None  # None means pyautogui on the process's display
+
+
+class WorkerPool:
+    """A fixed set of workers, handed out first come, first served."""
+
+    def __init__(
+        self,
+        size: int,
+        backend_factory: Callable[[], Any] | None = None,
+        display_base: int | None = None,
+    ):
+        self.size = size
+        self._free: asyncio.Queue[Worker] = asyncio.Queue()
+        for slot in range(size):
+            self._free.put_nowait(
+                Worker(
+                    slot,
+                    None if display_base is None else display_base + slot,
+                    backend_factory() if backend_factory else None,
+                )
+            )
+
+    @property
+    def available(self) -> int:
+        return self._free.qsize()
+
+    async def acquire(self, timeout: float | None = None) -> Worker:
+        """Wait for a free worker; raises TimeoutError after `timeout` seconds."""
+        async with asyncio.timeout(timeout):
+            return await self._free.get()
+
+    def release(self, worker: Worker):
+        self._free.put_nowait(worker)
+
+
+def encode_event(event: AgentEvent) -> dict[str, Any]:
+    """The JSON form of an event; content blocks are left out and images only flagged."""
+    name = re.sub(r"(?<!^)(?=[A-Z])", "_", type(event).__name__.removesuffix("Event"))
+    data: dict[str, Any] = {"type": name.lower()}
+    for field in fields(event):
+        if field.name in ("block", "droppable"):
+            continue
+        value = getattr(event, field.name)
+        if isinstance(value, ToolResult):
+            value = {
+                "output": value.output,
+                "error": value.error,
+                "system": value.system,
+                "image": bool(value.base64_image),
+            }
+        data[field.name] = value
+    return data
+
+
+class Session:
+    """One conversation, with the worker and tools it keeps until it is closed."""
+
+    def __init__(
+        self,
+        session_id: str,
+        worker: Worker,
+        tools: ToolCollection,
+        journal: SessionJournal | None,
+        options: dict[str, Any],
+    ):
+        self.id = session_id
+        self.worker = worker
+        self.tools = tools
+        self.journal = journal
+        self.options = options
+        self.messages: list = []
+        self.image_retention = ImageRetention()
+        self.runs = 0
+        self.closed = False
+        self._task: asyncio.Task | None = None
+        self._events: deque[tuple[int, dict[str, Any]]] = deque(maxlen=EVENT_BACKLOG)
+        self._next_event_id = 0
+        self._new_event = asyncio.Event()
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def describe(self) -> dict[str, Any]:
+        return {
+            "id": self.id,
+            "worker": self.worker.slot,
+            "display": self.worker.display_num,
+            "running": self.running,
+            "runs": self.runs,
+            "messages": len(self.messages),
+            "journal": str(self.journal.path) if self.journal else None,
+        }
+
+    def start_run(self, text: str):
+        if self.running:
+            raise HTTPError(409, "a run is already in progress")
+        # answer tool uses a cancelled run left open first; their results must lead
+        # the turn the text is added to
+        _close_interrupted_tool_uses(self.messages)
+        # a failed or cancelled run can leave a trailing user turn; add to it
+        if self.messages and self.messages[-1]["role"] == "user":
+            last = self.messages[-1]
+            if isinstance(last["content"], str):
+                last["content"] = [{"type": "text", "text": last["content"]}]
+            last["content"].append({"type": "text", "text": text})
+        else:
+            self.messages.append({"role": "user", "content": text})
+        self.runs += 1
+        self._task = asyncio.create_task(self._run(), name=f"session-{self.id}")
+
+    async def cancel(self) -> bool:
+        """Cancel the current run and wait until it has stopped."""
+        if not self.running:
+            return False
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        return True
+
+    async def _run(self):
+        self.publish({"type": "run_started", "run": self.runs})
+        try:
+            # completed turns are appended to self.messages as they finish, so a
+            # cancelled run keeps them and the next message continues from there
+            async for event in stream_sampling_loop(
+                model=self.options["model"],
+                provider=self.options["provider"],
+                system_prompt_suffix="",
+                messages=self.messages,
+                api_key=self.options["api_key"],
+                only_n_most_recent_images=self.options["only_n_most_recent_images"],
+                journal=self.journal,
+                blob_store=self.journal.blob_store if self.journal else None,
+                image_retention=self.image_retention,
+                tool_collection=self.tools,
+            ):
+                self.publish(encode_event(event))
+        except asyncio.CancelledError:
+            self.publish({"type": "run_cancelled", "run": self.runs})
+        except Exception as e:
+            self.publish({"type": "run_failed", "run": self.runs, "error": f"{type(e).__name__}: {e}"})
+        else:
+            self.publish({"type": "run_finished", "run": self.runs})
+
+    def publish(self, event: dict[str, Any]):
+        self._next_event_id += 1
+        self._events.append((self._next_event_id, event))
+        waiters, self._new_event = self._new_event, asyncio.Event()
+        waiters.set()
+
+    async def subscribe(self, after: int = 0):
+        """Yield `(id, event)` for every event after `after`, then each new one, until closed."""
+        while not self.closed:
+            new_event = self._new_event
+            for event_id, event in list(self._events):
+                if event_id > after:
+                    yield event_id, event
+                    after = event_id
+            try:
+                await asyncio.wait_for(new_event.wait(), HEARTBEAT_SECONDS)
+            except TimeoutError:
+                yield None, None  # lets the caller check that the client is still there
+
+    async def close(self):
+        await self.cancel()
+        self.closed = True
+        self._new_event.set()
+        await self.tools.shutdown()
+        self.image_retention.close()
+        if self.journal:
+            await run_blocking("io", self.journal.close)
+
+
+class SessionManager:
+    """Creates sessions on workers from `pool` and closes them."""
+
+    def __init__(
+        self,
+        pool: WorkerPool,
+        options: dict[str, Any],
+        journal_dir: str | os.PathLike | None = None,
+        acquire_timeout: float | None = 30.0,
+    ):
+        self.pool = pool
+        self.options = options
+        self.journal_dir = Path(journal_dir) if journal_dir else None
+        self.acquire_timeout = acquire_timeout
+        self.sessions: dict[str, Session] = {}
+
+    async def create(self) -> Session:
+        try:
+            worker = await self.pool.acquire(self.acquire_timeout)
+        except TimeoutError:
+            raise HTTPError(503, f"all {self.pool.size} workers are busy") from None
+        session_id = uuid.uuid4().hex[:12]
+        try:
+            tools = create_tool_collection(worker.backend, display_num=worker.display_num)
+            await tools.start()
+            journal = None
+            if self.journal_dir:
+                # sessions share one blob store, so identical screenshots are stored once;
+                # opening the file and starting its writer thread stay off the event loop
+                journal = await run_blocking(
+                    "io", SessionJournal, self.journal_dir / f"{session_id}.jsonl"
+                )
+        except BaseException:
+            self.pool.release(worker)
+            raise
+        session = Session(session_id, worker, tools, journal, self.options)
+        self.sessions[session_id] = session
+        return session
+
+    def get(self, session_id: str) -> Session:
+        session = self.sessions.get(session_id)
+        if session is None:
+            raise HTTPError(404, f"no session {session_id}")
+        return session
+
+    async def close(self, session_id: str):
+        session = self.sessions.pop(session_id, None)
+        if session is None:
+            raise HTTPError(404, f"no session {session_id}")
+        try:
+            await session.close()
+        finally:
+            self.pool.release(session.worker)
+
+    async def close_all(self):
+        await asyncio.gather(
+            *(self.close(session_id) for session_id in list(self.sessions)),
+            return_exceptions=True,
+        )
+
+
+class AgentServer:
+    """A minimal HTTP/1.1 server for `SessionManager`; one request per connection."""
+
+    def __init__(self, manager: SessionManager, host: str = "127.0.0.1", port: int = 8765):
+        self.manager = manager
+        self.host = host
+        self.port = port
+        self._server: asyncio.Server | None = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.sockets[0].getsockname()[:2]
+        return f"http://{host}:{port}"
+
+    async def start(self) -> str:
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        return self.base_url
+
+    async def serve_forever(self):
+        await self.start()
+        print(f"Serving agent sessions on {self.base_url}", flush=True)
+        try:
+            await self._server.serve_forever()
+        finally:
+            await self.stop()
+
+    async def stop(self):
+        if self._server:
+            self._server.close()
+        await self.manager.close_all()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        method = path = "-"
+        try:
+            method, path, headers, body = await _read_request(reader)
+            await self._route(method, path, headers, body, writer)
+        except HTTPError as e:
+            await _send_json(writer, e.status, {"error": e.message})
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except Exception as e:
+            logger.exception("Request failed", method=method, path=path)
+            await _send_json(writer, 500, {"error": f"{type(e).__name__}: {e}"})
+        finally:
+            writer.close()
+
+    async def _route(self, method, path, headers, body, writer):
+        parts = [part for part in urlsplit(path).path.split("/") if part]
+        if not parts or parts[0] != "sessions" or len(parts) > 3:
+            raise HTTPError(404, f"no route for {path}")
+        manager = self.manager
+
+        if len(parts) == 1:
+            if method == "POST":
+                session = await manager.create()
+                return await _send_json(writer, 201, session.describe())
+            if method == "GET":
+                return await _send_json(
+                    writer,
+                    200,
+                    {
+                        "sessions": [session.describe() for session in manager.sessions.values()],
+                        "free_workers": manager.pool.available,
+                    },
+                )
+            raise HTTPError(405, f"{method} not allowed on {path}")
+
+        session_id = parts[1]
+        action = parts[2] if len(parts) == 3 else None
+        if action is None and method == "GET":
+            return await _send_json(writer, 200, manager.get(session_id).describe())
+        if action is None and method == "DELETE":
+            await manager.close(session_id)
+            return await _send_json(writer, 200, {"id": session_id, "closed": True})
+        if action == "messages" and method == "POST":
+            text = _parse_json(body).get("text")
+            if not isinstance(text, str) or not text:
+                raise HTTPError(400, "`text` must be a non-empty string")
+            session = manager.get(session_id)
+            session.start_run(text)
+            return await _send_json(writer, 202, session.describe())
+        if action == "cancel" and method == "POST":
+            cancelled = await manager.get(session_id).cancel()
+            return await _send_json(writer, 200, {"id": session_id, "cancelled": cancelled})
+        if action == "events" and method == "GET":
+            return await self._stream_events(manager.get(session_id), headers, writer)
+        raise HTTPError(404, f"no route for {method} {path}")
+
+    async def _stream_events(self, session: Session, headers: dict[str, str], writer):
+        try:
+            after = int(headers.get("last-event-id", 0))
+        except ValueError:
+            raise HTTPError(400, "Last-Event-ID must be an integer") from None
+        writer.write(
+            b"HTTP/1.1 200 OK\r\n"
+            b"Content-Type: text/event-stream\r\n"
+            b"Cache-Control: no-cache\r\n"
+            b"Connection: close\r\n\r\n"
+        )
+        async for event_id, event in session.subscribe(after):
+            if event is None:
+                writer.write(b": keep-alive\n\n")
+            else:
+                writer.write(f"id: {event_id}\ndata: {json.dumps(event)}\n\n".encode())
+            # waits while the client is slow, so one reader can't make the server buffer
+            # a session's whole history
+            await writer.drain()
+
+
+async def _read_request(reader: asyncio.StreamReader):
+    request_line = (await reader.readline()).decode("latin-1").strip()
+    if not request_line:
+        raise ConnectionError("empty request")
+    try:
+        method, path, _ = request_line.split(" ", 2)
+    except ValueError:
+        raise HTTPError(400, "malformed request line") from None
+    headers = {}
+    while line := (await reader.readline()).decode("latin-1").strip():
+        name, _, value = line.partition(":")
+        headers[name.strip().lower()] = value.strip()
+    try:
+        length = int(headers.get("content-length") or 0)
+    except ValueError:
+        raise HTTPError(400, "Content-Length must be an integer") from None
+    if length < 0:
+        raise HTTPError(400, "Content-Length must not be negative")
+    if length > MAX_BODY_BYTES:
+        raise HTTPError(413, f"request body over {MAX_BODY_BYTES} bytes")
+    body = await reader.readexactly(length) if length else b""
+    return method.upper(), path, headers, body
+
+
+def _parse_json(body: bytes) -> dict[str, Any]:
+    try:
+        value = json.loads(body or b"{}")
+    except ValueError:
+        raise HTTPError(400, "request body is not valid JSON") from None
+    if not isinstance(value, dict):
+        raise HTTPError(400, "request body must be a JSON object")
+    return value
+
+
+async def _send_json(writer: asyncio.StreamWriter, status: int, value: Any):
+    body = json.dumps(value).encode()
+    writer.write(
+        f"HTTP/1.1 {status} {REASONS.get(status, 'Internal Server Error')}\r\n"
+        f"Content-Type: application/json\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        f"Connection: close\r\n\r\n".encode()
+        + body
+    )
+    await writer.drain()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workers", type=int, default=1, help="sessions that can be open at once")
+    parser.add_argument(
+        "--display-base",
+        type=int,
+        default=None,
+        help="first X display number reported to the model; worker i uses :(base + i)",
+    )
+    parser.add_argument("--fake-display", action="store_true", help="use the benchmark fake display")
+    parser.add_argument("--provider", type=APIProvider, default=APIProvider.ANTHROPIC)
+    parser.add_argument("--model", default=None)
+    parser.add_argument("--only-n-most-recent-images", type=int, default=10)
+    parser.add_argument("--journal-dir", default="sessions", help="where sessions are journaled")
+    parser.add_argument("--no-journal", action="store_true")
+    parser.add_argument(
+        "--acquire-timeout",
+        type=float,
+        default=30.0,
+        help="seconds a new session waits for a free worker before failing with 503",
+    )
+    args = parser.parse_args()
+
+    if args.workers > 1 and not args.fake_display:
+        # pyautogui drives the display of the whole process
+        parser.error("parallel workers in one process need --fake-display; see headless.py")
+    configure_logging()
+
+    options = {
+        "provider": args.provider,
+        "model": args.model or PROVIDER_TO_DEFAULT_MODEL_NAME[args.provider],
+        "api_key": os.getenv("ANTHROPIC_API_KEY", ""),
+        "only_n_most_recent_images": args.only_n_most_recent_images,
+    }
+
+    async def serve():
+        backend_factory = None
+        if args.fake_display:
+            from .bench.fake_display import FakeDisplay
+
+            backend_factory = FakeDisplay
+        pool = WorkerPool(args.workers, backend_factory, args.display_base)
+        manager = SessionManager(
+            pool,
+            options,
+            journal_dir=None if args.no_journal else args.journal_dir,
+            acquire_timeout=args.acquire_timeout,
+        )
+        await AgentServer(manager, args.host, args.port).serve_forever()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -3,12 +3,20 @@ from .bash import BashTool
 from .collection import ToolCollection
 from .computer import ComputerTool
 from .edit import EditTool
+from .pacing import PacingProfile
+from .search import SearchTool
+from .wait import WaitTool
+from .zoom import ZoomTool
 
 __ALL__ = [
     BashTool,
     CLIResult,
     ComputerTool,
     EditTool,
+    PacingProfile,
+    SearchTool,
     ToolCollection,
     ToolResult,
+    WaitTool,
+    ZoomTool,
 ]
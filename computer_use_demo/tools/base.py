@@ -19,6 +19,15 @@ class BaseAnthropicTool(metaclass=ABCMeta):
     ) -> BetaToolUnionParam:
         raise NotImplementedError
 
+    async def start(self):
+        """Acquires what the tool keeps for the whole session, e.g. a shell."""
+
+    async def warm_up(self):
+        """Does throwaway work so the first real call doesn't pay one-time costs."""
+
+    async def shutdown(self):
+        """Releases what `start` (or a lazy first call) acquired."""
+
 
 @dataclass(kw_only=True, frozen=True)
 class ToolResult:
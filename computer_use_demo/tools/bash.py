@@ -1,10 +1,14 @@
 import asyncio
-import os
 from typing import ClassVar, Literal
 
 from anthropic.types.beta import BetaToolBash20241022Param
 
+from ..logs import get_logger
+from ..tracing import tracer
 from .base import BaseAnthropicTool, CLIResult, ToolError, ToolResult
+from .search_index import mark_changed
+
+logger = get_logger(__name__)
 
 
 class _BashSession:
@@ -28,7 +32,9 @@ class _BashSession:
 
         self._process = await asyncio.create_subprocess_shell(
             self.command,
-            preexec_fn=os.setsid,
+            # unlike a preexec_fn, this lets the child be spawned without a full fork
+            # of the process, which blocks the event loop
+            start_new_session=True,
             shell=True,
             bufsize=0,
             stdin=asyncio.subprocess.PIPE,
@@ -48,6 +54,12 @@ class _BashSession:
 
     async def run(self, command: str):
         """Execute a command in the bash shell."""
+        with tracer.span("bash.run") as span:
+            result = await self._run(command, span)
+            span.set(bytes=len(result.output or "") + len(result.error or ""))
+            return result
+
+    async def _run(self, command: str, span):
         if not self._started:
             raise ToolError("Session has not started.")
         if self._process.returncode is not None:
@@ -72,10 +84,12 @@ class _BashSession:
         await self._process.stdin.drain()
 
         # read output from the process, until the sentinel is found
+        polls = 0
         try:
             async with asyncio.timeout(self._timeout):
                 while True:
                     await asyncio.sleep(self._output_delay)
+                    polls += 1
                     # if we read directly from stdout/stderr, it will wait forever for
                     # EOF. use the StreamReader buffer directly instead.
                     output = (
@@ -86,11 +100,13 @@ class _BashSession:
                         output = output[: output.index(self._sentinel)]
                         break
         except asyncio.TimeoutError:
+            span.set(polls=polls)
             self._timed_out = True
             raise ToolError(
                 f"timed out: bash has not returned in {self._timeout} seconds and must be restarted",
             ) from None
 
+        span.set(polls=polls)
         if output.endswith("\n"):
             output = output[:-1]
 
@@ -124,7 +140,7 @@ class BashTool(BaseAnthropicTool):
     async def __call__(
         self, command: str | None = None, restart: bool = False, **kwargs
     ):
-        print("### Running bash command:", command)
+        logger.info("Running bash command", command=command, restart=restart)
         if restart:
             if self._session:
                 self._session.stop()
@@ -138,10 +154,28 @@ class BashTool(BaseAnthropicTool):
             await self._session.start()
 
         if command is not None:
-            return await self._session.run(command)
+            try:
+                return await self._session.run(command)
+            finally:
+                mark_changed()  # the command may have written files the editor indexed
 
         raise ToolError("no command provided.")
 
+    async def start(self):
+        if self._session is None:
+            session = _BashSession()
+            await session.start()
+            self._session = session
+
+    async def shutdown(self):
+        session, self._session = self._session, None
+        if session is not None:
+            session.stop()
+            # close our end of stdin and reap the shell, so the transport is finished
+            # while the event loop that owns it is still running
+            session._process.stdin.close()
+            await session._process.wait()
+
     def to_params(self) -> BetaToolBash20241022Param:
         return {
             "type": self.api_type,
@@ -1,9 +1,11 @@
 """Collection classes for managing multiple tools."""
 
+import asyncio
 from typing import Any
 
 from anthropic.types.beta import BetaToolUnionParam
 
+from ..tracing import tracer
 from .base import (
     BaseAnthropicTool,
     ToolError,
@@ -19,6 +21,25 @@ class ToolCollection:
         self.tools = tools
         self.tool_map = {tool.to_params()["name"]: tool for tool in tools}
 
+    async def start(self, warm_up: bool = True):
+        """Start every tool, and warm them up, before the first call of a session."""
+        with tracer.span("tools.start"):
+            await asyncio.gather(*(tool.start() for tool in self.tools))
+        if warm_up:
+            with tracer.span("tools.warm_up"):
+                await asyncio.gather(*(tool.warm_up() for tool in self.tools))
+
+    async def shutdown(self):
+        """Release the resources of every tool; failures of one don't stop the others."""
+        await asyncio.gather(*(tool.shutdown() for tool in self.tools), return_exceptions=True)
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.shutdown()
+
     def to_params(
         self,
     ) -> list[BetaToolUnionParam]:
@@ -28,7 +49,8 @@ class ToolCollection:
         tool = self.tool_map.get(name)
         if not tool:
             return ToolFailure(error=f"Tool {name} is invalid")
-        try:
-            return await tool(**tool_input)
-        except ToolError as e:
-            return ToolFailure(error=e.message)
+        with tracer.span("tool.run", tool=name):
+            try:
+                return await tool(**tool_input)
+            except ToolError as e:
+                return ToolFailure(error=e.message)
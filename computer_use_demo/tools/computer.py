@@ -1,18 +1,43 @@
 import asyncio
 import base64
 import io
+import time
+from dataclasses import dataclass
 from enum import StrEnum
 from typing import Literal, TypedDict
-import pyautogui
 from anthropic.types.beta import BetaToolComputerUse20241022Param
+from PIL import Image
 
+from ..executors import run_blocking
+from ..logs import get_logger
+from ..tracing import tracer
 from .base import BaseAnthropicTool, ToolError, ToolResult
+from .pacing import PacedBackend, PacingProfile, pacing_from_env
+
+logger = get_logger(__name__)
 
 OUTPUT_DIR = "/tmp/outputs"
 
 TYPING_DELAY_MS = 12
 TYPING_GROUP_SIZE = 50
 
+MAX_WIDTH = 1280  # Max screenshot width
+MAX_REGION_EDGE = 1568  # longest edge of a region capture; the API downscales larger images
+
+# actions after which the model almost always asks for a screenshot next
+STATE_CHANGING_ACTIONS = frozenset(
+    {
+        "key",
+        "type",
+        "mouse_move",
+        "left_click",
+        "left_click_drag",
+        "right_click",
+        "middle_click",
+        "double_click",
+    }
+)
+
 Action = Literal[
     "key",
     "type",
@@ -27,6 +52,16 @@ Action = Literal[
 ]
 
 
+WaitCondition = Literal["change", "settle"]
+
+MAX_WAIT_SECONDS = 120.0
+WAIT_POLL_INTERVAL = 0.25  # seconds between checks
+SETTLE_SECONDS = 1.0  # no change for this long counts as settled
+# bits of the 256-bit hash that may differ before the screen counts as changed, so a
+# blinking cursor or ticking clock doesn't end the wait
+CHANGE_THRESHOLD_BITS = 3
+
+
 class ScalingSource(StrEnum):
     COMPUTER = "computer"
     API = "api"
@@ -42,6 +77,36 @@ def chunks(s: str, chunk_size: int) -> list[str]:
     return [s[i : i + chunk_size] for i in range(0, len(s), chunk_size)]
 
 
+def _same_frame(a: Image.Image, b: Image.Image) -> bool:
+    return a.size == b.size and a.mode == b.mode and a.tobytes() == b.tobytes()
+
+
+def dhash(image, size: int = 16) -> int:
+    """
+    Difference hash of an image: one bit per horizontally adjacent pair of pixels of a
+    `size`x`size` grayscale thumbnail. Similar screens differ in only a few bits.
+    """
+    pixels = list(image.convert("L").resize((size + 1, size), Image.Resampling.BILINEAR).getdata())
+    value = 0
+    for row in range(size):
+        for col in range(size):
+            left = pixels[row * (size + 1) + col]
+            value = (value << 1) | (left > pixels[row * (size + 1) + col + 1])
+    return value
+
+
+def dhash_base64(base64_image: str, size: int = 16) -> int:
+    """`dhash` of a base64-encoded image, e.g. the one in a screenshot's ToolResult."""
+    return dhash(Image.open(io.BytesIO(base64.b64decode(base64_image))), size)
+
+
+@dataclass
+class _PrefetchedScreenshot:
+    frame: Image.Image  # the raw capture, to check the screen hasn't changed since
+    base64_image: str
+    encode_seconds: float
+
+
 class ComputerTool(BaseAnthropicTool):
     """
     A tool that allows the agent to interact with the screen, keyboard, and mouse of the current computer.
@@ -54,8 +119,9 @@ class ComputerTool(BaseAnthropicTool):
     height: int
     display_num: int | None
 
-    _screenshot_delay = 1.0
+    _screenshot_delay = 1.0  # settle time before a prefetched screenshot is captured
     _scaling_enabled = True
+    _prefetch_enabled = True
 
     @property
     def options(self) -> ComputerToolOptions:
@@ -68,15 +134,29 @@ class ComputerTool(BaseAnthropicTool):
     def to_params(self) -> BetaToolComputerUse20241022Param:
         return {"name": self.name, "type": self.api_type, **self.options}
 
-    def __init__(self):
+    def __init__(
+        self,
+        backend=None,
+        display_num: int | None = None,
+        pacing: PacingProfile | None = None,
+    ):
         super().__init__()
 
-        self.width = int(pyautogui.size()[0])
-        self.height = int(pyautogui.size()[1])
+        # anything exposing the subset of the pyautogui API used below can stand in for
+        # the real screen, e.g. the fake display used by the benchmarks. pyautogui is
+        # only imported when needed, as importing it requires a display.
+        if backend is None:
+            import pyautogui as backend
+        # per-action delays instead of pyautogui's pause after every call, see pacing.py
+        pacing = pacing or pacing_from_env()
+        self._backend = PacedBackend(backend, pacing) if pacing else backend
+        self.pacing = pacing
 
-        self.display_num = None  # Not used on MacOS
+        self.width, self.height = (int(v) for v in self._backend.size())
+
+        # Not used on MacOS; on Linux this is the X display the process was started on
+        self.display_num = display_num
 
-        MAX_WIDTH = 1280  # Max screenshot width
         if self.width > MAX_WIDTH:
             self.scale_factor = MAX_WIDTH / self.width
             self.target_width = MAX_WIDTH
@@ -86,6 +166,11 @@ class ComputerTool(BaseAnthropicTool):
             self.target_width = self.width
             self.target_height = self.height
 
+        # a screenshot captured and encoded in the background after the last action
+        self._prefetch_task: asyncio.Task | None = None
+        self._prefetch_captured = False
+        self.prefetch_stats = {"started": 0, "hits": 0, "misses": 0, "seconds_saved": 0.0}
+
     async def __call__(
         self,
         *,
@@ -94,32 +179,38 @@ class ComputerTool(BaseAnthropicTool):
         coordinate: list[int] | None = None,
         **kwargs,
     ):
-        print(
-            f"### Performing action: {action}"
-            f"{', text: ' + str(text) if text is not None else ''}"
-            f"{', coordinate: ' + str(coordinate) if coordinate else ''}"
-        )
+        logger.info("Performing action", action=action, text=text, coordinate=coordinate)
+        if action in STATE_CHANGING_ACTIONS:
+            self._cancel_prefetch()
+            result = await self._act(action, text, coordinate)
+            if self._prefetch_enabled:
+                self._prefetch_task = asyncio.create_task(self._prefetch_screenshot())
+                self.prefetch_stats["started"] += 1
+            return result
+        return await self._act(action, text, coordinate)
+
+    async def _act(self, action: Action, text: str | None, coordinate: list[int] | None):
         if action in ("mouse_move", "left_click_drag"):
             if coordinate is None:
                 raise ToolError(f"coordinate is required for {action}")
             if text is not None:
                 raise ToolError(f"text is not accepted for {action}")
             if not isinstance(coordinate, list) or len(coordinate) != 2:
-                raise ToolError(f"coordinate must be a list of length 2")
+                raise ToolError("coordinate must be a list of length 2")
             if not all(isinstance(i, int) and i >= 0 for i in coordinate):
-                raise ToolError(f"coordinate must be a list of non-negative integers")
+                raise ToolError("coordinate must be a list of non-negative integers")
 
             x, y = self.scale_coordinates(
                 ScalingSource.API, coordinate[0], coordinate[1]
             )
 
             if action == "mouse_move":
-                await asyncio.to_thread(pyautogui.moveTo, x, y)
+                await run_blocking("input", self._backend.moveTo, x, y)
                 return ToolResult(output=f"Mouse moved successfully to X={x}, Y={y}")
             elif action == "left_click_drag":
-                await asyncio.to_thread(pyautogui.mouseDown)
-                await asyncio.to_thread(pyautogui.moveTo, x, y)
-                await asyncio.to_thread(pyautogui.mouseUp)
+                await run_blocking("input", self._backend.mouseDown)
+                await run_blocking("input", self._backend.moveTo, x, y)
+                await run_blocking("input", self._backend.mouseUp)
                 return ToolResult(output="Mouse drag action completed.")
 
         if action in ("key", "type"):
@@ -162,7 +253,7 @@ class ComputerTool(BaseAnthropicTool):
                     # Add more special keys as needed
                 }
                 key_sequence = [special_keys.get(key, key) for key in key_sequence]
-                await asyncio.to_thread(pyautogui.hotkey, *key_sequence)
+                await run_blocking("input", self._backend.hotkey, *key_sequence)
                 return ToolResult(output=f"Key combination '{text}' pressed.")
             elif action == "type":
                 # Ensure text is a string
@@ -171,14 +262,14 @@ class ComputerTool(BaseAnthropicTool):
                 # Check if text ends with an "Enter" character
                 if text.endswith("\n"):
                     text = text.rstrip("\n")  # Remove the newline character
-                    await asyncio.to_thread(
-                        pyautogui.write, text, interval=TYPING_DELAY_MS / 1000.0
+                    await run_blocking(
+                        "input", self._backend.write, text, interval=TYPING_DELAY_MS / 1000.0
                     )
-                    await asyncio.to_thread(pyautogui.press, "enter")
+                    await run_blocking("input", self._backend.press, "enter")
                     return ToolResult(output=f"Typed text: {text} and pressed Enter")
                 else:
-                    await asyncio.to_thread(
-                        pyautogui.write, text, interval=TYPING_DELAY_MS / 1000.0
+                    await run_blocking(
+                        "input", self._backend.write, text, interval=TYPING_DELAY_MS / 1000.0
                     )
                     return ToolResult(output=f"Typed text: {text}")
 
@@ -197,37 +288,216 @@ class ComputerTool(BaseAnthropicTool):
             if action == "screenshot":
                 return await self.screenshot()
             elif action == "cursor_position":
-                x, y = pyautogui.position()
+                x, y = await run_blocking("input", self._backend.position)
                 x, y = self.scale_coordinates(ScalingSource.COMPUTER, int(x), int(y))
                 return ToolResult(output=f"X={x},Y={y}")
             else:
                 if action == "left_click":
-                    await asyncio.to_thread(pyautogui.click, button="left")
+                    await run_blocking("input", self._backend.click, button="left")
                     return ToolResult(output="Left click performed.")
                 elif action == "right_click":
-                    await asyncio.to_thread(pyautogui.click, button="right")
+                    await run_blocking("input", self._backend.click, button="right")
                     return ToolResult(output="Right click performed.")
                 elif action == "double_click":
-                    await asyncio.to_thread(pyautogui.doubleClick)
+                    await run_blocking("input", self._backend.doubleClick)
                     return ToolResult(output="Double click performed.")
 
         raise ToolError(f"Invalid action: {action}")
 
     async def screenshot(self):
         """Take a screenshot of the current screen and return the base64 encoded image."""
-        # Capture screenshot using PyAutoGUI
-        screenshot = await asyncio.to_thread(pyautogui.screenshot)
+        with tracer.span("computer.screenshot") as span:
+            prefetched = await self._take_prefetch()
+
+            # Capture screenshot using PyAutoGUI
+            with tracer.span("computer.screenshot.capture"):
+                screenshot = await run_blocking("capture", self._backend.screenshot)
+
+            # the prefetched encoding is only reused if nothing on screen has changed
+            if prefetched and await run_blocking(
+                "capture", _same_frame, prefetched.frame, screenshot
+            ):
+                self.prefetch_stats["hits"] += 1
+                self.prefetch_stats["seconds_saved"] += prefetched.encode_seconds
+                base64_image = prefetched.base64_image
+                span.set(prefetched=True)
+            else:
+                if prefetched:
+                    self.prefetch_stats["misses"] += 1
+                base64_image = await run_blocking("capture", self._encode_screenshot, screenshot)
+            span.set(width=self.target_width, height=self.target_height)
 
-        if self._scaling_enabled and self.scale_factor < 1.0:
-            screenshot = screenshot.resize((self.target_width, self.target_height))
+        return ToolResult(base64_image=base64_image)
 
-        img_buffer = io.BytesIO()
-        # Save the image to an in-memory buffer
-        screenshot.save(img_buffer, format="PNG", optimize=True)
-        img_buffer.seek(0)
-        base64_image = base64.b64encode(img_buffer.read()).decode()
+    def _encode_screenshot(self, screenshot) -> str:
+        """Downscale a capture to the target size and encode it as base64 PNG."""
+        if self._scaling_enabled and self.scale_factor < 1.0:
+            with tracer.span("computer.screenshot.resize"):
+                screenshot = screenshot.resize((self.target_width, self.target_height))
+
+        with tracer.span("computer.screenshot.encode") as encode_span:
+            img_buffer = io.BytesIO()
+            # Save the image to an in-memory buffer
+            screenshot.save(img_buffer, format="PNG", optimize=True)
+            encode_span.set(bytes=img_buffer.tell())
+            return base64.b64encode(img_buffer.getvalue()).decode()
+
+    async def warm_up(self):
+        # the first capture and PNG encode of a process are much slower than later ones
+        screenshot = await run_blocking("capture", self._backend.screenshot)
+        await run_blocking("capture", self._encode_screenshot, screenshot)
+
+    async def shutdown(self):
+        self._cancel_prefetch()
+
+    async def _prefetch_screenshot(self) -> _PrefetchedScreenshot | None:
+        await asyncio.sleep(self._screenshot_delay)
+        try:
+            frame = await run_blocking("capture", self._backend.screenshot)
+            self._prefetch_captured = True
+            started = time.perf_counter()
+            base64_image = await run_blocking("capture", self._encode_screenshot, frame)
+        except Exception:
+            # the real screenshot, if one is requested, will surface the error
+            return None
+        return _PrefetchedScreenshot(frame, base64_image, time.perf_counter() - started)
+
+    async def _take_prefetch(self) -> _PrefetchedScreenshot | None:
+        """The prefetched screenshot, if one has been captured; waits for its encoding."""
+        task, self._prefetch_task = self._prefetch_task, None
+        if task is None:
+            return None
+        if not self._prefetch_captured:
+            # still settling: capturing now is what would have happened without prefetch
+            task.cancel()
+            self._prefetch_captured = False
+            return None
+        self._prefetch_captured = False
+        return await task
+
+    def _cancel_prefetch(self):
+        if self._prefetch_task is not None:
+            self._prefetch_task.cancel()
+            self._prefetch_task = None
+        self._prefetch_captured = False
+
+    async def screenshot_region(
+        self, region: list[int], width: int | None = None
+    ) -> ToolResult:
+        """
+        Capture the rectangle `[x0, y0, x1, y1]`, given in API coordinates, at the native
+        resolution of the screen, or scaled to `width` pixels wide.
+        """
+        if width is not None and (not isinstance(width, int) or width <= 0):
+            raise ToolError("width must be a positive integer")
+        box = self._screen_box(region)
+
+        with tracer.span("computer.zoom") as span:
+            with tracer.span("computer.screenshot.capture"):
+                screenshot = await run_blocking("capture", self._backend.screenshot)
+            crop, base64_image = await run_blocking(
+                "capture", self._encode_region, self._crop(screenshot, box), width
+            )
+            span.set(width=crop.width, height=crop.height)
+
+        return ToolResult(
+            output=(
+                f"Region ({region[0]}, {region[1]})-({region[2]}, {region[3]}) "
+                f"at {crop.width}x{crop.height}px. Positions in this image are not screen "
+                "coordinates; use the screenshot coordinates to click."
+            ),
+            base64_image=base64_image,
+        )
 
-        return ToolResult(base64_image=base64_image)
+    def _encode_region(self, crop, width: int | None):
+        """Scale a region capture to `width`, within MAX_REGION_EDGE, and encode it as base64 PNG."""
+        target_width = width or crop.width
+        target_height = max(1, round(crop.height * target_width / crop.width))
+        shrink = min(1.0, MAX_REGION_EDGE / max(target_width, target_height))
+        target_width = max(1, round(target_width * shrink))
+        target_height = max(1, round(target_height * shrink))
+        if (target_width, target_height) != crop.size:
+            with tracer.span("computer.screenshot.resize"):
+                crop = crop.resize((target_width, target_height))
+
+        with tracer.span("computer.screenshot.encode") as encode_span:
+            img_buffer = io.BytesIO()
+            crop.save(img_buffer, format="PNG", optimize=True)
+            base64_image = base64.b64encode(img_buffer.getvalue()).decode()
+            encode_span.set(bytes=img_buffer.tell())
+        return crop, base64_image
+
+    async def wait_for_screen_change(
+        self,
+        region: list[int] | None = None,
+        until: WaitCondition = "change",
+        timeout: float = 30.0,
+    ) -> ToolResult:
+        """
+        Watch the screen, or the `region` of it given in API coordinates, until it
+        changes or until it stops changing, then take one screenshot. Polling compares
+        low-resolution hashes, so each check costs a capture but no encoding.
+        """
+        if until not in ("change", "settle"):
+            raise ToolError('until must be "change" or "settle"')
+        if not isinstance(timeout, (int, float)) or timeout <= 0:
+            raise ToolError("timeout must be a positive number of seconds")
+        timeout = min(timeout, MAX_WAIT_SECONDS)
+        box = self._screen_box(region) if region is not None else None
+
+        with tracer.span("computer.wait", until=until) as span:
+            started = time.monotonic()
+            baseline = last = await self._screen_hash(box)
+            last_change = started
+            polls = 0
+            outcome = None
+            while outcome is None:
+                await asyncio.sleep(WAIT_POLL_INTERVAL)
+                current = await self._screen_hash(box)
+                polls += 1
+                now = time.monotonic()
+                if (current ^ last).bit_count() > CHANGE_THRESHOLD_BITS:
+                    last_change = now
+                last = current
+                if until == "change" and (current ^ baseline).bit_count() > CHANGE_THRESHOLD_BITS:
+                    outcome = f"The screen changed after {now - started:.1f}s."
+                elif until == "settle" and now - last_change >= SETTLE_SECONDS:
+                    outcome = f"The screen was stable after {last_change - started:.1f}s."
+                elif now - started >= timeout:
+                    outcome = (
+                        f"Timed out after {timeout:.0f}s; the screen "
+                        f"{'did not change' if until == 'change' else 'was still changing'}."
+                    )
+            span.set(polls=polls, seconds=round(time.monotonic() - started, 3))
+
+        return (await self.screenshot()).replace(output=outcome)
+
+    async def _screen_hash(self, box: tuple[int, int, int, int] | None) -> int:
+        def capture_and_hash():
+            screenshot = self._backend.screenshot()
+            return dhash(self._crop(screenshot, box) if box else screenshot)
+
+        return await run_blocking("capture", capture_and_hash)
+
+    def _screen_box(self, region: list[int]) -> tuple[int, int, int, int]:
+        """Validate a `[x0, y0, x1, y1]` region in API coordinates and map it to the screen."""
+        if not isinstance(region, list) or len(region) != 4:
+            raise ToolError("region must be a list of 4 integers [x0, y0, x1, y1]")
+        if not all(isinstance(i, int) and i >= 0 for i in region):
+            raise ToolError("region must be a list of non-negative integers")
+        x0, y0 = self.scale_coordinates(ScalingSource.API, region[0], region[1])
+        x1, y1 = self.scale_coordinates(ScalingSource.API, region[2], region[3])
+        x0, x1 = sorted((min(x0, self.width), min(x1, self.width)))
+        y0, y1 = sorted((min(y0, self.height), min(y1, self.height)))
+        if x1 - x0 < 1 or y1 - y0 < 1:
+            raise ToolError(f"region {region} is empty or outside the screen")
+        return x0, y0, x1, y1
+
+    def _crop(self, screenshot, box: tuple[int, int, int, int]):
+        # on Retina displays the capture has more pixels than the logical screen size,
+        # so crop in capture pixels rather than passing a region to the backend
+        ratio = screenshot.width / self.width
+        return screenshot.crop(tuple(round(v * ratio) for v in box))
 
     def scale_coordinates(self, source: ScalingSource, x: int, y: int):
         """Scale coordinates between the assistant's coordinate system and the real screen coordinates."""
@@ -4,8 +4,11 @@ from typing import Literal, get_args
 
 from anthropic.types.beta import BetaToolTextEditor20241022Param
 
+from ..executors import run_blocking
+from ..tracing import tracer
 from .base import BaseAnthropicTool, CLIResult, ToolError, ToolResult
 from .run import maybe_truncate, run
+from .search_index import WorkspaceIndex
 
 Command = Literal[
     "view",
@@ -13,8 +16,12 @@ Command = Literal[
     "str_replace",
     "insert",
     "undo_edit",
+    "search",
 ]
 SNIPPET_LINES: int = 4
+SEARCH_LIMIT: int = 50
+# seconds a walk of the tree is trusted by the next searches; see `WorkspaceIndex.refresh`
+SEARCH_REFRESH_SECONDS: float = 5.0
 
 
 class EditTool(BaseAnthropicTool):
@@ -27,11 +34,18 @@ class EditTool(BaseAnthropicTool):
     name: Literal["str_replace_editor"] = "str_replace_editor"
 
     _file_history: dict[Path, list[str]]
+    # one index per directory searched, kept for the session and refreshed from mtimes
+    _indexes: dict[Path, WorkspaceIndex]
 
     def __init__(self):
         self._file_history = defaultdict(list)
+        self._indexes = {}
         super().__init__()
 
+    async def shutdown(self):
+        for index in self._indexes.values():
+            index.close()
+
     def to_params(self) -> BetaToolTextEditor20241022Param:
         return {
             "name": self.name,
@@ -48,37 +62,44 @@ class EditTool(BaseAnthropicTool):
         old_str: str | None = None,
         new_str: str | None = None,
         insert_line: int | None = None,
+        query: str | None = None,
+        limit: int = SEARCH_LIMIT,
         **kwargs,
     ):
-        _path = Path(path)
-        self.validate_path(command, _path)
-        if command == "view":
-            return await self.view(_path, view_range)
-        elif command == "create":
-            if not file_text:
-                raise ToolError("Parameter `file_text` is required for command: create")
-            self.write_file(_path, file_text)
-            self._file_history[_path].append(file_text)
-            return ToolResult(output=f"File created successfully at: {_path}")
-        elif command == "str_replace":
-            if not old_str:
-                raise ToolError(
-                    "Parameter `old_str` is required for command: str_replace"
-                )
-            return self.str_replace(_path, old_str, new_str)
-        elif command == "insert":
-            if insert_line is None:
-                raise ToolError(
-                    "Parameter `insert_line` is required for command: insert"
-                )
-            if not new_str:
-                raise ToolError("Parameter `new_str` is required for command: insert")
-            return self.insert(_path, insert_line, new_str)
-        elif command == "undo_edit":
-            return self.undo_edit(_path)
-        raise ToolError(
-            f'Unrecognized command {command}. The allowed commands for the {self.name} tool are: {", ".join(get_args(Command))}'
-        )
+        with tracer.span("edit.command", command=command):
+            _path = Path(path)
+            self.validate_path(command, _path)
+            if command == "view":
+                return await self.view(_path, view_range)
+            elif command == "create":
+                if not file_text:
+                    raise ToolError("Parameter `file_text` is required for command: create")
+                await self.write_file(_path, file_text)
+                self._file_history[_path].append(file_text)
+                return ToolResult(output=f"File created successfully at: {_path}")
+            elif command == "search":
+                if not query:
+                    raise ToolError("Parameter `query` is required for command: search")
+                return await self.search(_path, query, limit)
+            elif command == "str_replace":
+                if not old_str:
+                    raise ToolError(
+                        "Parameter `old_str` is required for command: str_replace"
+                    )
+                return await self.str_replace(_path, old_str, new_str)
+            elif command == "insert":
+                if insert_line is None:
+                    raise ToolError(
+                        "Parameter `insert_line` is required for command: insert"
+                    )
+                if not new_str:
+                    raise ToolError("Parameter `new_str` is required for command: insert")
+                return await self.insert(_path, insert_line, new_str)
+            elif command == "undo_edit":
+                return await self.undo_edit(_path)
+            raise ToolError(
+                f'Unrecognized command {command}. The allowed commands for the {self.name} tool are: {", ".join(get_args(Command))}'
+            )
 
     def validate_path(self, command: str, path: Path):
         """
@@ -101,10 +122,14 @@ class EditTool(BaseAnthropicTool):
             )
         # Check if the path points to a directory
         if path.is_dir():
-            if command != "view":
+            if command not in ("view", "search"):
                 raise ToolError(
-                    f"The path {path} is a directory and only the `view` command can be used on directories"
+                    f"The path {path} is a directory and only the `view` and `search` commands can be used on directories"
                 )
+        elif command == "search":
+            raise ToolError(
+                f"The path {path} is not a directory. The `search` command searches the files under a directory."
+            )
 
     async def view(self, path: Path, view_range: list[int] | None = None):
         """Implement the view command"""
@@ -114,14 +139,15 @@ class EditTool(BaseAnthropicTool):
                     "The `view_range` parameter is not allowed when `path` points to a directory."
                 )
 
+            # the listing is clipped anyway, so a huge tree isn't walked to the end
             _, stdout, stderr = await run(
-                rf"find {path} -maxdepth 2 -not -path '*/\.*'"
+                rf"find {path} -maxdepth 2 -not -path '*/\.*'", stop_early=True
             )
             if not stderr:
                 stdout = f"Here's the files and directories up to 2 levels deep in {path}, excluding hidden items:\n{stdout}\n"
             return CLIResult(output=stdout, error=stderr)
 
-        file_content = self.read_file(path)
+        file_content = await self.read_file(path)
         init_line = 1
         if view_range:
             if len(view_range) != 2 or not all(isinstance(i, int) for i in view_range):
@@ -153,10 +179,42 @@ class EditTool(BaseAnthropicTool):
             output=self._make_output(file_content, str(path), init_line=init_line)
         )
 
-    def str_replace(self, path: Path, old_str: str, new_str: str | None):
+    async def search(self, path: Path, query: str, limit: int = SEARCH_LIMIT):
+        """Implement the search command: ranked `path:line` hits for `query` under `path`."""
+        index = self._index_for(path)
+        with tracer.span("edit.search") as span:
+            refreshed = await run_blocking("io", index.refresh, SEARCH_REFRESH_SECONDS)
+            hits, total = await run_blocking(
+                "io",
+                index.search, query, limit, path if path != index.root else None
+            )
+            span.set(
+                files=refreshed.files,
+                changed=refreshed.changed,
+                refreshed=not refreshed.skipped,
+                hits=total,
+            )
+        if not hits:
+            return CLIResult(output=f"No matches for `{query}` in {path}.")
+        shown = f", showing the best {len(hits)}" if total > len(hits) else ""
+        lines = [f"{hit.path}:{hit.line}: {hit.snippet}" for hit in hits]
+        return CLIResult(
+            output=f"Found {total} matches for `{query}` in {path}{shown}:\n"
+            + maybe_truncate("\n".join(lines))
+        )
+
+    def _index_for(self, path: Path) -> WorkspaceIndex:
+        """The index covering `path`, reusing the index of a directory above it."""
+        for root, index in self._indexes.items():
+            if path == root or root in path.parents:
+                return index
+        index = self._indexes[path] = WorkspaceIndex(path)
+        return index
+
+    async def str_replace(self, path: Path, old_str: str, new_str: str | None):
         """Implement the str_replace command, which replaces old_str with new_str in the file content"""
         # Read the file content
-        file_content = self.read_file(path).expandtabs()
+        file_content = (await self.read_file(path)).expandtabs()
         old_str = old_str.expandtabs()
         new_str = new_str.expandtabs() if new_str is not None else ""
 
@@ -181,7 +239,7 @@ class EditTool(BaseAnthropicTool):
         new_file_content = file_content.replace(old_str, new_str)
 
         # Write the new content to the file
-        self.write_file(path, new_file_content)
+        await self.write_file(path, new_file_content)
 
         # Save the content to history
         self._file_history[path].append(file_content)
@@ -201,9 +259,9 @@ class EditTool(BaseAnthropicTool):
 
         return CLIResult(output=success_msg)
 
-    def insert(self, path: Path, insert_line: int, new_str: str):
+    async def insert(self, path: Path, insert_line: int, new_str: str):
         """Implement the insert command, which inserts new_str at the specified line in the file content."""
-        file_text = self.read_file(path).expandtabs()
+        file_text = (await self.read_file(path)).expandtabs()
         new_str = new_str.expandtabs()
         file_text_lines = file_text.split("\n")
         n_lines_file = len(file_text_lines)
@@ -228,7 +286,7 @@ class EditTool(BaseAnthropicTool):
         new_file_text = "\n".join(new_file_text_lines)
         snippet = "\n".join(snippet_lines)
 
-        self.write_file(path, new_file_text)
+        await self.write_file(path, new_file_text)
         self._file_history[path].append(file_text)
 
         success_msg = f"The file {path} has been edited. "
@@ -240,31 +298,38 @@ class EditTool(BaseAnthropicTool):
         success_msg += "Review the changes and make sure they are as expected (correct indentation, no duplicate lines, etc). Edit the file again if necessary."
         return CLIResult(output=success_msg)
 
-    def undo_edit(self, path: Path):
+    async def undo_edit(self, path: Path):
         """Implement the undo_edit command."""
         if not self._file_history[path]:
             raise ToolError(f"No edit history found for {path}.")
 
         old_text = self._file_history[path].pop()
-        self.write_file(path, old_text)
+        await self.write_file(path, old_text)
 
         return CLIResult(
             output=f"Last edit to {path} undone successfully. {self._make_output(old_text, str(path))}"
         )
 
-    def read_file(self, path: Path):
+    async def read_file(self, path: Path):
         """Read the content of a file from a given path; raise a ToolError if an error occurs."""
         try:
-            return path.read_text()
+            with tracer.span("edit.read_file") as span:
+                content = await run_blocking("io", path.read_text)
+                span.set(bytes=len(content))
+            return content
         except Exception as e:
             raise ToolError(f"Ran into {e} while trying to read {path}") from None
 
-    def write_file(self, path: Path, file: str):
+    async def write_file(self, path: Path, file: str):
         """Write the content of a file to a given path; raise a ToolError if an error occurs."""
         try:
-            path.write_text(file)
+            with tracer.span("edit.write_file", bytes=len(file)):
+                await run_blocking("io", path.write_text, file)
         except Exception as e:
             raise ToolError(f"Ran into {e} while trying to write to {path}") from None
+        for root, index in self._indexes.items():
+            if root in path.parents:
+                await run_blocking("io", index.update, path)
 
     def _make_output(
         self,
@@ -0,0 +1,110 @@
+"""
+Input pacing for `ComputerTool`.
+
+pyautogui sleeps for its global `PAUSE` (0.1 s) after every call, whatever the call
+did: a key chord pays it once, a drag three times, and typing pays it on top of the
+per-character interval. A `PacingProfile` replaces it with a delay per kind of action,
+so actions the host handles at once don't wait, and only the ones that need time (a
+context menu opening, a drag being picked up) do. Profiles for a host can be measured
+with `python -m computer_use_demo.bench.pacing`.
+
+`ComputerTool` uses the profile named by the `COMPUTER_USE_PACING` environment variable,
+either one of `PROFILES` or the path of a JSON file saved by the calibration; without
+it, pyautogui's global pause applies as before.
+"""
+
+import json
+import os
+import time
+from dataclasses import asdict, dataclass, fields
+from pathlib import Path
+from typing import Any
+
+PACING_ENV = "COMPUTER_USE_PACING"
+
+
+@dataclass(frozen=True)
+class PacingProfile:
+    """Seconds to wait after each kind of input before the next one is sent."""
+
+    key: float = 0.0  # after a key chord or a key press
+    type_interval: float = 0.012  # between typed characters, as TYPING_DELAY_MS
+    move: float = 0.0  # after moving the pointer
+    click: float = 0.0  # after a left or double click
+    menu: float = 0.0  # after a right click, for a context menu to open
+    drag_hold: float = 0.0  # after pressing and after moving the button of a drag
+
+    @classmethod
+    def load(cls, name_or_path: str | os.PathLike) -> "PacingProfile":
+        """One of `PROFILES`, or a profile saved as JSON."""
+        if str(name_or_path) in PROFILES:
+            return PROFILES[str(name_or_path)]
+        values = json.loads(Path(name_or_path).read_text())
+        known = {field.name for field in fields(cls)}
+        return cls(**{name: float(value) for name, value in values.items() if name in known})
+
+    def save(self, path: str | os.PathLike):
+        Path(path).write_text(json.dumps(asdict(self), indent=2) + "\n")
+
+
+PROFILES = {
+    # what pyautogui's global pause amounts to
+    "pyautogui": PacingProfile(key=0.1, move=0.1, click=0.1, menu=0.1, drag_hold=0.1),
+    # no waits but where input is known to race the UI on a typical X server
+    "fast": PacingProfile(type_interval=0.004, menu=0.05, drag_hold=0.03),
+}
+
+
+def pacing_from_env() -> PacingProfile | None:
+    value = os.getenv(PACING_ENV)
+    return PacingProfile.load(value) if value else None
+
+
+class PacedBackend:
+    """
+    Wraps pyautogui, or anything exposing the same subset of its API, so that calls skip
+    the global pause and wait as long as `profile` says instead.
+    """
+
+    def __init__(self, backend: Any, profile: PacingProfile):
+        self._backend = backend
+        self.profile = profile
+        self._button_down = False
+
+    def __getattr__(self, name: str):
+        # size, position, screenshot and anything else that isn't input
+        return getattr(self._backend, name)
+
+    def moveTo(self, x, y, **kwargs):
+        delay = self.profile.drag_hold if self._button_down else self.profile.move
+        self._call("moveTo", delay, x, y, **kwargs)
+
+    def mouseDown(self, **kwargs):
+        self._button_down = True
+        self._call("mouseDown", self.profile.drag_hold, **kwargs)
+
+    def mouseUp(self, **kwargs):
+        self._button_down = False
+        self._call("mouseUp", self.profile.click, **kwargs)
+
+    def click(self, button: str = "left", **kwargs):
+        delay = self.profile.menu if button == "right" else self.profile.click
+        self._call("click", delay, button=button, **kwargs)
+
+    def doubleClick(self, **kwargs):
+        self._call("doubleClick", self.profile.click, **kwargs)
+
+    def hotkey(self, *keys: str, **kwargs):
+        self._call("hotkey", self.profile.key, *keys, **kwargs)
+
+    def press(self, key: str, **kwargs):
+        self._call("press", self.profile.key, key, **kwargs)
+
+    def write(self, text: str, interval: float | None = None, **kwargs):
+        # the profile's interval wins over the caller's, which assumes pyautogui's pause
+        self._call("write", self.profile.key, text, interval=self.profile.type_interval, **kwargs)
+
+    def _call(self, name: str, delay: float, *args, **kwargs):
+        getattr(self._backend, name)(*args, _pause=False, **kwargs)
+        if delay > 0:
+            time.sleep(delay)
@@ -1,9 +1,13 @@
 """Utility to run shell commands asynchronously with a timeout."""
 
 import asyncio
+import os
+import signal
+import sys
 
 TRUNCATED_MESSAGE: str = "<response clipped><NOTE>To save on context only part of this file has been shown to you. You should retry this tool after you have searched inside the file with `grep -n` in order to find the line numbers of what you are looking for.</NOTE>"
 MAX_RESPONSE_LEN: int = 16000
+READ_CHUNK_BYTES: int = 64 * 1024
 
 
 def maybe_truncate(content: str, truncate_after: int | None = MAX_RESPONSE_LEN):
@@ -15,28 +19,132 @@ def maybe_truncate(content: str, truncate_after: int | None = MAX_RESPONSE_LEN):
     )
 
 
+class _CappedOutput:
+    """
+    Keeps the first bytes of a stream, and optionally the last ones, up to `limit` in
+    total, and counts the bytes in between that were dropped.
+    """
+
+    def __init__(self, limit: int | None, keep_tail: bool):
+        if not limit:
+            self.head_limit, self.tail_limit = sys.maxsize, 0
+        elif keep_tail:
+            self.head_limit, self.tail_limit = limit - limit // 2, limit // 2
+        else:
+            self.head_limit, self.tail_limit = limit, 0
+        self.head = bytearray()
+        self.tail = bytearray()
+        self.dropped = 0
+
+    @property
+    def overflowed(self) -> bool:
+        """Whether the stream went past the limit with nothing more of it to be kept."""
+        return self.dropped > 0 and not self.tail_limit
+
+    def feed(self, chunk: bytes):
+        room = self.head_limit - len(self.head)
+        if room > 0:
+            self.head += chunk[:room]
+            chunk = chunk[room:]
+        if not self.tail_limit:
+            self.dropped += len(chunk)
+            return
+        self.tail += chunk
+        excess = len(self.tail) - self.tail_limit
+        if excess > 0:
+            del self.tail[:excess]
+            self.dropped += excess
+
+    def text(self, stopped: bool = False) -> str:
+        if not self.dropped and not stopped:
+            return (self.head + self.tail).decode(errors="replace")
+        # only a character split by the cut is dropped; invalid bytes elsewhere show up
+        # as usual
+        head = _trim_partial_utf8(self.head).decode(errors="replace")
+        clipped = (
+            f"output stopped after {len(self.head) + self.dropped} bytes"
+            if stopped
+            else f"{self.dropped} bytes omitted"
+        )
+        text = f"{head}{TRUNCATED_MESSAGE}\n({clipped})"
+        if not self.tail:
+            return text
+        tail = _skip_continuation_bytes(self.tail).decode(errors="replace")
+        return f"{text}\n{tail}"
+
+
+def _trim_partial_utf8(data: bytes) -> bytes:
+    """`data` without a multi-byte UTF-8 sequence cut off at its end."""
+    for back in range(1, min(4, len(data)) + 1):
+        byte = data[-back]
+        if byte & 0xC0 != 0x80:  # the last byte that isn't a continuation byte
+            length = 4 if byte >= 0xF0 else 3 if byte >= 0xE0 else 2 if byte >= 0xC0 else 1
+            return data[:-back] if length > back else data
+    return data
+
+
+def _skip_continuation_bytes(data: bytes) -> bytes:
+    """`data` without the rest of a multi-byte UTF-8 sequence cut off at its start."""
+    start = 0
+    while start < min(3, len(data)) and data[start] & 0xC0 == 0x80:
+        start += 1
+    return data[start:]
+
+
 async def run(
     cmd: str,
     timeout: float | None = 120.0,  # seconds
     truncate_after: int | None = MAX_RESPONSE_LEN,
+    keep_tail: bool = False,
+    stop_early: bool = False,
 ):
-    """Run a shell command asynchronously with a timeout."""
+    """
+    Run a shell command asynchronously with a timeout.
+
+    stdout and stderr are read as they are produced and only `truncate_after` bytes of
+    each are kept: the start, or the start and the end with `keep_tail`. With
+    `stop_early` the command is killed as soon as one of them goes past the limit, for
+    commands whose output is only useful up to it.
+    """
     process = await asyncio.create_subprocess_shell(
-        cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+        cmd,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        # its own process group, so killing it also kills the commands it started
+        start_new_session=True,
     )
+    stdout = _CappedOutput(truncate_after, keep_tail)
+    stderr = _CappedOutput(truncate_after, keep_tail)
+    stopped = False
+
+    async def drain(reader: asyncio.StreamReader, output: _CappedOutput):
+        nonlocal stopped
+        while chunk := await reader.read(READ_CHUNK_BYTES):
+            if stopped:
+                continue  # discard what was still in the pipe
+            output.feed(chunk)
+            if stop_early and output.overflowed:
+                stopped = True
+                _kill(process)
 
     try:
-        stdout, stderr = await asyncio.wait_for(process.communicate(), timeout=timeout)
-        return (
-            process.returncode or 0,
-            maybe_truncate(stdout.decode(), truncate_after=truncate_after),
-            maybe_truncate(stderr.decode(), truncate_after=truncate_after),
-        )
-    except asyncio.TimeoutError as exc:
-        try:
-            process.kill()
-        except ProcessLookupError:
-            pass
+        async with asyncio.timeout(timeout):
+            await asyncio.gather(drain(process.stdout, stdout), drain(process.stderr, stderr))
+            await process.wait()
+    except TimeoutError as exc:
+        _kill(process)
         raise TimeoutError(
             f"Command '{cmd}' timed out after {timeout} seconds"
         ) from exc
+    return (
+        0 if stopped else process.returncode or 0,
+        stdout.text(stopped and stdout.overflowed),
+        stderr.text(stopped and stderr.overflowed),
+    )
+
+
+def _kill(process: asyncio.subprocess.Process):
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
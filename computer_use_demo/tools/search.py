@@ -0,0 +1,60 @@
+from typing import ClassVar, Literal
+
+from anthropic.types.beta import BetaToolParam
+
+from ..logs import get_logger
+from .base import BaseAnthropicTool, ToolResult
+from .edit import SEARCH_LIMIT, EditTool
+
+logger = get_logger(__name__)
+
+
+class SearchTool(BaseAnthropicTool):
+    """
+    A companion to the editor tool that exposes its indexed `search` command, since the
+    editor's own parameters are defined by Anthropic and can't describe it.
+    """
+
+    name: ClassVar[Literal["search"]] = "search"
+
+    def __init__(self, editor: EditTool):
+        self.editor = editor
+        super().__init__()
+
+    async def __call__(
+        self, *, path: str, query: str, limit: int = SEARCH_LIMIT, **kwargs
+    ) -> ToolResult:
+        logger.info("Searching", path=path, query=query, limit=limit)
+        return await self.editor(command="search", path=path, query=query, limit=limit)
+
+    def to_params(self) -> BetaToolParam:
+        return {
+            "name": self.name,
+            "description": (
+                "Search the text files under a directory for a literal string "
+                "(case-insensitive) and return ranked `path:line: text` matches. The "
+                "directory is indexed on first use and kept up to date, so repeated "
+                "searches are much faster than `grep -rn` or `find` in the bash tool. "
+                "Hidden directories, node_modules and files over 1 MB are skipped."
+            ),
+            "input_schema": {
+                "type": "object",
+                "properties": {
+                    "path": {
+                        "type": "string",
+                        "description": "Absolute path of the directory to search.",
+                    },
+                    "query": {
+                        "type": "string",
+                        "description": "The text to look for.",
+                    },
+                    "limit": {
+                        "type": "integer",
+                        "minimum": 1,
+                        "maximum": 500,
+                        "description": f"Most matches to return. Defaults to {SEARCH_LIMIT}.",
+                    },
+                },
+                "required": ["path", "query"],
+            },
+        }
@@ -0,0 +1,270 @@
+"""
+In-memory trigram index of the text files under a workspace root.
+
+Each file is summarized by a fixed-size signature: a bitset with one bit set per
+trigram of its distinct lowercased words. Any word-character trigram of a query lies
+inside one word of a matching line, so a search only reads the files whose signature
+contains every bit of the query's, instead of reading the whole tree like `grep -rn`
+does on every call. A signature takes 512 bytes whatever the file's size, so a tree of
+100k files costs about 50 MB; the odd false positive is weeded out when the file is read.
+
+`refresh` re-stats the tree (no reads) before a search, so files changed outside the
+editor are picked up from their mtimes. That walk costs O(files), some 12-17 us a file
+or 25-35 ms for 2000 files, far more than the search itself; so with `max_age` it is
+skipped while the last one is that recent and nothing called `mark_changed` since. The
+editor's own writes go through `update` and the bash tool marks every command it runs,
+so only files changed some other way (e.g. saved from a GUI app) can be up to `max_age`
+stale. New and changed files are read and signed by a background thread; until then a
+search simply reads them, so the first search of a large tree costs about as much as a
+`grep -rn` instead of waiting for the whole build.
+"""
+
+import heapq
+import os
+import re
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from pathlib import Path
+
+MAX_FILE_BYTES = 1024 * 1024  # larger files are not indexed
+SKIPPED_DIRS = frozenset({"node_modules", "__pycache__", "venv", "dist", "build"})
+SIGNATURE_BITS = 4096
+SNIPPET_CHARS = 200
+_WORD = re.compile(r"\w{3,}")
+_BINARY = -1  # signature of files that are never searched
+
+_generation = 0  # bumped by `mark_changed`
+
+
+def mark_changed():
+    """Files may have changed behind the indexes' backs (e.g. a shell command ran)."""
+    global _generation
+    _generation += 1
+
+
+@dataclass(frozen=True)
+class SearchHit:
+    path: str
+    line: int
+    snippet: str
+    score: int
+
+
+@dataclass
+class _File:
+    mtime_ns: int
+    size: int
+    signature: int | None = None  # None until the file has been read
+
+
+@dataclass
+class RefreshStats:
+    files: int = 0
+    changed: int = 0
+    removed: int = 0
+    skipped: bool = False  # the walk was skipped, the last one being recent enough
+
+
+class _Reversed:
+    """Orders a heap largest first, so its root is the worst of the hits kept."""
+
+    __slots__ = ("key",)
+
+    def __init__(self, key: tuple):
+        self.key = key
+
+    def __lt__(self, other: "_Reversed") -> bool:
+        return other.key < self.key
+
+
+def trigrams(text: str) -> set[str]:
+    """The trigrams inside the words of `text`, lowercased."""
+    grams = set()
+    for word in set(_WORD.findall(text.lower())):
+        grams.update(word[i : i + 3] for i in range(len(word) - 2))
+    return grams
+
+
+def signature(text: str) -> int:
+    bits = bytearray(SIGNATURE_BITS // 8)
+    for gram in trigrams(text):
+        bit = hash(gram) & (SIGNATURE_BITS - 1)
+        bits[bit >> 3] |= 1 << (bit & 7)
+    return int.from_bytes(bits, "little")
+
+
+class WorkspaceIndex:
+    """A trigram index of the files under `root`, skipping hidden and vendored directories."""
+
+    def __init__(self, root: str | os.PathLike):
+        self.root = Path(root)
+        self._files: dict[str, _File] = {}
+        self._pending: deque[str] = deque()
+        self._lock = threading.Lock()
+        self._idle = threading.Event()
+        self._idle.set()
+        self._closed = False
+        self._refreshed: tuple[float, int] | None = None  # (monotonic time, generation)
+
+    def refresh(self, max_age: float = 0.0) -> RefreshStats:
+        """
+        Re-stat the tree; added and changed files are queued to be read again. The walk
+        is skipped if the last one is under `max_age` seconds old and no `mark_changed`
+        happened since.
+        """
+        now, generation = time.monotonic(), _generation
+        last = self._refreshed
+        if last and last[1] == generation and now - last[0] < max_age:
+            with self._lock:
+                return RefreshStats(files=len(self._files), skipped=True)
+        stats = RefreshStats()
+        seen = set()
+        walked = list(self._walk())
+        with self._lock:
+            for path, stat in walked:
+                seen.add(path)
+                known = self._files.get(path)
+                if known and known.mtime_ns == stat.st_mtime_ns and known.size == stat.st_size:
+                    continue
+                self._files[path] = _File(stat.st_mtime_ns, stat.st_size)
+                self._pending.append(path)
+                stats.changed += 1
+            for path in self._files.keys() - seen:
+                del self._files[path]
+                stats.removed += 1
+            stats.files = len(self._files)
+            if self._pending and not self._closed:
+                self._start_indexer()
+        self._refreshed = (now, generation)
+        return stats
+
+    def update(self, path: str | os.PathLike):
+        """Re-sign one file right after it was written, without walking the tree."""
+        path = os.fspath(path)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            with self._lock:
+                self._files.pop(path, None)
+            return
+        file = _File(stat.st_mtime_ns, stat.st_size, _sign(path))
+        with self._lock:
+            self._files[path] = file
+
+    def wait_until_indexed(self, timeout: float | None = None) -> bool:
+        """Block until every known file has been read; returns False on timeout."""
+        return self._idle.wait(timeout)
+
+    def close(self):
+        """Stop the background indexing; searches still work, reading unindexed files."""
+        self._closed = True
+
+    def search(
+        self, query: str, limit: int = 50, within: str | os.PathLike | None = None
+    ) -> tuple[list[SearchHit], int]:
+        """
+        Case-insensitive literal search, optionally only in the files under `within`.
+        Returns the best `limit` hits and the total number of matching lines; exact-case
+        and whole-word matches rank first.
+        """
+        if not query:
+            return [], 0
+        wanted = signature(query)
+        with self._lock:
+            paths = [
+                path
+                for path, file in self._files.items()
+                if file.signature is None
+                or (file.signature != _BINARY and file.signature & wanted == wanted)
+            ]
+        if within is not None:
+            prefix = os.path.join(os.fspath(within), "")
+            paths = [path for path in paths if path.startswith(prefix)]
+
+        needle = query.lower()
+        word = re.compile(rf"(?<!\w){re.escape(query)}(?!\w)", re.IGNORECASE)
+        best = []  # the top `limit` keys (-score, path, line, text) so far
+        total = 0
+        for path in paths:
+            text = _read_text(path)
+            if text is None:
+                continue
+            lowered = text.lower()
+            if needle not in lowered:  # a false positive of the signature
+                continue
+            lines = text.split("\n")
+            in_name = needle in os.path.basename(path).lower()
+            for number, line in enumerate(lowered.split("\n"), start=1):
+                if needle not in line:
+                    continue
+                total += 1
+                original = lines[number - 1]
+                score = (query in original) * 2 + bool(word.search(original)) * 2 + in_name
+                key = (-score, path, number, original)
+                if len(best) < limit:
+                    heapq.heappush(best, _Reversed(key))
+                elif key < best[0].key:
+                    heapq.heapreplace(best, _Reversed(key))
+        hits = [
+            SearchHit(path, number, line.strip()[:SNIPPET_CHARS], -score)
+            for score, path, number, line in sorted(item.key for item in best)
+        ]
+        return hits, total
+
+    def _walk(self):
+        stack = [self.root]
+        while stack:
+            try:
+                entries = list(os.scandir(stack.pop()))
+            except OSError:
+                continue
+            for entry in entries:
+                if entry.name.startswith("."):
+                    continue
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if entry.name not in SKIPPED_DIRS:
+                            stack.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        stat = entry.stat(follow_symlinks=False)
+                        if stat.st_size <= MAX_FILE_BYTES:
+                            yield entry.path, stat
+                except OSError:
+                    continue
+
+    def _start_indexer(self):
+        # called with the lock held; the indexer only goes idle with the lock held too
+        if self._idle.is_set():
+            self._idle.clear()
+            threading.Thread(target=self._index_pending, name="search-index", daemon=True).start()
+
+    def _index_pending(self):
+        while True:
+            with self._lock:
+                if not self._pending or self._closed:
+                    self._idle.set()
+                    return
+                path = self._pending.popleft()
+                file = self._files.get(path)
+            if file is not None and file.signature is None:
+                # a file changed meanwhile has a new entry, queued again
+                file.signature = _sign(path)
+
+
+def _sign(path: str) -> int:
+    text = _read_text(path)
+    return _BINARY if text is None else signature(text)
+
+
+def _read_text(path: str) -> str | None:
+    """The file's text, or None if it can't be read or looks binary."""
+    try:
+        with open(path, "rb") as f:
+            data = f.read(MAX_FILE_BYTES + 1)
+    except OSError:
+        return None
+    if len(data) > MAX_FILE_BYTES or b"\0" in data[:8192]:
+        return None
+    return data.decode("utf-8", errors="ignore")
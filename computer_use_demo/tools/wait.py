@@ -0,0 +1,73 @@
+from typing import ClassVar, Literal
+
+from anthropic.types.beta import BetaToolParam
+
+from ..logs import get_logger
+from .base import BaseAnthropicTool, ToolResult
+from .computer import MAX_WAIT_SECONDS, ComputerTool, WaitCondition
+
+logger = get_logger(__name__)
+
+
+class WaitTool(BaseAnthropicTool):
+    """
+    A companion to the computer tool that blocks until the screen changes or settles,
+    so waiting for a page load or a build takes one call instead of repeated screenshots.
+    """
+
+    name: ClassVar[Literal["wait_for_screen_change"]] = "wait_for_screen_change"
+
+    def __init__(self, computer: ComputerTool):
+        self.computer = computer
+        super().__init__()
+
+    async def __call__(
+        self,
+        *,
+        region: list[int] | None = None,
+        until: WaitCondition = "change",
+        timeout: float = 30.0,
+        **kwargs,
+    ) -> ToolResult:
+        logger.info("Waiting for the screen", until=until, region=region, timeout=timeout)
+        return await self.computer.wait_for_screen_change(region, until, timeout)
+
+    def to_params(self) -> BetaToolParam:
+        return {
+            "name": self.name,
+            "description": (
+                "Wait until the screen (or a region of it) changes, or until it stops "
+                "changing, then return a screenshot. Use this instead of taking repeated "
+                "screenshots while a page loads, an app starts or a command runs."
+            ),
+            "input_schema": {
+                "type": "object",
+                "properties": {
+                    "region": {
+                        "type": "array",
+                        "items": {"type": "integer", "minimum": 0},
+                        "minItems": 4,
+                        "maxItems": 4,
+                        "description": (
+                            "[x0, y0, x1, y1] in screenshot coordinates. Defaults to "
+                            "the whole screen."
+                        ),
+                    },
+                    "until": {
+                        "type": "string",
+                        "enum": ["change", "settle"],
+                        "description": (
+                            '"change" returns as soon as the region differs from when '
+                            'the wait started; "settle" returns once it has stopped '
+                            "changing for a second."
+                        ),
+                    },
+                    "timeout": {
+                        "type": "number",
+                        "exclusiveMinimum": 0,
+                        "maximum": MAX_WAIT_SECONDS,
+                        "description": "Seconds to wait at most. Defaults to 30.",
+                    },
+                },
+            },
+        }
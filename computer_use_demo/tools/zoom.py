@@ -0,0 +1,59 @@
+from typing import ClassVar, Literal
+
+from anthropic.types.beta import BetaToolParam
+
+from ..logs import get_logger
+from .base import BaseAnthropicTool, ToolResult
+from .computer import ComputerTool
+
+logger = get_logger(__name__)
+
+
+class ZoomTool(BaseAnthropicTool):
+    """
+    A companion to the computer tool that captures one region of the screen at full
+    resolution, so small text can be read without taking more full screenshots.
+    """
+
+    name: ClassVar[Literal["zoom"]] = "zoom"
+
+    def __init__(self, computer: ComputerTool):
+        self.computer = computer
+        super().__init__()
+
+    async def __call__(
+        self, *, region: list[int], width: int | None = None, **kwargs
+    ) -> ToolResult:
+        logger.info("Zooming into region", region=region, width=width)
+        return await self.computer.screenshot_region(region, width)
+
+    def to_params(self) -> BetaToolParam:
+        return {
+            "name": self.name,
+            "description": (
+                "Capture a rectangle of the screen at native resolution, to read small "
+                "text or inspect details that are unclear in a screenshot. The region "
+                "uses the same coordinates as the computer tool's screenshots."
+            ),
+            "input_schema": {
+                "type": "object",
+                "properties": {
+                    "region": {
+                        "type": "array",
+                        "items": {"type": "integer", "minimum": 0},
+                        "minItems": 4,
+                        "maxItems": 4,
+                        "description": "[x0, y0, x1, y1]: top-left and bottom-right corners.",
+                    },
+                    "width": {
+                        "type": "integer",
+                        "minimum": 1,
+                        "description": (
+                            "Width of the returned image in pixels. Defaults to the "
+                            "native width of the region."
+                        ),
+                    },
+                },
+                "required": ["region"],
+            },
+        }
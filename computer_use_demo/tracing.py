@@ -0,0 +1,232 @@
+"""
+Nested per-phase timings for the agent loop.
+
+Spans are recorded only when tracing is enabled, by setting `COMPUTER_USE_TRACE_DIR` or
+calling `tracer.configure`. Finished spans are appended to `trace.jsonl` in that
+directory, and aggregated histograms are written to `metrics.prom` in the Prometheus
+text exposition format. The files are written by a background thread, after every
+top-level span, or every `FLUSH_INTERVAL`, so ending a span never waits on the disk.
+When tracing is disabled, `tracer.span` returns a shared no-op
+span, so instrumentation can stay in the hot paths.
+"""
+
+import atexit
+import itertools
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any
+
+TRACE_DIR_ENV = "COMPUTER_USE_TRACE_DIR"
+TRACE_FILE = "trace.jsonl"
+METRICS_FILE = "metrics.prom"
+
+# upper bounds, in seconds, of the histogram buckets exported to Prometheus
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+FLUSH_EVERY = 256  # finished spans buffered before they are written out
+FLUSH_INTERVAL = 1.0  # seconds; the longest buffered spans wait for the writer
+
+_current_span: ContextVar["Span | None"] = ContextVar("current_span", default=None)
+_span_ids = itertools.count(1)
+
+
+class Span:
+    """A timed phase; use as a context manager, in sync or async code."""
+
+    __slots__ = ("tracer", "name", "attrs", "id", "parent_id", "start", "duration", "_token")
+
+    def __init__(self, tracer: "Tracer", name: str, attrs: dict[str, Any]):
+        self.tracer = tracer
+        self.name = name
+        self.attrs = attrs
+        self.id = 0
+        self.parent_id: int | None = None
+        self.start = 0.0
+        self.duration = 0.0
+
+    def set(self, **attrs):
+        """Attach attributes, e.g. payload sizes, to the span."""
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        parent = _current_span.get()
+        self.parent_id = parent.id if parent else None
+        self.id = next(_span_ids)
+        self._token = _current_span.set(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.duration = time.perf_counter() - self.start
+        _current_span.reset(self._token)
+        if exc_type is not None:
+            self.attrs["error"] = exc_type.__name__
+        self.tracer._finish(self)
+        return False
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def set(self, **attrs):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class _Stats:
+    __slots__ = ("count", "total", "buckets", "bytes")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.buckets = [0] * len(BUCKETS)
+        self.bytes = 0
+
+
+class Tracer:
+    """Collects spans and exports them to a local trace directory."""
+
+    def __init__(self, trace_dir: str | os.PathLike | None = None):
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()  # one flush writes the files at a time
+        self._wake = threading.Event()
+        self._writer: threading.Thread | None = None
+        self._buffer: list[dict[str, Any]] = []
+        self._stats: dict[str, _Stats] = {}
+        self.trace_dir: Path | None = None
+        self.configure(trace_dir)
+
+    @property
+    def enabled(self) -> bool:
+        return self.trace_dir is not None
+
+    def configure(self, trace_dir: str | os.PathLike | None):
+        """Enable tracing into `trace_dir`, or disable it with None."""
+        self.flush()
+        # after a write in progress, so none goes to a directory being switched away from
+        with self._write_lock:
+            self.trace_dir = Path(trace_dir) if trace_dir else None
+        if self.trace_dir:
+            self.trace_dir.mkdir(parents=True, exist_ok=True)
+
+    def span(self, name: str, **attrs) -> Span | _NoopSpan:
+        if self.trace_dir is None:
+            return _NOOP_SPAN
+        return Span(self, name, attrs)
+
+    def stats(self) -> dict[str, dict[str, float]]:
+        """Return count, total seconds and payload bytes per span name."""
+        with self._lock:
+            return {
+                name: {"count": s.count, "seconds": s.total, "bytes": s.bytes}
+                for name, s in self._stats.items()
+            }
+
+    def flush(self):
+        """Write buffered spans and the current metrics to the trace directory now."""
+        with self._write_lock:
+            with self._lock:
+                buffer, self._buffer = self._buffer, []
+                trace_dir = self.trace_dir
+                if trace_dir is None:
+                    return
+                metrics = self._render_metrics()
+            if buffer:
+                with open(trace_dir / TRACE_FILE, "a", encoding="utf-8") as f:
+                    f.writelines(
+                        json.dumps(record, separators=(",", ":"), default=str) + "\n"
+                        for record in buffer
+                    )
+            tmp_path = trace_dir / (METRICS_FILE + ".tmp")
+            tmp_path.write_text(metrics)
+            os.replace(tmp_path, trace_dir / METRICS_FILE)
+
+    def _finish(self, span: Span):
+        record = {
+            "name": span.name,
+            "id": span.id,
+            "parent": span.parent_id,
+            "ts": round(time.time() - span.duration, 6),
+            "ms": round(span.duration * 1000, 3),
+            **span.attrs,
+        }
+        with self._lock:
+            stats = self._stats.get(span.name)
+            if stats is None:
+                stats = self._stats[span.name] = _Stats()
+            stats.count += 1
+            stats.total += span.duration
+            index = bisect_left(BUCKETS, span.duration)
+            if index < len(BUCKETS):
+                stats.buckets[index] += 1
+            if isinstance(span.attrs.get("bytes"), int):
+                stats.bytes += span.attrs["bytes"]
+            self._buffer.append(record)
+            if self._writer is None:
+                self._writer = threading.Thread(
+                    target=self._write_periodically, name="trace-writer", daemon=True
+                )
+                self._writer.start()
+        if len(self._buffer) >= FLUSH_EVERY or span.parent_id is None:
+            self._wake.set()
+
+    def _write_periodically(self):
+        while True:
+            self._wake.wait(FLUSH_INTERVAL)
+            self._wake.clear()
+            try:
+                self.flush()
+            except OSError:
+                pass  # e.g. the trace directory was removed; later flushes may work
+
+    def _render_metrics(self) -> str:
+        lines = [
+            "# HELP computer_use_span_seconds Time spent in each traced phase.",
+            "# TYPE computer_use_span_seconds histogram",
+        ]
+        for name, stats in sorted(self._stats.items()):
+            cumulative = 0
+            for bound, count in zip(BUCKETS, stats.buckets):
+                cumulative += count
+                lines.append(
+                    f'computer_use_span_seconds_bucket{{span="{name}",le="{bound}"}} {cumulative}'
+                )
+            lines.append(
+                f'computer_use_span_seconds_bucket{{span="{name}",le="+Inf"}} {stats.count}'
+            )
+            lines.append(f'computer_use_span_seconds_sum{{span="{name}"}} {stats.total}')
+            lines.append(f'computer_use_span_seconds_count{{span="{name}"}} {stats.count}')
+        lines += [
+            "# HELP computer_use_span_bytes_total Payload bytes handled in each traced phase.",
+            "# TYPE computer_use_span_bytes_total counter",
+        ]
+        for name, stats in sorted(self._stats.items()):
+            if stats.bytes:
+                lines.append(f'computer_use_span_bytes_total{{span="{name}"}} {stats.bytes}')
+        return "\n".join(lines) + "\n"
+
+
+tracer = Tracer(os.getenv(TRACE_DIR_ENV))
+
+
+def _flush_at_exit():
+    # the writer thread is a daemon; write what it hasn't yet
+    try:
+        tracer.flush()
+    except OSError:
+        pass  # e.g. a temporary trace directory already removed
+
+
+atexit.register(_flush_at_exit)
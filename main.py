@@ -1,28 +1,79 @@
 import asyncio
 import os
+import queue
 import sys
-import json
 import base64
+import threading
 import tkinter as tk
-from tkinter import scrolledtext, Menu, font, Frame
+from tkinter import scrolledtext, Menu, Frame
 import tkinter.messagebox
-import traceback
-import markdown
-from bs4 import BeautifulSoup
+from typing import TYPE_CHECKING
 
 
-from computer_use_demo.loop import sampling_loop, APIProvider
-from computer_use_demo.tools import ToolResult
-from anthropic.types.beta import BetaMessage, BetaMessageParam
-from anthropic import APIResponse
+from computer_use_demo.chat_log import ChatLog
+from computer_use_demo.executors import run_blocking
+from computer_use_demo.journal import SessionJournal
+from computer_use_demo.logs import configure_logging, get_logger
+from computer_use_demo.markdown_render import render_markdown
 from dotenv import load_dotenv
 
+# The agent modules (the anthropic SDK, PIL, the tools) take over a second to import, so
+# they are loaded on the agent thread while the window comes up; see AgentRuntime.
+if TYPE_CHECKING:
+    from computer_use_demo.tools import ToolResult
+
 # Load environment variables from .env file
 load_dotenv()
 
+logger = get_logger("computer_use_demo.main")
+
+UI_POLL_MS = 50  # how often the Tk side drains pending UI updates
+
+
+class AgentThread:
+    """A background thread running the asyncio loop that owns sampling_loop."""
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="agent-loop", daemon=True)
+        self.thread.start()
+
+    def submit(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(timeout=5)
+
+
+class AgentRuntime:
+    """The parts of the agent that are slow to import or start, loaded on the agent thread."""
+
+    def __init__(self):
+        from computer_use_demo import events, loop
+        from computer_use_demo.images import ImageRetention
+
+        self.loop = loop
+        self.events = events
+        # Older screenshots are kept at lower resolution rather than dropped
+        self.image_retention = ImageRetention()
+        # The tools live as long as the window, so the shell keeps its cwd and env and the
+        # editor its undo history from one message to the next
+        self.tool_collection = loop.create_tool_collection()
+
+    @classmethod
+    async def start(cls):
+        runtime = cls()
+        await runtime.tool_collection.start()
+        return runtime
+
+    async def shutdown(self):
+        await self.tool_collection.shutdown()
+        self.image_retention.close()
+
 
 class ChatInterface:
-    def __init__(self, root):
+    def __init__(self, root, resume_path=None):
         self.root = root
         self.root.title("Mac AI")
         self.root.geometry("400x300")  # Kept the reduced window size
@@ -61,6 +112,11 @@ class ChatInterface:
         self.chat_area.tag_configure("bold", font=("SF Pro", 12, "bold"))
         self.chat_area.tag_configure("italic", font=("SF Pro", 12, "italic"))
         self.chat_area.tag_configure("code", font=("Courier", 10, "normal"), background="#e0e0e0")
+        self.chat_area.tag_config("You", foreground="#808080")
+        self.chat_area.tag_config("Assistant", foreground="#000000")
+        self.chat_area.tag_config("Tool", foreground="#808080")
+        self.chat_area.tag_config("System", foreground="#808080")
+        self.chat_area.tag_config("Error", foreground="#ff0000")
 
         # Create entry field and send button
         entry_frame = Frame(main_frame, bg="#f0f0f0")
@@ -78,48 +134,61 @@ class ChatInterface:
         send_button = tk.Button(entry_frame, text="Send", command=self.send_message, font=("SF Pro", 12, "bold"), fg="#fafafa", background="#1a1a1a", activebackground="#1a1a1a", activeforeground="#fafafa", padx=6, pady=2, borderwidth=0, highlightthickness=0)
         send_button.grid(row=0, column=1, sticky="e")
 
-        self.messages = []
+        # The agent runs on its own thread; the UI is only touched from the Tk thread,
+        # which drains queued updates on a timer and renders them in one batch
+        self.agent = AgentThread()
+        self.ui_queue = queue.SimpleQueue()
+        self.running = False
+        self.pending_messages = []
+        self.root.after(UI_POLL_MS, self.drain_ui_queue)
+
+        # Every completed turn is journaled so a crashed session can be resumed
+        if resume_path:
+            self.journal, self.messages = SessionJournal.resume(resume_path, only_n_most_recent_images=10)
+            self.display_message(f"Resumed session {resume_path} with {len(self.messages)} messages.", sender="System")
+        else:
+            self.journal = SessionJournal.new()
+            self.messages = []
+
+        # Imported and started on the agent thread, which owns the bash session, while the
+        # window comes up; the first message waits for it if it isn't ready yet
+        self.runtime = self.agent.submit(AgentRuntime.start())
+        # Only the tail of the conversation stays in the widget; older text goes to a transcript
+        self.chat_log = ChatLog(self.chat_area, overflow_path=self.journal.path.with_suffix(".transcript.txt"))
 
     def display_message(self, message, sender="You"):
-        self.chat_area.config(state='normal')
-        self.chat_area.insert(tk.END, f"{sender}:\n", sender)
-        
-        if sender == "Assistant":
-            # Convert markdown to HTML
-            html = markdown.markdown(message)
-            
-            # Parse HTML and apply styling
-            soup = BeautifulSoup(html, 'html.parser')
-            self.insert_formatted_text(soup)
-        else:
-            self.chat_area.insert(tk.END, f"{message}\n")
-        
-        self.chat_area.insert(tk.END, "\n\n")  # Add extra newlines for spacing
-        self.chat_area.tag_config("You", foreground="#808080")
-        self.chat_area.tag_config("Assistant", foreground="#000000")
-        self.chat_area.tag_config("Tool", foreground="#808080")
-        self.chat_area.tag_config("System", foreground="#808080")
-        self.chat_area.tag_config("Error", foreground="#ff0000")
-        self.chat_area.config(state='disabled')
-        self.chat_area.yview(tk.END)
-
-    def insert_formatted_text(self, element):
-        if element.name == 'p':
-            self.chat_area.insert(tk.END, element.get_text() + "\n")
-        elif element.name == 'strong':
-            self.chat_area.insert(tk.END, element.get_text(), "bold")
-        elif element.name == 'em':
-            self.chat_area.insert(tk.END, element.get_text(), "italic")
-        elif element.name == 'code':
-            self.chat_area.insert(tk.END, element.get_text(), "code")
-        elif element.name == 'pre':
-            self.chat_area.insert(tk.END, element.get_text() + "\n", "code")
-        else:
-            for child in element.children:
-                if isinstance(child, str):
-                    self.chat_area.insert(tk.END, child)
-                else:
-                    self.insert_formatted_text(child)
+        """Queue a message for display; safe to call from any thread."""
+        self.ui_queue.put(("message", message, sender))
+
+    def drain_ui_queue(self):
+        """Render every queued update in a single batch, then reschedule."""
+        messages = []
+        finished = False
+        while True:
+            try:
+                kind, *payload = self.ui_queue.get_nowait()
+            except queue.Empty:
+                break
+            if kind == "message":
+                messages.append(payload)
+            elif kind == "finished":
+                finished = True
+        if messages:
+            self.render_messages(messages)
+        if finished:
+            self.on_run_finished()
+        self.root.after(UI_POLL_MS, self.drain_ui_queue)
+
+    def render_messages(self, messages):
+        segments = []
+        for message, sender in messages:
+            segments.append((f"{sender}:\n", (sender,)))
+            if sender == "Assistant":
+                segments.extend(render_markdown(message))
+            else:
+                segments.append((f"{message}\n", ()))
+            segments.append(("\n\n", ()))  # Add extra newlines for spacing
+        self.chat_log.append(segments)
 
     def on_entry_click(self, event):
         """Function that gets called whenever entry is clicked"""
@@ -138,108 +207,127 @@ class ChatInterface:
         message = self.entry_field.get()
         if message and message != 'Enter text here':
             self.display_message(message)
-            self.messages.append({"role": "user", "content": message})
             self.entry_field.delete(0, tk.END)
-            self.root.after(0, self.process_message)
+            if self.running:
+                # self.messages belongs to the agent thread until the run finishes
+                self.pending_messages.append(message)
+                return
+            self.append_user_message(message)
+            self.process_message()
+
+    def append_user_message(self, message):
+        """Add a user message, merging it into a trailing user turn left by a failed run."""
+        if self.messages and self.messages[-1]["role"] == "user":
+            last = self.messages[-1]
+            if isinstance(last["content"], str):
+                last["content"] = [{"type": "text", "text": last["content"]}]
+            last["content"].append({"type": "text", "text": message})
+        else:
+            self.messages.append({"role": "user", "content": message})
 
     def process_message(self):
-        asyncio.run(self.run_sampling_loop())
-
-    async def run_sampling_loop(self):
-        max_retries = 3
-        retry_count = 0
-        while retry_count < max_retries:
-            try:
-                api_key = os.getenv("ANTHROPIC_API_KEY")
-                if api_key == "YOUR_API_KEY_HERE":
-                    raise ValueError("Please set your API key in the ANTHROPIC_API_KEY environment variable")
-                
-                # Debug print statement to check if the API key is being loaded correctly
-                print(f"Debug: API key loaded: {api_key[:5]}...{api_key[-5:]}")
-
-                provider = APIProvider.ANTHROPIC
-
-                def output_callback(content_block):
-                    if isinstance(content_block, dict) and content_block.get("type") == "text":
-                        self.display_message(content_block.get("text"), sender="Assistant")
-
-                def tool_output_callback(result: ToolResult, tool_use_id: str):
-                    if result.output:
-                        self.display_message(f"> Tool Output [{tool_use_id}]: {result.output}", sender="Tool")
-                    if result.error:
-                        self.display_message(f"!!! Tool Error [{tool_use_id}]: {result.error}", sender="Tool")
-                    if result.base64_image:
-                        os.makedirs("screenshots", exist_ok=True)
-                        image_data = result.base64_image
-                        with open(f"screenshots/screenshot_{tool_use_id}.png", "wb") as f:
-                            f.write(base64.b64decode(image_data))
-                        self.display_message(f"Took screenshot screenshot_{tool_use_id}.png", sender="Tool")
-
-                def api_response_callback(response: APIResponse[BetaMessage]):
-                    content = json.loads(response.text)["content"]
-                    filtered_content = self.filter_api_response(content)
-                    self.display_message(filtered_content, sender="Assistant")
-
-                self.display_message("Processing your request...", sender="System")
-                new_messages = await sampling_loop(
-                    model="claude-3-5-sonnet-20241022",
-                    provider=provider,
-                    system_prompt_suffix="",
-                    messages=self.messages,
-                    output_callback=output_callback,
-                    tool_output_callback=tool_output_callback,
-                    api_response_callback=api_response_callback,
-                    api_key=api_key,
-                    only_n_most_recent_images=10,
-                    max_tokens=4096,
-                )
-                
-                # Update self.messages with the new messages
-                self.messages = new_messages
-                
-                self.display_message("Request processed successfully.", sender="System")
-                break  # Exit the loop if successful
-            except Exception as e:
-                retry_count += 1
-                error_message = f"Encountered Error (Attempt {retry_count}/{max_retries}):\n{str(e)}"
-                self.display_message(error_message, sender="Error")
-                print(error_message)
-                print(f"Error type: {type(e)}")
-                print(f"Error traceback: {traceback.format_exc()}")
-                
-                if retry_count < max_retries:
-                    self.display_message(f"Retrying in 5 seconds...", sender="System")
-                    await asyncio.sleep(5)
-                else:
-                    self.display_message("Max retries reached. Please try again later.", sender="System")
-                    # Reset messages to the last known good state
-                    self.messages = self.messages[:-1]  # Remove the last user message that caused the error
-        
-        # If we've exhausted all retries, clear the entry field
+        self.running = True
+        self.agent.submit(self.run_sampling_loop())
+
+    def on_run_finished(self):
+        self.running = False
+        if self.pending_messages:
+            for message in self.pending_messages:
+                self.append_user_message(message)
+            self.pending_messages = []
+            self.process_message()
+            return
         self.entry_field.delete(0, tk.END)
         self.entry_field.insert(0, "Enter text here")
         self.entry_field.config(fg='grey')
 
-    def filter_api_response(self, content):
-        filtered_content = []
-        for item in content:
-            if item['type'] == 'text':
-                filtered_content.append(item['text'])
-        return "\n".join(filtered_content)
+    async def run_sampling_loop(self):
+        try:
+            api_key = os.getenv("ANTHROPIC_API_KEY")
+            if api_key == "YOUR_API_KEY_HERE":
+                raise ValueError("Please set your API key in the ANTHROPIC_API_KEY environment variable")
+            
+            # to check that the API key is being loaded correctly
+            logger.debug("API key loaded", key=f"{api_key[:5]}...{api_key[-5:]}")
+
+            runtime = await asyncio.wrap_future(self.runtime)
+            provider = runtime.loop.APIProvider.ANTHROPIC
+
+            self.display_message("Processing your request...", sender="System")
+            # Transient API errors are retried per call inside the loop, which
+            # extends self.messages in place one completed turn at a time
+            async for event in runtime.loop.stream_sampling_loop(
+                model="claude-3-5-sonnet-20241022",
+                provider=provider,
+                system_prompt_suffix="",
+                messages=self.messages,
+                api_key=api_key,
+                only_n_most_recent_images=10,
+                max_tokens=4096,
+                journal=self.journal,
+                # screenshots live in the journal's blob store; the history holds handles
+                blob_store=self.journal.blob_store,
+                image_retention=runtime.image_retention,
+                tool_collection=runtime.tool_collection,
+            ):
+                if isinstance(event, runtime.events.TextEvent):
+                    self.display_message(event.text, sender="Assistant")
+                elif isinstance(event, runtime.events.ToolResultEvent):
+                    await self.display_tool_result(event.result, event.tool_use_id)
+            
+            self.display_message("Request processed successfully.", sender="System")
+        except Exception as e:
+            error_message = f"Encountered Error:\n{str(e)}"
+            self.display_message(error_message, sender="Error")
+            logger.exception("Request failed")
+            # Completed steps are kept, so the next message resumes where this one stopped
+            self.display_message("Send a message to continue from the last completed step.", sender="System")
+        
+        self.ui_queue.put(("finished",))
+
+    async def display_tool_result(self, result: "ToolResult", tool_use_id: str):
+        if result.output:
+            self.display_message(f"> Tool Output [{tool_use_id}]: {result.output}", sender="Tool")
+        if result.error:
+            self.display_message(f"!!! Tool Error [{tool_use_id}]: {result.error}", sender="Tool")
+        if result.base64_image:
+            # runs on the agent thread's event loop; keep the decode and write off it
+            await run_blocking("io", save_screenshot, result.base64_image, tool_use_id)
+            self.display_message(f"Took screenshot screenshot_{tool_use_id}.png", sender="Tool")
 
     def show_about(self):
         tk.messagebox.showinfo("About", "Claude Computer Use Chat\nVersion 1.0")
 
 
+def save_screenshot(image_data: str, tool_use_id: str):
+    os.makedirs("screenshots", exist_ok=True)
+    with open(f"screenshots/screenshot_{tool_use_id}.png", "wb") as f:
+        f.write(base64.b64decode(image_data))
+
+
 def main():
+    args = sys.argv[1:]
+    resume_path = None
+    if len(args) >= 2 and args[0] == "--resume":
+        resume_path, args = args[1], args[2:]
+
+    configure_logging()
     root = tk.Tk()
-    chat_interface = ChatInterface(root)
+    chat_interface = ChatInterface(root, resume_path=resume_path)
     
-    if len(sys.argv) > 1:
-        initial_message = ' '.join(sys.argv[1:])
+    if args:
+        initial_message = ' '.join(args)
         root.after(100, lambda: chat_interface.send_message(initial_message))
     
     root.mainloop()
+    try:
+        runtime = chat_interface.runtime.result(timeout=5)
+    except Exception:
+        runtime = None  # failed to start, so there is nothing to shut down
+    if runtime is not None:
+        chat_interface.agent.submit(runtime.shutdown()).result(timeout=5)
+    chat_interface.agent.stop()
+    chat_interface.journal.close()
 
 
 if __name__ == "__main__":
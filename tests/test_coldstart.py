@@ -0,0 +1,58 @@
+"""
+Startup regression checks for `main.py`: the heavy modules stay off the path to the
+first window, as `computer_use_demo.bench.coldstart` measures in more detail.
+"""
+
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+
+# imported on first use (the first turn, tool or rendered message), never by `import main`
+DEFERRED = [
+    "pyautogui",
+    "markdown",
+    "bs4",
+    "PIL",
+    "anthropic",
+    "httpx",
+    "boto3",
+    "botocore",
+    "google.auth",
+    "computer_use_demo.loop",
+    "computer_use_demo.tools",
+]
+IMPORT_BUDGET_MS = 500  # about 110 ms on a developer machine
+
+SCRIPT = """
+import json, sys, time
+started = time.perf_counter()
+import main
+elapsed = (time.perf_counter() - started) * 1000
+print(json.dumps({"ms": elapsed, "modules": sorted(sys.modules)}))
+"""
+
+
+def _import_main() -> dict:
+    # a fresh interpreter, so nothing imported by pytest or other tests counts
+    result = subprocess.run(
+        [sys.executable, "-c", SCRIPT],
+        cwd=REPO_ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def test_import_main_defers_heavy_modules():
+    modules = set(_import_main()["modules"])
+    loaded = [name for name in DEFERRED if name in modules]
+    assert not loaded, f"`import main` loads {loaded}"
+
+
+def test_import_main_within_budget():
+    elapsed = min(_import_main()["ms"] for _ in range(3))
+    assert elapsed < IMPORT_BUDGET_MS, f"`import main` took {elapsed:.0f} ms"